@@ -2,10 +2,12 @@
 """
 Aplicación principal del agente de análisis de ventas.
 Ahora usa un agente inteligente con Amazon Bedrock + Strands.
+
+El prompt aparece sin esperar a Strands/boto3/pandas: el agente (y la BD) se
+preparan en segundo plano mientras se escribe la primera pregunta.
 """
 
 import os
-from agent.bedrock_agent import create_agent
 
 # Mantener compatibilidad con versión anterior (basada en reglas)
 LEGACY_MODE = os.getenv("LEGACY_MODE", "false").lower() == "true"
@@ -24,6 +26,19 @@ if LEGACY_MODE:
             print("❌ Consulta no permitida.")
             return
 
+        if mode in ("csv.gz","parquet","arrow"):
+            # Se escriben por bloques directo desde la BD: sin cargar el DataFrame antes
+            from pathlib import Path
+            from agent.export import export_query, format_stats
+            stats = export_query(sql, mode, params=params)
+            if not stats["rows"]:
+                Path(stats["path"]).unlink(missing_ok=True)
+                print("⚠️  Nada que exportar.")
+                return
+            print(f"📎 Archivo generado: {stats['path']}")
+            print(format_stats(stats))
+            return
+
         df = query(sql, params)
 
         if mode == "text":
@@ -66,14 +81,27 @@ if LEGACY_MODE:
         render_table(df)
 else:
     # Nueva versión: agente inteligente con Bedrock
+    _agent_future = None
+
+    def prewarm():
+        """Empieza a crear el agente en segundo plano (idempotente; reintenta si falló)."""
+        global _agent_future
+        if _agent_future is None or (_agent_future.done() and _agent_future.exception() is not None):
+            from agent.bedrock_agent import warm_agent
+            _agent_future = warm_agent()
+        return _agent_future
+
+    def _get_agent():
+        """Un solo agente por sesión: modelo, tools y conversación se reutilizan."""
+        return prewarm().result()
+
     def answer(q: str):
         """
         Procesa una pregunta usando el agente inteligente.
         El LLM decide qué herramientas usar.
         """
         try:
-            # Crear instancia del agente (singleton podría optimizarse)
-            agent = create_agent()
+            agent = _get_agent()
             
             # Procesar pregunta
             response = agent.ask_sync(q)
@@ -101,6 +129,8 @@ def main():
         print("🤖 AGENTE INTELIGENTE DE ANÁLISIS DE VENTAS")
         print("   Powered by Amazon Bedrock + Strands")
     print("="*80)
+    if not LEGACY_MODE:
+        prewarm()
     print("\n💡 Ejemplos de preguntas:")
     print("   - ¿Cuáles son los 5 productos más vendidos en Medellín?")
     print("   - ¿Quién fue el vendedor con más ventas en Bogotá?")
@@ -122,6 +152,18 @@ def main():
             
     except (EOFError, KeyboardInterrupt):
         print("\n\n👋 ¡Hasta luego!\n")
+    
+    if not LEGACY_MODE:
+        print_router_summary()
+
+
+def print_router_summary():
+    """Reparto de preguntas entre reglas locales y modelo en esta sesión."""
+    from agent.router import STATS
+    s = STATS.snapshot()
+    if s["local"] + s["escalated"]:
+        print(f"📈 Router: {s['local']} locales / {s['escalated']} al modelo "
+              f"({100 * s['local_ratio']:.0f}% local), ahorro estimado ≈ {s['saved_s']:.1f}s\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,242 @@
+# agent/artifacts.py
+"""
+Almacén de artefactos (gráficos y exportaciones) direccionado por contenido.
+
+Cada artefacto vive en data/artifacts/<id>.<ext>, donde el id es un hash de lo
+que lo produce: tipo, SQL (o contenido del DataFrame), versión de los datos y
+opciones (tipo de gráfico, formato, título...). Pedir lo mismo otra vez
+devuelve el archivo existente sin consultar ni renderizar; cuando una ingesta
+cambia los datos cambia la versión y con ella el id.
+
+El índice (SQLite) guarda tamaño, último uso y metadatos; gc() borra lo que no
+se usa hace más de ARTIFACT_MAX_AGE_S y, si el total pasa ARTIFACT_MAX_BYTES,
+los menos usados recientemente.
+
+Las tools anotan cada artefacto en el manifiesto de la pregunta en curso
+(collect()/record()); SalesAnalysisAgent lo expone como last_artifacts, así
+Streamlit no necesita buscar archivos recientes en data/.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+ARTIFACT_DIR = Path(os.getenv("ARTIFACT_DIR", "data/artifacts"))
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(512 * 1024 * 1024)))
+ARTIFACT_MAX_AGE_S = float(os.getenv("ARTIFACT_MAX_AGE_S", str(7 * 24 * 3600)))
+# Archivos a medio escribir de un proceso que murió
+_STAGING_MAX_AGE_S = 3600
+
+MIME = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+    "webp": "image/webp",
+    "csv": "text/csv",
+    "csv.gz": "application/gzip",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+
+class Artifact(NamedTuple):
+    id: str
+    kind: str  # "chart" | "export"
+    path: str
+    ext: str
+    bytes: int
+    meta: Dict[str, Any]
+    hit: bool = False  # True si se reutilizó sin volver a generarlo
+
+    @property
+    def mime(self) -> str:
+        return MIME.get(self.ext, "application/octet-stream")
+
+    @property
+    def name(self) -> str:
+        """Nombre sugerido para descargar."""
+        return f"{'grafico' if self.kind == 'chart' else 'salida'}_{self.id[:12]}.{self.ext}"
+
+
+# ---------------- Manifiesto de la pregunta en curso ----------------
+_MANIFEST: ContextVar[Optional[List[Artifact]]] = ContextVar("artifact_manifest", default=None)
+
+
+@contextmanager
+def collect() -> Iterator[List[Artifact]]:
+    """Junta los artefactos que registren las tools dentro del bloque (incluye sus tareas hijas)."""
+    items: List[Artifact] = []
+    token = _MANIFEST.set(items)
+    try:
+        yield items
+    finally:
+        _MANIFEST.reset(token)
+
+
+def record(artifact: Artifact) -> None:
+    items = _MANIFEST.get()
+    if items is not None and all(a.id != artifact.id for a in items):
+        items.append(artifact)
+
+
+# ---------------- Almacén ----------------
+class ArtifactStore:
+    """Archivos en `root` + índice SQLite. Seguro para varios hilos y procesos."""
+
+    def __init__(self, root: Path = ARTIFACT_DIR, max_bytes: int = ARTIFACT_MAX_BYTES,
+                 max_age_s: float = ARTIFACT_MAX_AGE_S):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        self.root.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.root / "index.sqlite", isolation_level=None, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS artefactos ("
+            "id TEXT PRIMARY KEY, kind TEXT, ext TEXT, bytes INTEGER, meta TEXT, "
+            "created_at REAL, last_used_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_artefactos_uso ON artefactos(last_used_at)")
+        return conn
+
+    @staticmethod
+    def key(kind: str, source: str, version: str, options: Dict[str, Any]) -> str:
+        payload = json.dumps([kind, source, version, options], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+    def path(self, artifact_id: str, ext: str) -> Path:
+        return self.root / f"{artifact_id}.{ext}"
+
+    def staging_path(self, artifact_id: str, ext: str) -> Path:
+        """Ruta temporal única; commit() la mueve a su lugar de forma atómica."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        return self.root / f".tmp-{uuid.uuid4().hex[:8]}-{artifact_id}.{ext}"
+
+    def get(self, artifact_id: str) -> Optional[Artifact]:
+        """Artefacto guardado (y marca su uso), o None si no existe."""
+        with self._lock, closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT kind, ext, bytes, meta FROM artefactos WHERE id = ?", (artifact_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            kind, ext, size, meta = row
+            path = self.path(artifact_id, ext)
+            if not path.exists():  # borrado a mano
+                conn.execute("DELETE FROM artefactos WHERE id = ?", (artifact_id,))
+                return None
+            conn.execute("UPDATE artefactos SET last_used_at = ? WHERE id = ?", (time.time(), artifact_id))
+        return Artifact(artifact_id, kind, str(path), ext, size, json.loads(meta), hit=True)
+
+    def commit(self, artifact_id: str, kind: str, staging: Path, ext: str,
+               meta: Optional[Dict[str, Any]] = None) -> Artifact:
+        """Publica el archivo temporal como artefacto y ejecuta la recolección."""
+        path = self.path(artifact_id, ext)
+        os.replace(staging, path)
+        size = path.stat().st_size
+        meta = meta or {}
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO artefactos(id, kind, ext, bytes, meta, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (artifact_id, kind, ext, size, json.dumps(meta, ensure_ascii=False, default=str), now, now),
+            )
+            self._gc(conn, keep=artifact_id)
+        return Artifact(artifact_id, kind, str(path), ext, size, meta)
+
+    def get_or_create(self, kind: str, source: str, version: str, options: Dict[str, Any], ext: str,
+                      build: Callable[[Path], Optional[Dict[str, Any]]]) -> Artifact:
+        """
+        Devuelve el artefacto de (kind, source, version, options) o lo genera.
+
+        Args:
+            kind: "chart" o "export"
+            source: SQL (o hash del contenido) del que sale el artefacto
+            version: Versión de los datos (db.data_version())
+            options: Opciones que cambian el resultado (tipo, formato, título...)
+            ext: Extensión del archivo
+            build: Escribe el archivo en la ruta recibida; puede devolver metadatos
+
+        Returns:
+            Artifact (hit=True si ya existía); queda anotado en el manifiesto
+        """
+        artifact_id = self.key(kind, source, version, options)
+        artifact = self.get(artifact_id)
+        if artifact is None:
+            staging = self.staging_path(artifact_id, ext)
+            try:
+                artifact = self.commit(artifact_id, kind, staging, ext, build(staging))
+            finally:
+                staging.unlink(missing_ok=True)
+        record(artifact)
+        return artifact
+
+    async def get_or_create_async(self, kind: str, source: str, version: str, options: Dict[str, Any], ext: str,
+                                  build: Callable[[Path], Awaitable[Optional[Dict[str, Any]]]]) -> Artifact:
+        """Como get_or_create(), con `build` asíncrono y el índice fuera del event loop."""
+        from agent.executor import run_io
+
+        artifact_id = self.key(kind, source, version, options)
+        artifact = await run_io(self.get, artifact_id)
+        if artifact is None:
+            staging = self.staging_path(artifact_id, ext)
+            try:
+                meta = await build(staging)
+                artifact = await run_io(self.commit, artifact_id, kind, staging, ext, meta)
+            finally:
+                staging.unlink(missing_ok=True)
+        record(artifact)
+        return artifact
+
+    def _gc(self, conn: sqlite3.Connection, keep: Optional[str] = None) -> int:
+        now = time.time()
+        doomed = [r for r in conn.execute(
+            "SELECT id, ext, bytes FROM artefactos WHERE last_used_at < ? AND id IS NOT ?",
+            (now - self.max_age_s, keep),
+        )] if self.max_age_s else []
+        total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM artefactos").fetchone()[0]
+        total -= sum(r[2] for r in doomed)
+        if total > self.max_bytes:
+            gone = {r[0] for r in doomed}
+            for row in conn.execute("SELECT id, ext, bytes FROM artefactos WHERE id IS NOT ? ORDER BY last_used_at",
+                                    (keep,)).fetchall():
+                if total <= self.max_bytes:
+                    break
+                if row[0] not in gone:
+                    doomed.append(row)
+                    total -= row[2]
+        for artifact_id, ext, _ in doomed:
+            self.path(artifact_id, ext).unlink(missing_ok=True)
+        conn.executemany("DELETE FROM artefactos WHERE id = ?", [(r[0],) for r in doomed])
+        for tmp in self.root.glob(".tmp-*"):
+            try:
+                if now - tmp.stat().st_mtime > _STAGING_MAX_AGE_S:
+                    tmp.unlink()
+            except FileNotFoundError:
+                pass
+        return len(doomed)
+
+    def gc(self) -> int:
+        """Borra artefactos viejos o sobrantes; devuelve cuántos."""
+        with self._lock, closing(self._connect()) as conn:
+            return self._gc(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock, closing(self._connect()) as conn:
+            n, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM artefactos").fetchone()
+        return {"artifacts": n, "bytes": size, "max_bytes": self.max_bytes}
+
+
+ARTIFACTS = ArtifactStore()
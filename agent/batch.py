@@ -0,0 +1,217 @@
+# agent/batch.py
+"""
+Respuestas en lote: lee preguntas de un archivo (o stdin), las responde con
+concurrencia acotada reutilizando agentes ya creados y escribe una línea JSONL
+por pregunta con la respuesta, las tools usadas, los archivos generados y la
+latencia.
+
+    python -m agent.batch preguntas.txt -o respuestas.jsonl -c 4
+    python -m agent.batch preguntas.txt --por-sede      # "{sede}" → cada sede
+    cat preguntas.txt | python -m agent.batch -
+
+Entrada: una pregunta por línea (las líneas vacías y las que empiezan con '#'
+se ignoran) o JSONL con {"id": ..., "question": ...}.
+
+Cada pregunta se responde con la conversación vacía (son independientes). Un
+SalesAnalysisAgent atiende una pregunta a la vez, así que el pool tiene tantos
+agentes como el límite de concurrencia; se crean al primer uso y se reutilizan.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, TextIO
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+_SEDE_PLACEHOLDER = "{sede}"
+
+
+def read_questions(lines: Iterable[str]) -> List[Dict[str, Any]]:
+    """Preguntas de texto plano o JSONL → [{"id", "question"}]."""
+    out = []
+    for n, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("{"):
+            item = json.loads(line)
+            out.append({"id": item.get("id", n), "question": item["question"]})
+        else:
+            out.append({"id": n, "question": line})
+    return out
+
+
+def expand_sedes(items: List[Dict[str, Any]], sedes: List[str]) -> List[Dict[str, Any]]:
+    """Repite cada pregunta con "{sede}" una vez por sede; las demás quedan igual."""
+    out = []
+    for item in items:
+        if _SEDE_PLACEHOLDER not in item["question"]:
+            out.append(item)
+            continue
+        for sede in sedes:
+            out.append({
+                "id": f"{item['id']}:{sede}",
+                "question": item["question"].replace(_SEDE_PLACEHOLDER, sede),
+                "sede": sede,
+            })
+    return out
+
+
+def list_sedes() -> List[str]:
+    from agent.db import init_db, query
+    init_db()
+    return query("SELECT DISTINCT sede FROM ventas ORDER BY sede")["sede"].tolist()
+
+
+class AgentPool:
+    """Agentes reutilizables; se crean bajo demanda hasta `size`."""
+
+    def __init__(self, size: int, factory: Optional[Callable[[], Any]] = None):
+        if factory is None:
+            from agent.bedrock_agent import create_agent
+            factory = create_agent
+        self.size = max(1, size)
+        self._factory = factory
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._created = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            if self._idle.empty() and self._created < self.size:
+                self._created += 1
+                from agent.executor import run_io
+                try:
+                    return await run_io(self._factory)  # BedrockModel/boto3 tardan en crearse
+                except BaseException:
+                    self._created -= 1  # el cupo queda libre para el siguiente intento
+                    raise
+        return await self._idle.get()
+
+    def release(self, agent) -> None:
+        self._idle.put_nowait(agent)
+
+
+async def answer_one(pool: AgentPool, item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Responde una pregunta. Un fallo (al crear el agente o al responder) no
+    aborta el lote: queda en el registro con ok=False y el error.
+    """
+    t0 = time.perf_counter()
+    try:
+        agent = await pool.acquire()
+    except Exception as e:
+        return _failed(item, e, time.perf_counter() - t0)
+    try:
+        agent.reset_history()
+        t0 = time.perf_counter()
+        answer = await agent.ask(item["question"])
+        latency = time.perf_counter() - t0
+        calls = list(agent.last_tool_calls)
+        files = [a.path for a in agent.last_artifacts]
+    except Exception as e:
+        return _failed(item, e, time.perf_counter() - t0)
+    finally:
+        pool.release(agent)
+    record = {
+        **item,
+        "answer": answer,
+        "ok": not answer.lstrip().startswith("❌"),
+        "tools": [{"tool": c["tool"], "input": c["input"], "ok": c["ok"]} for c in calls],
+        "artifacts": files,
+        "latency_s": round(latency, 3),
+    }
+    return record
+
+
+def _failed(item: Dict[str, Any], error: Exception, latency: float) -> Dict[str, Any]:
+    return {
+        **item,
+        "answer": f"❌ Error: {error}",
+        "ok": False,
+        "error": f"{type(error).__name__}: {error}",
+        "tools": [],
+        "artifacts": [],
+        "latency_s": round(latency, 3),
+    }
+
+
+async def run_batch(
+    items: List[Dict[str, Any]],
+    out: TextIO,
+    concurrency: int = BATCH_CONCURRENCY,
+    pool: Optional[AgentPool] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Responde `items` con hasta `concurrency` preguntas a la vez y escribe cada
+    resultado en `out` (JSONL) apenas termina. Devuelve los resultados en el
+    orden de entrada.
+    """
+    pool = pool or AgentPool(concurrency)
+    limit = asyncio.Semaphore(max(1, concurrency))
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+
+    async def worker(i: int, item: Dict[str, Any]) -> None:
+        async with limit:
+            record = await answer_one(pool, item)
+        results[i] = record
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+
+    await asyncio.gather(*(worker(i, item) for i, item in enumerate(items)))
+    return results
+
+
+def _summary(results: List[Dict[str, Any]], wall_s: float) -> str:
+    lat = sorted(r["latency_s"] for r in results)
+    if not lat:
+        return "⚠️ No había preguntas."
+    p50 = lat[len(lat) // 2]
+    p95 = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+    failed = sum(not r["ok"] for r in results)
+    files = sum(len(r["artifacts"]) for r in results)
+    return (f"✅ {len(results)} preguntas en {wall_s:.1f}s ({failed} con error, {files} archivos) | "
+            f"latencia p50={p50:.2f}s p95={p95:.2f}s")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Responde un archivo de preguntas y escribe JSONL")
+    ap.add_argument("input", nargs="?", default="-", help="archivo de preguntas ('-' = stdin)")
+    ap.add_argument("-o", "--output", default="-", help="archivo JSONL de salida ('-' = stdout)")
+    ap.add_argument("-c", "--concurrency", type=int, default=BATCH_CONCURRENCY,
+                    help="preguntas simultáneas (y agentes en el pool)")
+    ap.add_argument("--por-sede", action="store_true",
+                    help="repite las preguntas con {sede} para cada sede de la base")
+    ap.add_argument("--sedes", help="lista de sedes separadas por coma (implica --por-sede)")
+    args = ap.parse_args(argv)
+
+    if args.input == "-":
+        items = read_questions(sys.stdin)
+    else:
+        with open(args.input, encoding="utf-8") as f:
+            items = read_questions(f)
+    if args.por_sede or args.sedes:
+        sedes = [s.strip() for s in args.sedes.split(",")] if args.sedes else list_sedes()
+        items = expand_sedes(items, sedes)
+
+    if args.output == "-":
+        # Los prints de las tools (también en los procesos de run_cpu) van a stderr;
+        # el JSONL sale por una copia del stdout original.
+        sys.stdout.flush()
+        out = os.fdopen(os.dup(1), "w", encoding="utf-8")
+        os.dup2(2, 1)
+    else:
+        out = open(args.output, "w", encoding="utf-8")
+    t0 = time.perf_counter()
+    try:
+        results = asyncio.run(run_batch(items, out, args.concurrency))
+    finally:
+        out.close()
+    print(_summary(results, time.perf_counter() - t0), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,23 +2,30 @@
 """
 Agente inteligente usando Strands + Amazon Bedrock.
 El LLM decide qué herramientas usar según la pregunta del usuario.
+
+Strands, boto3 y las tools (pandas) se importan al crear el agente, no al
+importar este módulo; warm_agent() lo crea en segundo plano.
+
+ask() devuelve la respuesta completa; stream() entrega en vivo los fragmentos
+de texto del modelo y el inicio/fin de cada tool (ver app_streamlit.py).
 """
 
 import os
 import asyncio
-from typing import Optional
+import inspect
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Dict, List, Optional
 from pathlib import Path
 
-from strands import Agent
-from strands.models.bedrock import BedrockModel
-
-from agent.tools import (
-    query_database,
-    generate_chart,
-    export_to_file,
-    get_database_schema
-)
-from agent.db import init_db
+from agent.executor import run_io
+from agent.qcache import QUESTION_CACHE, QCACHE_ENABLED, is_follow_up, normalize_question, plan_from_messages, tool_calls
+from agent import router
+from agent.loop import run
+from agent.artifacts import Artifact, collect
+from agent.memory import Memory, use
 
 
 class SalesAnalysisAgent:
@@ -31,7 +38,8 @@ class SalesAnalysisAgent:
         self,
         model_id: str = "amazon.nova-lite-v1:0",
         region: str = "us-east-1",
-        temperature: float = 0.0
+        temperature: float = 0.0,
+        model=None
     ):
         """
         Inicializa el agente con el modelo de Bedrock especificado.
@@ -40,7 +48,21 @@ class SalesAnalysisAgent:
             model_id: ID del modelo en Bedrock (ej: "amazon.nova-lite-v1:0")
             region: Región de AWS donde está habilitado Bedrock
             temperature: Temperatura para el modelo (0.0 = determinístico, 1.0 = creativo)
+            model: BedrockModel ya creado (ver create_model()) para compartir el
+                   cliente entre agentes; si se pasa, se ignoran los anteriores
         """
+        from strands import Agent
+        from strands.hooks import AfterToolCallEvent, BeforeToolCallEvent
+        from strands.tools.executors import ConcurrentToolExecutor
+        from agent.tools import (
+            query_database,
+            fetch_rows,
+            generate_chart,
+            export_to_file,
+            get_database_schema
+        )
+        from agent.db import init_db
+        
         self.model_id = model_id
         self.region = region
         self.temperature = temperature
@@ -52,26 +74,39 @@ class SalesAnalysisAgent:
             print(f"⚠️ Advertencia al inicializar DB: {e}")
         
         # Configurar el modelo de Bedrock
-        self.model = BedrockModel(
-            model_id=model_id,
-            region_name=region,
-            temperature=temperature
-        )
+        self.model = model or create_model(model_id, region, temperature)
         
         # Las herramientas son las funciones async directamente
         self.tools = [
             query_database,
+            fetch_rows,
             generate_chart,
             export_to_file,
             get_database_schema
         ]
         
-        # Crear el agente con Strands
+        # Crear el agente con Strands. Las tools de un mismo turno se ejecutan
+        # en paralelo; su trabajo bloqueante va a los pools de agent.executor
         self.agent = Agent(
             model=self.model,
             tools=self.tools,
-            system_prompt=self._get_system_prompt()
+            system_prompt=self._get_system_prompt(),
+            tool_executor=ConcurrentToolExecutor()
         )
+        # Inicio/fin de cada tool que llama el modelo, para stream()
+        self.agent.hooks.add_callback(BeforeToolCallEvent, self._on_tool_start)
+        self.agent.hooks.add_callback(AfterToolCallEvent, self._on_tool_end)
+        # Tools que se re-ejecutan localmente en un acierto de la caché de preguntas
+        self._replay = {t.tool_name: t for t in self.tools}
+        # Tools usadas en la última pregunta: [{"tool", "input", "ok", "output"}]
+        self.last_tool_calls = []
+        # Gráficos y archivos de la última pregunta (agent.artifacts.Artifact)
+        self.last_artifacts = []
+        # Resultados recientes de esta conversación, bajo handles m_xxxxxxxx
+        self.memory = Memory()
+        # Cola del stream() en curso (None si se usa ask())
+        self._events: Optional[asyncio.Queue] = None
+        self._tool_t0: Dict[str, float] = {}
     
     # El prompt del agente se define acá
     def _get_system_prompt(self) -> str:
@@ -100,10 +135,13 @@ La tabla 'ventas' contiene: id, vendedor, sede, producto, cantidad, precio, fech
 2. Cuando el usuario haga una pregunta válida, determina qué información necesita
 3. Si necesitas conocer la estructura de la BD, usa get_database_schema
 4. Construye la consulta SQL apropiada
+   - Si query_database devuelve un handle (resultado grande), usa fetch_rows solo si necesitas ver más filas
 5. Si el usuario pide un gráfico, usa generate_chart con el tipo correcto
 6. Si el usuario pide guardar/exportar, usa export_to_file
 7. Siempre explica brevemente lo que estás haciendo
 8. Si hay múltiples interpretaciones, elige la más lógica o pregunta al usuario
+9. Si el usuario se refiere al resultado anterior ("eso", "ahora en torta", "exporta eso a Excel"),
+   pasa el handle m_xxxxxxxx que informó la tool como sql_query en vez de repetir la consulta
 
 **Ejemplos de preguntas típicas:**
 - "Top 5 productos más vendidos en Medellín" → Consulta + opcionalmente gráfico de barras
@@ -123,27 +161,180 @@ Sé conciso, preciso y útil. Siempre valida que la consulta SQL sea segura (sol
         Returns:
             Respuesta del agente después de ejecutar las herramientas necesarias
         """
+        self.last_tool_calls = []
+        with collect() as artifacts, use(self.memory):
+            self.last_artifacts = artifacts
+            return await self._ask(question, artifacts)
+    
+    async def stream(self, question: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Como ask(), pero entrega eventos a medida que ocurren:
+        
+            {"type": "text", "data": str}                        fragmento de texto del modelo
+            {"type": "tool_start", "id", "tool", "input"}        una tool empieza
+            {"type": "tool_end", "id", "tool", "ok", "output", "seconds"}
+            {"type": "done", "answer": str}                      respuesta completa (la de ask())
+        
+        Los fragmentos incluyen el texto que el modelo escribe antes de llamar
+        tools; la respuesta final es la de "done". Las respuestas locales (reglas
+        o caché de preguntas) no traen fragmentos, solo tools y "done".
+        
+        Args:
+            question: Pregunta en lenguaje natural
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._events = queue
+        task = asyncio.ensure_future(self.ask(question))
+        task.add_done_callback(lambda _: queue.put_nowait(None))
         try:
-            response = await self.agent.invoke_async(question)
+            while (event := await queue.get()) is not None:
+                yield event
+            yield {"type": "done", "answer": task.result()}
+        finally:
+            if not task.done():  # el consumidor dejó de leer
+                task.cancel()
+            self._events = None
+    
+    def _emit(self, event: Dict[str, Any]) -> None:
+        if self._events is not None:
+            self._events.put_nowait(event)
+    
+    def _on_tool_start(self, event) -> None:
+        tool_use = event.tool_use
+        self._tool_t0[tool_use["toolUseId"]] = time.perf_counter()
+        self._emit({"type": "tool_start", "id": tool_use["toolUseId"],
+                    "tool": tool_use["name"], "input": tool_use.get("input", {})})
+    
+    def _on_tool_end(self, event) -> None:
+        tool_use, result = event.tool_use, event.result
+        t0 = self._tool_t0.pop(tool_use["toolUseId"], time.perf_counter())
+        output = "\n".join(c["text"] for c in result.get("content", []) if "text" in c)
+        self._emit({"type": "tool_end", "id": tool_use["toolUseId"], "tool": tool_use["name"],
+                    "ok": result.get("status") == "success" and not output.lstrip().startswith("❌"),
+                    "output": output, "seconds": time.perf_counter() - t0})
+    
+    async def _ask(self, question: str, artifacts: List[Artifact]) -> str:
+        try:
+            # Preguntas que las reglas de sql_gen resuelven con confianza, o que
+            # ya se resolvieron antes (caché de preguntas): sin modelo
+            cacheable = QCACHE_ENABLED and not is_follow_up(normalize_question(question))
+            local = await router.answer_locally(question, self._run_tool)
+            if local is None and cacheable:
+                local = await self._answer_from_cache(question)
+            if local is not None:
+                # El historial guarda los handles (seguimientos); el usuario ve la versión limpia
+                self._remember_exchange(question, local.context)
+                return local.text
+            
+            # Las tools de intentos locales fallidos no cuentan: responde el modelo
+            self.last_tool_calls = []
+            artifacts.clear()
+            start = len(self.agent.messages)
+            t0 = time.perf_counter()
+            response = None
+            async for event in self.agent.stream_async(question):
+                if event.get("data"):
+                    self._emit({"type": "text", "data": event["data"]})
+                elif "result" in event:
+                    response = event["result"]
+            router.record_llm(time.perf_counter() - t0)
+            self.last_tool_calls.extend(tool_calls(self.agent.messages[start:]))
             # La respuesta es un objeto, necesitamos extraer el texto
             if hasattr(response, 'content'):
-                return response.content
+                answer = response.content
             elif isinstance(response, str):
-                return response
+                answer = response
             else:
-                return str(response)
+                answer = str(response)
+            
+            if cacheable:
+                plan = plan_from_messages(self.agent.messages[start:])
+                if plan is not None:
+                    await run_io(QUESTION_CACHE.put, question, plan, answer)
+            return answer
         except Exception as e:
             return f"❌ Error al procesar la pregunta: {str(e)}"
     
+    async def _answer_from_cache(self, question: str) -> Optional[router.Answer]:
+        """
+        Si la pregunta ya se resolvió antes, re-ejecuta localmente las tools que
+        usó el modelo (con los datos actuales) y arma la respuesta sin llamar a
+        Bedrock. Devuelve None si no hay entrada o alguna tool falla.
+        """
+        plan = await run_io(QUESTION_CACHE.get, question)
+        if plan is None:
+            return None
+        steps = [s for s in plan if s["tool"] != "get_database_schema"]
+        outputs = await asyncio.gather(*(self._run_tool(s["tool"], s["input"]) for s in steps))
+        if any(str(o).lstrip().startswith("❌") for o in outputs):
+            await run_io(QUESTION_CACHE.invalidate, question)
+            return None
+        
+        header = "⚡ Respuesta reutilizada (pregunta ya resuelta, sin llamar al modelo):\n\n"
+        return router.Answer(header + "\n\n".join(router.for_user(o) for o in outputs),
+                             header + "\n\n".join(str(o) for o in outputs))
+    
+    def _remember_exchange(self, question: str, answer: str) -> None:
+        """Agrega al historial una respuesta dada sin el modelo (para preguntas de seguimiento)."""
+        self.agent.messages.extend([
+            {"role": "user", "content": [{"text": question}]},
+            {"role": "assistant", "content": [{"text": answer}]},
+        ])
+    
+    async def _run_tool(self, name: str, tool_input: dict) -> str:
+        call_id = f"local-{uuid.uuid4().hex[:8]}"
+        self._emit({"type": "tool_start", "id": call_id, "tool": name, "input": tool_input})
+        t0 = time.perf_counter()
+        result = self._replay[name](**tool_input)
+        if inspect.isawaitable(result):
+            result = await result
+        call = {
+            "tool": name, "input": tool_input,
+            "ok": not str(result).lstrip().startswith("❌"), "output": str(result),
+        }
+        self.last_tool_calls.append(call)
+        self._emit({"type": "tool_end", "id": call_id, "tool": name, "ok": call["ok"],
+                    "output": call["output"], "seconds": time.perf_counter() - t0})
+        return result
+    
+    def reset_history(self) -> None:
+        """Olvida la conversación (preguntas independientes, p.ej. en lote)."""
+        self.agent.messages.clear()
+        self.memory.clear()
+    
     def ask_sync(self, question: str) -> str:
-        """Versión síncrona de ask()"""
-        return asyncio.run(self.ask(question))
+        """Versión síncrona de ask(): corre en el loop de fondo de agent.loop."""
+        return run(self.ask(question))
+
+
+def create_model(
+    model_id: Optional[str] = None,
+    region: Optional[str] = None,
+    temperature: float = 0.0
+):
+    """
+    Crea el BedrockModel (y su cliente boto3). No guarda conversación, así que
+    varios agentes pueden compartirlo.
+    
+    Args:
+        model_id: ID del modelo (por defecto desde AWS_BEDROCK_MODEL_ID o Amazon Nova-lite)
+        region: Región de AWS (por defecto desde AWS_REGION o us-east-1)
+        temperature: Temperatura del modelo
+    """
+    from strands.models.bedrock import BedrockModel
+    
+    return BedrockModel(
+        model_id=model_id or os.getenv("AWS_BEDROCK_MODEL_ID", "amazon.nova-lite-v1:0"),
+        region_name=region or os.getenv("AWS_REGION", "us-east-1"),
+        temperature=temperature
+    )
 
 
 # Función helper para crear una instancia del agente fácilmente
 def create_agent(
     model_id: Optional[str] = None,
-    region: Optional[str] = None
+    region: Optional[str] = None,
+    model=None
 ) -> SalesAnalysisAgent:
     """
     Crea una instancia del agente con configuración por defecto o desde variables de entorno.
@@ -151,6 +342,7 @@ def create_agent(
     Args:
         model_id: ID del modelo de Bedrock (por defecto desde AWS_BEDROCK_MODEL_ID o Amazon Nova-lite)
         region: Región de AWS (por defecto desde AWS_REGION o us-east-1)
+        model: BedrockModel compartido (create_model()); evita un cliente boto3 por agente
     
     Returns:
         Instancia configurada del agente
@@ -158,7 +350,36 @@ def create_agent(
     model_id = model_id or os.getenv("AWS_BEDROCK_MODEL_ID", "amazon.nova-lite-v1:0")
     region = region or os.getenv("AWS_REGION", "us-east-1")
     
-    return SalesAnalysisAgent(model_id=model_id, region=region)
+    return SalesAnalysisAgent(model_id=model_id, region=region, model=model)
+
+
+def warm_agent(
+    model_id: Optional[str] = None,
+    region: Optional[str] = None
+) -> "Future[SalesAnalysisAgent]":
+    """
+    Crea el agente (imports de Strands/boto3, modelo y BD) y arranca los workers
+    de gráficos en un hilo de fondo mientras el usuario escribe. El hilo es
+    daemon: salir antes de que termine no espera la carga.
+    
+    Returns:
+        Future con el agente; .result() bloquea solo si aún no está listo
+    """
+    future: "Future[SalesAnalysisAgent]" = Future()
+    
+    def build():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            # Los workers de gráficos (forkserver) arrancan mientras se cargan Strands/boto3
+            from agent import charts
+            charts.warm()
+            future.set_result(create_agent(model_id, region))
+        except BaseException as e:
+            future.set_exception(e)
+    
+    threading.Thread(target=build, name="agent-warmup", daemon=True).start()
+    return future
 
 
 # Ejemplo de uso
@@ -0,0 +1,110 @@
+# agent/cache.py
+"""
+Caché de resultados de consultas compartida por las tools del agente.
+
+La clave combina el SQL normalizado, los parámetros y la versión de los datos
+(se incrementa en cada ingesta), así que una carga nueva invalida todo sin
+tener que limpiar la caché. El tamaño se acota en bytes con desalojo LRU.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import pandas as pd
+
+CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL_S = float(os.getenv("QUERY_CACHE_TTL_S", "0"))  # 0 = sin expiración
+
+_LITERAL_RE = re.compile(r"('(?:[^']|'')*')")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Forma canónica del SQL para usar como clave: espacios colapsados fuera de los
+    literales de texto y sin ';' final. No se cambian mayúsculas porque SQLite
+    nombra las columnas sin alias con el texto de la expresión (SUM(total) ≠ sum(total)).
+    """
+    parts = _LITERAL_RE.split(sql.strip().rstrip(";").strip())
+    for i in range(0, len(parts), 2):  # posiciones pares = fuera de comillas
+        parts[i] = _SPACES_RE.sub(" ", parts[i])
+    return "".join(parts).strip()
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class ResultCache:
+    """LRU acotado por bytes, con TTL opcional y contadores de aciertos/fallos."""
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES, ttl_s: Optional[float] = CACHE_TTL_S or None):
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._items: "OrderedDict[Hashable, Tuple[pd.DataFrame, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(sql: str, params: tuple = (), version: Any = None) -> Tuple:
+        return (normalize_sql(sql), tuple(params), version)
+
+    def get(self, key: Hashable) -> Optional[pd.DataFrame]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and self.ttl_s and time.monotonic() - item[2] > self.ttl_s:
+                self._drop(key)
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+        # Copia superficial: quien agregue columnas no altera la entrada cacheada
+        return item[0].copy(deep=False)
+
+    def put(self, key: Hashable, df: pd.DataFrame) -> None:
+        size = _frame_bytes(df)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._drop(key)
+            self._items[key] = (df, size, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._items))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def _drop(self, key: Hashable) -> None:
+        _, size, _ = self._items.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "evictions": self.evictions,
+            }
+
+
+# Instancia compartida por agent.db.query (y por lo tanto por todas las tools)
+RESULT_CACHE = ResultCache()
@@ -0,0 +1,332 @@
+# agent/charts.py
+"""
+Render de gráficos sin el estado global de pyplot.
+
+Cada gráfico es una matplotlib.figure.Figure propia con su canvas Agg, así que
+dos renders simultáneos no se pisan. El render corre en un pool pequeño de
+procesos "tibios": al arrancar, cada worker importa matplotlib y dibuja una
+figura de prueba para que las fuentes ya estén cargadas en el primer pedido.
+Los workers se crean con forkserver/spawn, no con fork: arrancan limpios
+aunque el proceso ya tenga hilos (Streamlit, el loop del agente).
+
+    png = render(df, "bar", x="sede", y="total_ventas")            # bytes PNG
+    path = await render_async(df, "line", out="data/ventas.svg")    # ruta (SVG)
+
+Acepta DataFrames, Series, dicts de columnas, pares (x, y) y arrays. Los datos
+se pasan al worker como listas de tipos básicos: el worker no necesita pandas.
+Con CHART_WORKERS=0 se renderiza en el pool de hilos de agent.executor.
+
+Para que el costo no crezca con las filas, antes de enviar los datos:
+- las líneas de más de CHART_MAX_POINTS puntos se reducen por buckets de
+  mínimo/máximo (conserva picos y valles),
+- las barras y tortas de más de CHART_MAX_CATEGORIES categorías conservan las
+  mayores y agrupan el resto en "Otros".
+Formatos: png (por defecto), svg y webp.
+"""
+
+import asyncio
+import functools
+import io
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+CHART_DPI = int(os.getenv("CHART_DPI", "120"))
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "1000"))
+CHART_MAX_CATEGORIES = int(os.getenv("CHART_MAX_CATEGORIES", "15"))
+
+FORMATS = ("png", "svg", "webp")
+# Etiquetas del eje X en líneas con X de texto (fechas, meses)
+_MAX_XTICKS = 12
+# Con más puntos los marcadores tapan la línea
+_MARKER_MAX_POINTS = 60
+
+_pool: Optional[Executor] = None
+_lock = threading.Lock()
+
+
+def _plain(v: Any) -> Union[int, float, str]:
+    """Valor serializable sin pandas/numpy (fechas y objetos → texto)."""
+    if isinstance(v, bool):
+        return int(v)
+    if isinstance(v, (int, float, str)):
+        return v
+    if hasattr(v, "item"):  # escalares de numpy
+        v = v.item()
+        if isinstance(v, (int, float, str)):
+            return v
+    return str(v)
+
+
+def _columns(data: Any, x: Optional[str], y: Optional[str]) -> Tuple[Any, Any, str, str]:
+    """
+    Normaliza la entrada a (valores_x, valores_y, nombre_x, nombre_y); los
+    valores de Y quedan en un array float de NumPy (None → NaN).
+
+    Args:
+        data: DataFrame, Series, dict de columnas, par (xs, ys) o array 1D/2D
+        x: Columna del eje X (por defecto la primera)
+        y: Columna del eje Y (por defecto la segunda)
+    """
+    if hasattr(data, "columns"):  # DataFrame
+        cols = list(data.columns)
+        if len(cols) < 2 and (x is None or y is None):
+            raise ValueError("Se necesitan al menos 2 columnas para graficar")
+        x = x if x is not None else cols[0]
+        y = y if y is not None else cols[1]
+        xs, ys = data[x].to_numpy(), data[y].to_numpy()
+    elif hasattr(data, "index") and hasattr(data, "tolist"):  # Series
+        xs, ys = data.index.to_numpy(), data.to_numpy()
+        x, y = x or str(data.index.name or "x"), y or str(data.name or "y")
+    elif isinstance(data, dict):
+        keys = list(data)
+        x = x if x is not None else keys[0]
+        y = y if y is not None else keys[1]
+        xs, ys = list(data[x]), list(data[y])
+    else:
+        shape = getattr(data, "shape", None)
+        if shape is not None and len(shape) == 2:  # array 2D: columnas 0 y 1
+            xs, ys = data[:, 0], data[:, 1]
+        elif shape is not None and len(shape) == 1:  # array 1D: valores por posición
+            xs, ys = range(len(data)), data
+        elif isinstance(data, (tuple, list)) and len(data) == 2:
+            xs, ys = list(data[0]), list(data[1])
+        else:
+            raise TypeError(f"No sé graficar datos de tipo {type(data).__name__}")
+        x, y = x or "x", y or "y"
+    if len(xs) != len(ys):
+        raise ValueError("Los ejes X e Y tienen distinto largo")
+    import numpy as np
+
+    return xs, np.asarray(ys, dtype=float), str(x), str(y)
+
+
+def minmax_indices(ys: Any, max_points: int) -> Any:
+    """
+    Índices a conservar de una serie larga: el primero, el último y el mínimo y
+    máximo de cada bucket, en orden. Todo vectorizado con NumPy.
+
+    Args:
+        ys: Valores de la serie
+        max_points: Puntos máximos del resultado (>= 4)
+
+    Returns:
+        Array ordenado de índices (todos si la serie ya es corta)
+    """
+    import numpy as np
+
+    ys = np.asarray(ys, dtype=float)
+    n = len(ys)
+    if n <= max(max_points, 4):
+        return np.arange(n)
+    body = ys[1:-1]
+    m = len(body)
+    # Buckets de igual tamaño; el relleno del último (y los NaN) nunca gana
+    size = -(-m // max(1, (max_points - 2) // 2))
+    buckets = -(-m // size)
+    lo = np.full(buckets * size, np.inf)
+    hi = np.full(buckets * size, -np.inf)
+    valid = ~np.isnan(body)
+    lo[:m][valid] = body[valid]
+    hi[:m][valid] = body[valid]
+    base = np.arange(buckets) * size + 1
+    keep = np.concatenate((
+        [0],
+        base + lo.reshape(buckets, size).argmin(axis=1),
+        base + hi.reshape(buckets, size).argmax(axis=1),
+        [n - 1],
+    ))
+    return np.unique(keep)
+
+
+def collapse_tail(xs: Any, ys: Any, max_categories: int, label: str = "Otros") -> Tuple[List, List[float]]:
+    """
+    Deja las `max_categories - 1` categorías de mayor valor (en su orden
+    original) y suma el resto en una categoría "Otros (n)".
+
+    Returns:
+        (etiquetas, valores) como listas de tipos básicos
+    """
+    import numpy as np
+
+    values = np.asarray(ys, dtype=float)
+    if len(values) <= max_categories:
+        return [_plain(v) for v in xs], values.tolist()
+    # NaN cuenta como 0 para elegir las mayores y en la suma
+    ranked = np.nan_to_num(values, nan=0.0)
+    top = np.sort(np.argsort(-ranked, kind="stable")[:max(1, max_categories - 1)])
+    rest = np.ones(len(values), dtype=bool)
+    rest[top] = False
+    return (
+        [_plain(xs[i]) for i in top] + [f"{label} ({int(rest.sum())})"],
+        values[top].tolist() + [float(ranked[rest].sum())],
+    )
+
+
+def _draw(fig, chart: str, xs: List, ys: List[float], x: str, y: str, title: str,
+          pos: Optional[List[int]] = None) -> None:
+    import numpy as np
+
+    ax = fig.add_subplot()
+    if chart == "pie":
+        # La primera columna son las etiquetas y la segunda los valores
+        ax.pie(ys, labels=[str(v) for v in xs], autopct="%1.1f%%")
+        ax.set_title(title or f"{y} por {x}")
+        return
+    if chart == "line":
+        marker = "o" if len(ys) <= _MARKER_MAX_POINTS else None
+        if pos is None:
+            ax.plot(xs, ys, marker=marker)
+        else:
+            # X de texto: se grafica por posición (conserva los huecos de la
+            # reducción) y se rotulan solo algunas marcas
+            ax.plot(pos, ys, marker=marker)
+            ticks = sorted(set(np.linspace(0, len(pos) - 1, min(len(pos), _MAX_XTICKS)).round().astype(int)))
+            ax.set_xticks([pos[i] for i in ticks], [str(xs[i]) for i in ticks])
+        ax.set_title(title or f"{y} vs {x}")
+    else:  # bar (default)
+        ax.bar([str(v) for v in xs], ys)
+        ax.set_title(title or f"{y} por {x}")
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    for label in ax.get_xticklabels():
+        label.set_rotation(45)
+        label.set_horizontalalignment("right")
+
+
+def _render(spec: Dict[str, Any], out: Optional[str]) -> Union[bytes, str]:
+    """Corre en el worker: dibuja la figura y devuelve el PNG o la ruta escrita."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    _draw(fig, spec["chart"], spec["xs"], spec["ys"], spec["x"], spec["y"], spec["title"], spec.get("pos"))
+    fig.tight_layout()
+    if out is not None:
+        Path(out).parent.mkdir(parents=True, exist_ok=True)
+        fig.savefig(out, format=spec["fmt"], dpi=spec["dpi"])
+        return str(out)
+    buf = io.BytesIO()
+    fig.savefig(buf, format=spec["fmt"], dpi=spec["dpi"])
+    return buf.getvalue()
+
+
+def _warm() -> None:
+    """Initializer de los workers: carga matplotlib, Agg y las fuentes."""
+    _render(_spec((["a"], [1]), "bar", None, None, "Ventas", CHART_DPI, "png"), None)
+
+
+def render_options() -> Dict[str, Any]:
+    """Ajustes que cambian la imagen (parte de la clave en agent.artifacts)."""
+    return {"dpi": CHART_DPI, "max_points": CHART_MAX_POINTS, "max_categories": CHART_MAX_CATEGORIES}
+
+
+def _ready() -> bool:
+    return True
+
+
+def pool() -> Executor:
+    global _pool
+    if CHART_WORKERS <= 0:
+        from agent.executor import io_pool
+        return io_pool()
+    with _lock:
+        # Un worker que muere (OOM, señal) rompe el pool: se reemplaza
+        if _pool is None or getattr(_pool, "_broken", False):
+            # forkserver/spawn: no heredar los hilos del proceso (ver agent.executor.mp_context)
+            from agent.executor import mp_context
+            _pool = ProcessPoolExecutor(max_workers=CHART_WORKERS, mp_context=mp_context(), initializer=_warm)
+        return _pool
+
+
+def warm() -> List[Future]:
+    """Arranca los workers sin esperar (conviene antes de cargar Strands/boto3)."""
+    executor = pool()
+    return [executor.submit(_ready) for _ in range(max(1, CHART_WORKERS))]
+
+
+def _format(fmt: Optional[str], out: Optional[Union[str, Path]]) -> str:
+    """Formato pedido, o el de la extensión de `out`, o png."""
+    if fmt is None:
+        suffix = Path(out).suffix.lstrip(".").lower() if out is not None else ""
+        fmt = suffix if suffix in FORMATS else "png"
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato no soportado: {fmt} (usa {', '.join(FORMATS)})")
+    return fmt
+
+
+def _spec(data: Any, chart: str, x: Optional[str], y: Optional[str], title: str, dpi: int,
+          fmt: str) -> Dict[str, Any]:
+    xs, ys, x, y = _columns(data, x, y)
+    if not len(ys):
+        raise ValueError("Sin datos para graficar")
+    spec = {"chart": chart, "x": x, "y": y, "title": title, "dpi": dpi, "fmt": fmt}
+    if chart == "line":
+        # Se reduce antes de convertir: el costo no crece con las filas
+        keep = minmax_indices(ys, CHART_MAX_POINTS)
+        xs, ys = [_plain(xs[i]) for i in keep], ys[keep].tolist()
+        if not all(isinstance(v, (int, float)) for v in xs):
+            spec["pos"] = keep.tolist()
+    else:
+        xs, ys = collapse_tail(xs, ys, CHART_MAX_CATEGORIES)
+    spec.update(xs=xs, ys=ys)
+    return spec
+
+
+def render(
+    data: Any,
+    chart: str = "bar",
+    x: Optional[str] = None,
+    y: Optional[str] = None,
+    title: str = "",
+    out: Optional[Union[str, Path]] = None,
+    dpi: int = CHART_DPI,
+    fmt: Optional[str] = None,
+) -> Union[bytes, str]:
+    """
+    Renderiza un gráfico en el pool y espera el resultado.
+
+    Args:
+        data: DataFrame, Series, dict de columnas, par (xs, ys) o array
+        chart: "bar", "line" o "pie"
+        x: Columna del eje X (por defecto la primera)
+        y: Columna del eje Y (por defecto la segunda)
+        title: Título del gráfico
+        out: Ruta de la imagen a escribir; si es None se devuelven los bytes
+        dpi: Resolución de la imagen (png/webp)
+        fmt: "png", "svg" o "webp" (por defecto la extensión de `out`, o png)
+
+    Returns:
+        Bytes de la imagen, o la ruta escrita si se pasó `out`
+    """
+    spec = _spec(data, chart, x, y, title, dpi, _format(fmt, out))
+    return pool().submit(_render, spec, None if out is None else str(out)).result()
+
+
+async def render_async(
+    data: Any,
+    chart: str = "bar",
+    x: Optional[str] = None,
+    y: Optional[str] = None,
+    title: str = "",
+    out: Optional[Union[str, Path]] = None,
+    dpi: int = CHART_DPI,
+    fmt: Optional[str] = None,
+) -> Union[bytes, str]:
+    """Como render(), sin bloquear el event loop."""
+    spec = _spec(data, chart, x, y, title, dpi, _format(fmt, out))
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool(), functools.partial(_render, spec, None if out is None else str(out)))
+
+
+def shutdown(wait: bool = True) -> None:
+    """Cierra el pool de render (se recrea si se vuelve a usar)."""
+    global _pool
+    with _lock:
+        executor, _pool = _pool, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
@@ -1,10 +1,57 @@
 # agent/db.py
+import csv
+import hashlib
+import logging
+import os
+import re
 import sqlite3
+import threading
+import time
 import pandas as pd
+from contextlib import closing
+from datetime import datetime
 from pathlib import Path
-from typing import Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from agent import rollups
+from agent.workload import RECORDER
+from agent.cache import RESULT_CACHE
+
+logger = logging.getLogger("agent.db")
 
 DB_PATH = Path("data/ventas.sqlite")
+SCHEMA_PATH = Path(__file__).resolve().parents[1] / "db" / "schema.sql"
+
+# Columnas de 'ventas' en el orden del DDL (total se calcula si el CSV no lo trae)
+COLUMNS = ("id", "vendedor", "sede", "producto", "cantidad", "precio", "fecha", "total")
+
+# Filas por bloque de inserción y caché de páginas durante la carga (KiB, negativo)
+CHUNK_ROWS = 50_000
+INGEST_CACHE_KB = -262_144
+
+# Tabla con la huella del CSV cargado (ruta, tamaño, mtime, hash, offset)
+META_TABLE = "ingest_meta"
+# Archivos incrementales ya cargados (data/ventas_nuevas_*.csv)
+FILES_TABLE = "ingest_files"
+# Índices creados por el asesor (python -m agent.workload advise --apply)
+ADVISED_TABLE = "advised_indexes"
+NEW_FILES_GLOB = "ventas_nuevas_*.csv"
+# Bytes finales que se comparan para confirmar que el CSV solo creció al final
+TAIL_BYTES = 64 * 1024
+# Bloque del hash encadenado del CSV (ver _ChainHash)
+HASH_BLOCK = 1 << 20
+# Cada cuántas cargas incrementales se relee el CSV entero para validar el hash
+VERIFY_EVERY_APPENDS = 20
+
+# Conexiones de lectura: memoria mapeada y caché de páginas (KiB, negativo)
+READ_MMAP_BYTES = 256 * 1024 * 1024
+READ_CACHE_KB = -65_536
+READ_CACHED_STATEMENTS = 256
+# Filas por bloque al recorrer resultados grandes con iter_query
+ITER_BATCH_ROWS = 10_000
+
+# Última huella verificada en este proceso: evita incluso abrir SQLite si nada cambió
+_last_checked: Optional[Tuple] = None
 
 def _find_csv() -> Tuple[Path, bool]:
     """
@@ -20,36 +67,668 @@ def _find_csv() -> Tuple[Path, bool]:
             return p, True
     return candidates[0], False  # por defecto
 
-def init_db() -> str:
+def _find_new_files() -> List[Tuple[str, int, int]]:
+    """Archivos incrementales en data/: [(ruta, tamaño, mtime_ns)] ordenados por nombre."""
+    out = []
+    for p in sorted(Path("data").glob(NEW_FILES_GLOB)):
+        st = p.stat()
+        out.append((str(p.resolve()), st.st_size, st.st_mtime_ns))
+    return out
+
+# ---------------- Huella del origen ----------------
+def _source_signature(csv_path: Path) -> Dict[str, str]:
+    """Huella barata del CSV (sin leerlo): ruta absoluta, tamaño y mtime."""
+    st = csv_path.stat()
+    return {
+        "source_path": str(csv_path.resolve()),
+        "source_size": str(st.st_size),
+        "source_mtime_ns": str(st.st_mtime_ns),
+    }
+
+class _ChainHash:
+    """
+    SHA-256 encadenado por bloques de HASH_BLOCK bytes: h = sha256(h_anterior +
+    bloque). El estado tras el último bloque completo (digest y posición) se
+    puede guardar en 'ingest_meta', así que una carga incremental sigue el hash
+    del archivo entero leyendo solo el último bloque parcial y lo nuevo.
+    """
+
+    def __init__(self, state: str = "", pos: int = 0):
+        self.state = bytes.fromhex(state)
+        self.pos = pos  # bytes cubiertos por `state` (múltiplo de HASH_BLOCK)
+        self._buf = bytearray()
+
+    def update(self, data: bytes) -> None:
+        self._buf += data
+        while len(self._buf) >= HASH_BLOCK:
+            h = hashlib.sha256(self.state)
+            h.update(memoryview(self._buf)[:HASH_BLOCK])
+            self.state = h.digest()
+            del self._buf[:HASH_BLOCK]
+            self.pos += HASH_BLOCK
+
+    @property
+    def size(self) -> int:
+        """Bytes recibidos desde el inicio del archivo."""
+        return self.pos + len(self._buf)
+
+    def hexdigest(self) -> str:
+        """Hash de todo lo recibido (incluye el bloque parcial)."""
+        return hashlib.sha256(self.state + self._buf).hexdigest()
+
+    def meta(self) -> Dict[str, str]:
+        return {"source_chain_sha256": self.hexdigest(),
+                "source_chain_state": self.state.hex(), "source_chain_pos": str(self.pos)}
+
+def _feed(hasher, path: Path, start: int, end: int, block: int = HASH_BLOCK):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while start < end:
+            chunk = f.read(min(block, end - start))
+            if not chunk:
+                break
+            hasher.update(chunk)
+            start += len(chunk)
+    return hasher
+
+def _sha256(path: Path, end: int) -> str:
+    """Hash encadenado (_ChainHash) de los primeros `end` bytes."""
+    return _feed(_ChainHash(), path, 0, end).hexdigest()
+
+def _tail_sha256(path: Path, end: int) -> str:
+    """SHA-256 de los últimos TAIL_BYTES antes de `end`."""
+    start = max(0, end - TAIL_BYTES)
+    with open(path, "rb") as f:
+        f.seek(start)
+        return hashlib.sha256(f.read(end - start)).hexdigest()
+
+def _complete_end(path: Path, start: int, end: int) -> int:
+    """Posición justo después del último salto de línea en [start, end), o `start`."""
+    with open(path, "rb") as f:
+        pos = end
+        while pos > start:
+            step = min(TAIL_BYTES, pos - start)
+            f.seek(pos - step)
+            i = f.read(step).rfind(b"\n")
+            if i >= 0:
+                return pos - step + i + 1
+            pos -= step
+    return start
+
+def _read_meta(conn: sqlite3.Connection) -> Dict[str, str]:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (META_TABLE,)
+    ).fetchone()
+    if not row:
+        return {}
+    return dict(conn.execute(f"SELECT key, value FROM {META_TABLE}").fetchall())
+
+def _write_meta(conn: sqlite3.Connection, values: Dict[str, str]) -> None:
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE} (key TEXT PRIMARY KEY, value TEXT)")
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {META_TABLE}(key, value) VALUES (?, ?)",
+        list(values.items()),
+    )
+
+def _loaded_files(conn: sqlite3.Connection) -> Dict[str, Tuple[int, int]]:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (FILES_TABLE,)
+    ).fetchone()
+    if not row:
+        return {}
+    rows = conn.execute(f"SELECT path, size, mtime_ns FROM {FILES_TABLE}").fetchall()
+    return {p: (s, m) for p, s, m in rows}
+
+def _pending_files(conn: sqlite3.Connection, files: List[Tuple[str, int, int]]) -> List[Tuple[str, int, int]]:
+    loaded = _loaded_files(conn)
+    return [f for f in files if loaded.get(f[0]) != (f[1], f[2])]
+
+def _has_ventas(conn: sqlite3.Connection) -> bool:
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='ventas'").fetchone()
+    return row is not None
+
+def _is_current(meta: Dict[str, str], sig: Dict[str, str]) -> bool:
+    return all(meta.get(k) == v for k, v in sig.items())
+
+# ---------------- Lectura del CSV (streaming) ----------------
+def _ventas_ddl(table: str) -> List[str]:
+    """Sentencias de db/schema.sql con la tabla 'ventas' renombrada a `table`."""
+    ddl = re.sub(r"\bventas\b", table, SCHEMA_PATH.read_text(encoding="utf-8"), count=1)
+    return [s.strip() for s in ddl.split(";") if s.strip()]
+
+def _norm_fecha(value: str) -> str:
+    v = value.strip()
+    if len(v) >= 10 and v[4] == "-" and v[7] == "-":
+        return v[:10]  # YYYY-MM-DD[ HH:MM:SS]
+    try:
+        return datetime.fromisoformat(v).date().isoformat()
+    except ValueError:
+        pass
+    for fmt in ("%d/%m/%Y", "%Y/%m/%d", "%d-%m-%Y"):
+        try:
+            return datetime.strptime(v, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"Fecha no reconocida: {value!r}")
+
+def _read_lines(path: Path, start: int, end: int, hasher=None) -> Iterator[str]:
+    """
+    Líneas del archivo entre los bytes [start, end). Leer solo hasta `end`
+    (tamaño observado al empezar) evita tomar filas que se están escribiendo.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        first = start == 0
+        for raw in f:
+            if remaining <= 0:
+                break
+            if len(raw) > remaining:
+                raw = raw[:remaining]
+            remaining -= len(raw)
+            if hasher is not None:
+                hasher.update(raw)
+            yield raw.decode("utf-8-sig" if first else "utf-8")
+            first = False
+
+def _parse_header(line: str, csv_path: Path) -> List[str]:
+    header = [h.strip() for h in next(csv.reader([line]), [])]
+    missing = set(COLUMNS[:-1]) - set(header)
+    if missing:
+        raise ValueError(f"Faltan columnas en {csv_path}: {missing}. Esperadas: {sorted(COLUMNS[:-1])}")
+    return header
+
+def _iter_csv_chunks(lines: Iterable[str], header: List[str], csv_path: Path,
+                     chunk_rows: int = CHUNK_ROWS) -> Iterator[List[tuple]]:
+    """
+    Convierte líneas CSV (sin encabezado) en bloques de `chunk_rows` filas tipadas
+    según COLUMNS. La memoria usada depende del tamaño del bloque, no del archivo.
+    """
+    idx = [header.index(c) for c in COLUMNS[:-1]]
+    i_total = header.index("total") if "total" in header else None
+
+    chunk: List[tuple] = []
+    for row in csv.reader(lines):
+        if not row:
+            continue
+        try:
+            id_, vendedor, sede, producto, cantidad, precio, fecha = (row[i] for i in idx)
+            cantidad, precio = int(cantidad), float(precio)
+            total = float(row[i_total]) if i_total is not None else cantidad * precio
+            chunk.append((int(id_), vendedor, sede, producto, cantidad, precio, _norm_fecha(fecha), total))
+        except (ValueError, IndexError) as e:
+            raise ValueError(f"{csv_path}: fila inválida {row!r} ({e})") from None
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _set_ingest_pragmas(conn: sqlite3.Connection) -> None:
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA cache_size={INGEST_CACHE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA synchronous=OFF")
+
+def _create_indexes(conn: sqlite3.Connection) -> None:
+    for col in ("sede", "vendedor", "producto", "fecha"):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{col} ON ventas({col});")
+    create_advised_indexes(conn)
+
+def create_advised_indexes(conn: sqlite3.Connection) -> None:
+    """(Re)crea los índices registrados en 'advised_indexes' cuyas tablas existen."""
+    try:
+        advised = conn.execute(f"SELECT name, tabla, columns FROM {ADVISED_TABLE}").fetchall()
+    except sqlite3.OperationalError:  # el asesor nunca se aplicó
+        return
+    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    for name, table, columns in advised:
+        if table in tables:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({columns})")
+
+def _insert_sql(table: str) -> str:
+    return f"INSERT INTO {table} ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+# ---------------- Carga completa ----------------
+def _load_csv(conn: sqlite3.Connection, csv_path: Path, end: Optional[int] = None,
+              chunk_rows: int = CHUNK_ROWS, hasher=None) -> Tuple[int, str]:
+    """
+    Carga el CSV en 'ventas_nueva' y la intercambia por 'ventas'. Debe llamarse
+    dentro de una transacción abierta: los lectores ven la tabla anterior completa
+    hasta el COMMIT. Los índices se crean después de insertar todas las filas.
+    Devuelve (filas cargadas, encabezado).
+    """
+    if end is None:
+        end = csv_path.stat().st_size
+    conn.execute("DROP TABLE IF EXISTS ventas_nueva")
+    for stmt in _ventas_ddl("ventas_nueva"):
+        conn.execute(stmt)
+
+    lines = _read_lines(csv_path, 0, end, hasher)
+    header = _parse_header(next(lines, ""), csv_path)
+    insert = _insert_sql("ventas_nueva")
+    rows = 0
+    for chunk in _iter_csv_chunks(lines, header, csv_path, chunk_rows):
+        conn.executemany(insert, chunk)
+        rows += len(chunk)
+
+    conn.execute("DROP TABLE IF EXISTS ventas")
+    conn.execute("ALTER TABLE ventas_nueva RENAME TO ventas")
+    rollups.rebuild(conn)
+    _create_indexes(conn)
+    return rows, ",".join(header)
+
+def bulk_load(csv_path: Path, db_path: Path, chunk_rows: int = CHUNK_ROWS) -> Dict[str, float]:
+    """
+    Carga completa del CSV en `db_path` con memoria acotada.
+
+    Usa el DDL tipado de db/schema.sql, inserta por bloques con executemany en
+    una sola transacción (WAL, caché grande, synchronous=OFF durante la carga)
+    y crea los índices al final.
+
+    Returns:
+        {"rows": filas cargadas, "seconds": duración, "rows_per_s": filas/s}
+    """
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    with closing(sqlite3.connect(db_path, isolation_level=None)) as conn:
+        _set_ingest_pragmas(conn)
+        t0 = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows, _ = _load_csv(conn, csv_path, chunk_rows=chunk_rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.execute("PRAGMA synchronous=NORMAL")
+        seconds = time.perf_counter() - t0
+    return {"rows": rows, "seconds": seconds, "rows_per_s": rows / seconds if seconds else 0.0}
+
+# ---------------- Carga incremental ----------------
+class _BelowWatermark(Exception):
+    """Un archivo incremental nuevo trae filas con id <= la marca de agua."""
+
+def _append_chunks(conn: sqlite3.Connection, chunks: Iterable[List[tuple]]) -> Tuple[int, int]:
+    """
+    Inserta en 'ventas' solo las filas con id mayor al máximo actual (marca de
+    agua). Los índices se mantienen con cada INSERT y las tablas de resumen se
+    actualizan solo con las filas nuevas; no hay reconstrucción.
+    Devuelve (filas insertadas, filas omitidas por id <= marca de agua).
+    """
+    hwm = conn.execute("SELECT COALESCE(MAX(id), 0) FROM ventas").fetchone()[0]
+    insert = _insert_sql("ventas")
+    rows = skipped = 0
+    for chunk in chunks:
+        fresh = [r for r in chunk if r[0] > hwm]
+        if fresh:
+            conn.executemany(insert, fresh)
+            rows += len(fresh)
+        skipped += len(chunk) - len(fresh)
+    if rows:
+        rollups.apply_delta(conn, hwm)
+    return rows, skipped
+
+def _verify_due(meta: Dict[str, str]) -> bool:
+    """True si a esta carga incremental le toca releer el CSV entero."""
+    return int(meta.get("source_appends", "0")) + 1 >= VERIFY_EVERY_APPENDS
+
+def _append_tail(conn: sqlite3.Connection, csv_path: Path, meta: Dict[str, str], size: int) -> int:
+    """
+    Inserta las líneas agregadas al CSV desde el último offset cargado y
+    extiende el hash encadenado del archivo con los bytes nuevos.
+    """
+    start = int(meta["source_offset"])
+    # Solo líneas completas: una fila a medio escribir se toma en la próxima pasada
+    end = _complete_end(csv_path, start, size)
+    header = meta["source_header"].split(",")
+    # Retomar el hash desde el último bloque completo (a lo sumo HASH_BLOCK bytes releídos)
+    pos = int(meta["source_chain_pos"])
+    hasher = _feed(_ChainHash(meta["source_chain_state"], pos), csv_path, pos, start)
+    lines = _read_lines(csv_path, start, end, hasher)
+    rows, skipped = _append_chunks(conn, _iter_csv_chunks(lines, header, csv_path))
+    if skipped:
+        logger.warning("⚠️ %s: %d filas nuevas con id <= al máximo cargado; se omitieron", csv_path, skipped)
+    _feed(hasher, csv_path, hasher.size, end)  # lo que el lector no llegó a consumir (normalmente nada)
+    _write_meta(conn, {
+        "source_offset": str(end),
+        "source_tail_sha256": _tail_sha256(csv_path, end),
+        # _plan ya verificó el prefijo si tocaba (ver _verify_due)
+        "source_appends": "0" if _verify_due(meta) else str(int(meta.get("source_appends", "0")) + 1),
+        **hasher.meta(),
+    })
+    return rows
+
+def _append_files(conn: sqlite3.Connection, files: List[Tuple[str, int, int]], strict: bool = True) -> int:
+    """
+    Carga archivos data/ventas_nuevas_*.csv nuevos o modificados.
+
+    Un archivo nuevo con filas de id <= la marca de agua no se puede cargar
+    por incremento (esas filas se perderían): con `strict` se lanza
+    _BelowWatermark para que ingest() recargue todo en orden; si no, las filas
+    se omiten con una advertencia (el id ya existe en la tabla).
+    """
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {FILES_TABLE} ("
+        "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, rows INTEGER, loaded_at TEXT)"
+    )
+    loaded = _loaded_files(conn)
+    rows = 0
+    for path, size, mtime_ns in files:
+        p = Path(path)
+        lines = _read_lines(p, 0, size)
+        header = _parse_header(next(lines, ""), p)
+        n, skipped = _append_chunks(conn, _iter_csv_chunks(lines, header, p))
+        # En un archivo ya cargado que creció, las filas viejas se omiten a propósito
+        if skipped and path not in loaded:
+            if strict:
+                raise _BelowWatermark(path)
+            logger.warning("⚠️ %s: %d filas con id ya existente en 'ventas'; se omitieron", p.name, skipped)
+        conn.execute(
+            f"INSERT OR REPLACE INTO {FILES_TABLE}(path, size, mtime_ns, rows, loaded_at) VALUES (?, ?, ?, ?, ?)",
+            (path, size, mtime_ns, n, time.strftime("%Y-%m-%dT%H:%M:%S")),
+        )
+        rows += n
+    return rows
+
+def _plan(meta: Dict[str, str], sig: Dict[str, str], csv_path: Path) -> str:
+    """
+    Decide cómo sincronizar el CSV principal:
+      'sin_cambios' → huella idéntica
+      'huella'      → mismo contenido con otro mtime; solo se actualiza la huella
+      'incremental' → el archivo solo creció al final; se cargan las líneas nuevas
+      'completa'    → cualquier otro cambio
+
+    Una carga incremental compara solo la cola (TAIL_BYTES) antes del offset:
+    un cambio en medio del archivo que conserva el tamaño del prefijo pasa
+    inadvertido hasta la validación completa, que se hace cada
+    VERIFY_EVERY_APPENDS cargas incrementales y siempre que el tamaño no cambió.
+    """
+    if _is_current(meta, sig):
+        return "sin_cambios"
+    if meta.get("source_path") != sig["source_path"] or "source_chain_state" not in meta:
+        return "completa"  # otro archivo, o una BD cargada antes del hash encadenado
+    size, offset = int(sig["source_size"]), int(meta["source_offset"])
+    if size < offset or _tail_sha256(csv_path, offset) != meta.get("source_tail_sha256"):
+        return "completa"
+    if size == offset or _verify_due(meta):
+        # Mismo tamaño, o toca la validación periódica: hash del prefijo ya cargado
+        if _sha256(csv_path, offset) != meta["source_chain_sha256"]:
+            return "completa"
+    return "incremental" if size > offset else "huella"
+
+def _reload(conn: sqlite3.Connection, csv_path: Path, sig: Dict[str, str]) -> int:
+    """Carga completa del CSV principal dentro de la transacción de ingest()."""
+    end = int(sig["source_size"])
+    hasher = _ChainHash()
+    rows, header = _load_csv(conn, csv_path, end, hasher=hasher)
+    _write_meta(conn, {
+        **hasher.meta(),
+        "source_header": header,
+        "source_offset": str(end),
+        "source_tail_sha256": _tail_sha256(csv_path, end),
+        "source_appends": "0",
+    })
+    # La tabla se reconstruyó: los archivos incrementales se vuelven a aplicar
+    conn.execute(f"DROP TABLE IF EXISTS {FILES_TABLE}")
+    return rows
+
+def ingest(force: bool = False) -> Dict[str, object]:
+    """
+    Sincroniza data/ventas.sqlite con el CSV de ventas y los archivos
+    data/ventas_nuevas_*.csv haciendo el mínimo trabajo posible.
+
+    La huella del origen (ruta, tamaño, mtime, hash encadenado, offset y hash
+    de la cola) se guarda en 'ingest_meta'. Si el CSV solo creció al final, se leen
+    únicamente los bytes nuevos y se insertan las filas con id mayor a la marca
+    de agua: el costo depende del delta, no del tamaño de la tabla.
+
+    Args:
+        force: Recarga todo aunque la huella coincida.
+
+    Returns:
+        {"mode": 'sin_cambios'|'huella'|'incremental'|'completa', "rows": filas
+        insertadas, "seconds": duración, "rows_per_s": filas/s}
+    """
+    global _last_checked
     csv_path, exists = _find_csv()
     if not exists:
         raise FileNotFoundError(
             f"No encontré dataset CSV. Crea 'data/ventas.csv' o 'data/ventas_demo.csv'. Busqué: {csv_path}"
         )
 
-    df = pd.read_csv(csv_path)
-    # Asegura columnas mínimas
-    expected = {"id", "vendedor", "sede", "producto", "cantidad", "precio", "fecha"}
-    missing = expected - set(df.columns)
-    if missing:
-        raise ValueError(f"Faltan columnas en {csv_path}: {missing}. Esperadas: {sorted(expected)}")
-
-    # Normaliza tipos básicos
-    if "total" not in df.columns:
-        df["total"] = df["cantidad"] * df["precio"]
-    df["fecha"] = pd.to_datetime(df["fecha"]).dt.date.astype(str)
+    sig = _source_signature(csv_path)
+    new_files = _find_new_files()
+    checked = (str(DB_PATH.resolve()), tuple(sig.values()), tuple(new_files))
+    noop = {"mode": "sin_cambios", "rows": 0, "seconds": 0.0, "rows_per_s": 0.0}
+    if not force and _last_checked == checked and DB_PATH.exists():
+        return noop
 
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with sqlite3.connect(DB_PATH) as conn:
-        df.to_sql("ventas", conn, if_exists="replace", index=False)
-        cur = conn.cursor()
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_sede ON ventas(sede);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_vendedor ON ventas(vendedor);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_producto ON ventas(producto);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_fecha ON ventas(fecha);")
-        conn.commit()
+    with closing(sqlite3.connect(DB_PATH, isolation_level=None)) as conn:
+        if not force and _has_ventas(conn) and _is_current(_read_meta(conn), sig) \
+                and not _pending_files(conn, new_files) and rollups.present(conn):
+            _last_checked = checked
+            return noop
+
+        _set_ingest_pragmas(conn)
+        t0 = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Otro proceso pudo haber cargado mientras esperábamos el lock
+            meta = _read_meta(conn)
+            mode = "completa" if force or not _has_ventas(conn) else _plan(meta, sig, csv_path)
+            if mode != "completa" and not rollups.present(conn):
+                rollups.rebuild(conn)  # BD creada antes de existir las tablas de resumen
+                create_advised_indexes(conn)
+            rows = 0
+            if mode == "completa":
+                rows = _reload(conn, csv_path, sig)
+            elif mode == "incremental":
+                rows = _append_tail(conn, csv_path, meta, int(sig["source_size"]))
+
+            pending = _pending_files(conn, new_files)
+            if pending:
+                try:
+                    rows += _append_files(conn, pending, strict=mode != "completa")
+                    if mode in ("sin_cambios", "huella"):
+                        mode = "incremental"
+                except _BelowWatermark as e:
+                    # Archivo con ids por debajo de lo cargado (p. ej. llegó fuera de
+                    # orden): se recarga todo y los archivos se aplican por nombre
+                    logger.warning("⚠️ %s trae ids ya superados; recarga completa", Path(str(e)).name)
+                    mode = "completa"
+                    rows = _reload(conn, csv_path, sig)
+                    rows += _append_files(conn, new_files, strict=False)
+
+            seconds = time.perf_counter() - t0
+            stats = {"mode": mode, "rows": rows, "seconds": seconds,
+                     "rows_per_s": rows / seconds if seconds else 0.0}
+            values = {**sig, "ingest_mode": mode, "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                      "load_rows": str(rows), "load_rows_per_s": f"{stats['rows_per_s']:.0f}"}
+            if mode == "completa" or rows:
+                # Invalida los resultados cacheados con la versión anterior
+                values["data_version"] = str(int(meta.get("data_version", "0")) + 1)
+            _write_meta(conn, values)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.execute("PRAGMA synchronous=NORMAL")
+
+    _last_checked = checked
+    return stats
+
+def init_db(force: bool = False) -> str:
+    """
+    Prepara data/ventas.sqlite a partir del CSV de ventas (ver ingest()).
+    Es casi gratis cuando nada cambió, así que se puede llamar en cada consulta.
+
+    Args:
+        force: Recarga el CSV aunque la huella coincida.
+
+    Returns:
+        Ruta de la base de datos.
+    """
+    ingest(force=force)
     return str(DB_PATH)
 
-def query(sql: str, params: tuple = ()):
-    with sqlite3.connect(DB_PATH) as conn:
-        return pd.read_sql_query(sql, conn, params=params)
+# ---------------- Pool de conexiones de lectura ----------------
+def connect_ro(path: Path) -> sqlite3.Connection:
+    """
+    Abre `path` en modo solo lectura (URI mode=ro + query_only) con mmap y una
+    caché de páginas amplia. El modo WAL lo deja persistente el cargador, así
+    que los lectores no bloquean ni son bloqueados por una ingesta.
+    """
+    conn = sqlite3.connect(
+        f"{Path(path).resolve().as_uri()}?mode=ro",
+        uri=True,
+        check_same_thread=False,  # cada hilo usa solo la suya (ver ConnectionPool)
+        cached_statements=READ_CACHED_STATEMENTS,
+    )
+    conn.execute("PRAGMA query_only=ON")
+    conn.execute(f"PRAGMA mmap_size={READ_MMAP_BYTES}")
+    conn.execute(f"PRAGMA cache_size={READ_CACHE_KB}")
+    return conn
+
+class ConnectionPool:
+    """
+    Entrega una conexión de solo lectura por hilo y la reutiliza entre consultas,
+    de modo que la caché de páginas y las sentencias preparadas se mantienen
+    calientes. Si el archivo de la BD se reemplaza, la conexión se reabre.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conns: List[sqlite3.Connection] = []
+
+    def get(self) -> sqlite3.Connection:
+        ino = os.stat(self.path).st_ino
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.ino == ino:
+            return conn
+        if conn is not None:
+            self._discard(conn)
+        conn = connect_ro(self.path)
+        self._local.conn, self._local.ino = conn, ino
+        with self._lock:
+            self._conns.append(conn)
+        return conn
+
+    def _discard(self, conn: sqlite3.Connection) -> None:
+        with self._lock:
+            if conn in self._conns:
+                self._conns.remove(conn)
+        conn.close()
+
+    def close_all(self) -> None:
+        """Cierra todas las conexiones (p.ej. al terminar el proceso o en pruebas)."""
+        with self._lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
+
+POOL = ConnectionPool(DB_PATH)
+
+def get_conn() -> sqlite3.Connection:
+    """Conexión de solo lectura del hilo actual sobre data/ventas.sqlite."""
+    return POOL.get()
+
+def data_version() -> str:
+    """Token que cambia cada vez que una ingesta modifica 'ventas'."""
+    try:
+        row = get_conn().execute(f"SELECT value FROM {META_TABLE} WHERE key = 'data_version'").fetchone()
+    except sqlite3.OperationalError:  # BD sin metadatos (creada por otra vía)
+        return "0"
+    return row[0] if row else "0"
+
+def execute(conn: sqlite3.Connection, sql: str, params: tuple = ()) -> Tuple[sqlite3.Cursor, str]:
+    """
+    Ejecuta `sql` enviándolo a la tabla de resumen más pequeña que lo responda
+    (ver agent.rollups). Si la versión reescrita falla, p.ej. porque la BD aún
+    no tiene rollups, se ejecuta la consulta original sobre 'ventas'.
+
+    Returns:
+        (cursor, SQL realmente ejecutado)
+    """
+    routed = rollups.rewrite(sql)
+    if routed is not None:
+        try:
+            return conn.execute(routed.sql, params), routed.sql
+        except sqlite3.Error:
+            pass
+    return conn.execute(sql, params), sql
+
+def iter_query(sql: str, params: tuple = (), batch_rows: int = ITER_BATCH_ROWS) -> Tuple[List[str], Iterator[List[tuple]]]:
+    """
+    Ejecuta un SELECT sin materializar el resultado: devuelve las columnas y un
+    iterador de bloques de hasta `batch_rows` filas leídos del cursor. La
+    memoria depende del bloque, no del total de filas.
+
+    Usa su propia conexión de solo lectura (se puede consumir desde cualquier
+    hilo) que se cierra al agotar o cerrar el iterador.
+
+    Returns:
+        (columnas, iterador de listas de tuplas)
+    """
+    conn, params = connect_ro(DB_PATH), tuple(params)
+    t0 = time.perf_counter()
+    try:
+        cur, executed = execute(conn, sql, params)
+    except Exception:
+        conn.close()
+        raise
+    columns = [d[0] for d in cur.description or ()]
+    seconds = time.perf_counter() - t0
+
+    def batches() -> Iterator[List[tuple]]:
+        nonlocal seconds
+        rows = 0
+        try:
+            while True:
+                t1 = time.perf_counter()
+                chunk = cur.fetchmany(batch_rows)
+                seconds += time.perf_counter() - t1  # solo SQLite, no quien consume
+                if not chunk:
+                    break
+                rows += len(chunk)
+                yield chunk
+            RECORDER.record(sql, executed, params, seconds, rows)
+        finally:
+            cur.close()
+            conn.close()
+
+    return columns, batches()
+
+def _read_sql(sql: str, params: tuple = ()) -> pd.DataFrame:
+    conn, params = get_conn(), tuple(params)
+    t0 = time.perf_counter()
+    cur, executed = execute(conn, sql, params)
+    try:
+        columns = [d[0] for d in cur.description or ()]
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+    RECORDER.record(sql, executed, params, time.perf_counter() - t0, len(rows))
+    return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+def query(sql: str, params: tuple = (), use_cache: bool = True):
+    """
+    Ejecuta un SELECT y devuelve un DataFrame. Las consultas agregadas se
+    responden desde las tablas de resumen cuando es posible. Los resultados se
+    guardan en la caché compartida (agent.cache.RESULT_CACHE) bajo la versión
+    actual de los datos.
+    """
+    if not use_cache:
+        return _read_sql(sql, params)
+    key = RESULT_CACHE.key(sql, params, data_version())
+    df = RESULT_CACHE.get(key)
+    if df is None:
+        df = _read_sql(sql, params)
+        RESULT_CACHE.put(key, df)
+        df = df.copy(deep=False)
+    return df
@@ -0,0 +1,95 @@
+# agent/executor.py
+"""
+Ejecutores para sacar del event loop el trabajo bloqueante de las tools.
+
+- run_io:  pool de hilos para E/S (SQLite, lectura con pandas). sqlite3 libera
+           el GIL mientras ejecuta, así que varias consultas avanzan en paralelo.
+- run_cpu: pool de procesos para trabajo de CPU (exportar archivos). Con
+           AGENT_CPU_WORKERS=0 se usa el pool de hilos. Los gráficos tienen su
+           propio pool con matplotlib precargado (agent.charts).
+
+Los pools se crean al primer uso y viven lo que dura el proceso.
+
+Los pools de procesos (este y el de gráficos) usan mp_context(): forkserver,
+o spawn donde no existe. Con fork el worker heredaría un proceso con hilos
+(loop del agente, pool de E/S, escritor del workload, Streamlit): sus locks
+pueden quedar tomados y los singletons de módulo apuntan a hilos que en el
+hijo no existen. Cada worker arma sus propios singletons; run_cpu vacía el
+RECORDER del worker antes de devolver (en los workers no corre atexit).
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+IO_WORKERS = int(os.getenv("AGENT_IO_WORKERS", "8"))
+CPU_WORKERS = int(os.getenv("AGENT_CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_io_pool: Optional[ThreadPoolExecutor] = None
+_cpu_pool: Optional[Executor] = None
+_lock = threading.Lock()
+
+
+def io_pool() -> ThreadPoolExecutor:
+    global _io_pool
+    with _lock:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="agent-io")
+        return _io_pool
+
+
+def mp_context() -> multiprocessing.context.BaseContext:
+    """Contexto para pools de procesos: forkserver si la plataforma lo tiene, si no spawn."""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def cpu_pool() -> Executor:
+    global _cpu_pool
+    if CPU_WORKERS <= 0:
+        return io_pool()
+    with _lock:
+        if _cpu_pool is None:
+            _cpu_pool = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=mp_context())
+        return _cpu_pool
+
+
+async def run_io(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Ejecuta `fn` en el pool de hilos de E/S y espera el resultado sin bloquear el loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_pool(), functools.partial(fn, *args, **kwargs))
+
+
+async def run_cpu(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Ejecuta `fn` en el pool de procesos. `fn` y sus argumentos deben poder
+    serializarse con pickle (funciones de módulo, DataFrames, tipos básicos).
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(fn, *args, **kwargs)
+    if CPU_WORKERS > 0:
+        call = functools.partial(_in_worker, call)
+    return await loop.run_in_executor(cpu_pool(), call)
+
+
+def _in_worker(call: Callable[[], Any]) -> Any:
+    """Corre `call` en el worker y espera a que su registro de workload quede escrito."""
+    try:
+        return call()
+    finally:
+        from agent.workload import RECORDER
+        RECORDER.flush()
+
+
+def shutdown(wait: bool = True) -> None:
+    """Cierra ambos pools (se recrean si se vuelven a usar)."""
+    global _io_pool, _cpu_pool
+    with _lock:
+        pools, _io_pool, _cpu_pool = (_io_pool, _cpu_pool), None, None
+    for pool in pools:
+        if pool is not None:
+            pool.shutdown(wait=wait)
@@ -0,0 +1,262 @@
+# agent/export.py
+"""
+Exportación en streaming: recorre el cursor de SQLite por bloques
+(db.iter_query) y escribe cada bloque directo al archivo, sin armar un
+DataFrame. La memoria es constante sin importar cuántas filas devuelva la
+consulta.
+
+Formatos:
+- csv      texto con encabezado
+- csv.gz   CSV comprimido con gzip
+- parquet  un row group por bloque (requiere pyarrow)
+- arrow    Arrow IPC / Feather v2, un record batch por bloque (requiere pyarrow)
+- excel    .xlsx write-only; una hoja nueva cada 1.048.576 filas y hojas de
+           resumen opcionales (ver outputs.write_excel)
+
+export_frame() escribe con los mismos formatos un DataFrame que ya está en
+memoria (agent.memory), sin volver a consultar.
+
+    python -m agent.export "SELECT * FROM ventas" --format parquet
+"""
+
+import argparse
+import csv
+import gzip
+import os
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from agent.db import init_db, iter_query
+from agent.outputs import df_batches, export_path, write_excel
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "50000"))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+
+FORMATS = ("csv", "csv.gz", "parquet", "arrow", "excel")
+_EXTENSIONS = {"excel": "xlsx"}
+
+
+def extension(fmt: str) -> str:
+    """Extensión de archivo del formato ("excel" → "xlsx")."""
+    return _EXTENSIONS.get(fmt, fmt)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("Para exportar a Parquet/Arrow instala pyarrow: pip install pyarrow") from None
+    return pyarrow
+
+
+def _write_csv(path: Path, columns: List[str], batches: Iterable[List[tuple]], compress: bool) -> int:
+    if compress:
+        f = gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=EXPORT_GZIP_LEVEL)
+    else:
+        f = open(path, "w", encoding="utf-8", newline="")
+    rows = 0
+    with f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for batch in batches:
+            writer.writerows(batch)
+            rows += len(batch)
+    return rows
+
+
+def _column(pa, name: str, values: Sequence, type_) -> Any:
+    """
+    Arma la columna con el tipo que traen los valores y recién después la
+    lleva al del esquema con un cast seguro: pa.array(values, type=int64)
+    truncaría en silencio un 2.5 a 2.
+    """
+    try:
+        arr = pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        arr = None
+    if arr is not None and arr.type == type_:
+        return arr
+    if pa.types.is_string(type_):  # columna mixta o de otro tipo: todo a texto
+        return pa.array([None if v is None else str(v) for v in values], type=type_)
+    if arr is not None:
+        try:
+            return arr.cast(type_, safe=True)  # nulos, o 2.0 → 2; falla si pierde datos
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            pass
+    found = "tipos mezclados" if arr is None else arr.type
+    raise ValueError(f"La columna '{name}' cambia de tipo entre filas ({type_} → {found}); "
+                     f"usa CAST en la consulta") from None
+
+
+def _record_batches(pa, columns: List[str], batches: Iterable[List[tuple]]) -> Iterator[Any]:
+    """
+    Convierte bloques de tuplas en RecordBatch. El esquema sale del primer
+    bloque (SQLite no declara tipos en el resultado): columnas vacías o con
+    tipos mezclados quedan como texto. Si un bloque posterior no entra en el
+    tipo del esquema sin perder datos (p.ej. enteros que luego traen
+    decimales) se levanta ValueError: hay que castear en la consulta.
+    """
+    schema = None
+    for batch in batches:
+        values = list(zip(*batch))
+        if schema is None:
+            fields = []
+            for name, col in zip(columns, values):
+                try:
+                    type_ = pa.array(col).type
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    type_ = pa.string()
+                fields.append(pa.field(name, pa.string() if pa.types.is_null(type_) else type_))
+            schema = pa.schema(fields)
+        yield pa.RecordBatch.from_arrays(
+            [_column(pa, f.name, col, f.type) for f, col in zip(schema, values)], schema=schema
+        )
+
+
+def _write_arrow(path: Path, columns: List[str], batches: Iterable[List[tuple]], fmt: str) -> int:
+    pa = _pyarrow()
+
+    def open_writer(schema):
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            return pq.ParquetWriter(path, schema, compression="snappy")
+        return pa.ipc.new_file(path, schema)
+
+    writer, rows = None, 0
+    try:
+        for rb in _record_batches(pa, columns, batches):
+            if writer is None:
+                writer = open_writer(rb.schema)
+            writer.write_batch(rb)
+            rows += rb.num_rows
+        if writer is None:  # sin filas: archivo válido solo con el esquema
+            writer = open_writer(pa.schema([(c, pa.string()) for c in columns]))
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def _check(fmt: str) -> None:
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato no soportado: {fmt} (usa {', '.join(FORMATS)})")
+    if fmt in ("parquet", "arrow"):
+        _pyarrow()  # fallar antes de leer los datos
+
+
+def _write(out: Path, fmt: str, columns: List[str], batches: Iterable[List[tuple]],
+           summary_by: Optional[Sequence[str]]) -> Tuple[int, Dict[str, Any]]:
+    """Escribe los bloques en `out`; devuelve (filas, extras). Borra el archivo si falla."""
+    extra: Dict[str, Any] = {}
+    try:
+        if fmt in ("csv", "csv.gz"):
+            rows = _write_csv(out, columns, batches, compress=fmt == "csv.gz")
+        elif fmt == "excel":
+            extra = write_excel(out, columns, batches, summary_by)
+            rows = extra.pop("rows")
+        else:
+            rows = _write_arrow(out, columns, batches, fmt)
+    except BaseException:
+        out.unlink(missing_ok=True)
+        raise
+    return rows, extra
+
+
+def _stats(out: Path, rows: int, seconds: float, extra: Dict[str, Any]) -> Dict[str, Any]:
+    size = out.stat().st_size
+    return {
+        "path": str(out),
+        "rows": rows,
+        "bytes": size,
+        "seconds": seconds,
+        "rows_per_s": rows / seconds if seconds else 0.0,
+        "mb_per_s": size / 1e6 / seconds if seconds else 0.0,
+        **extra,
+    }
+
+
+def export_query(
+    sql: str,
+    fmt: str = "csv",
+    path: Optional[str] = None,
+    params: tuple = (),
+    batch_rows: int = EXPORT_BATCH_ROWS,
+    summary_by: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Ejecuta `sql` y escribe el resultado por bloques en `path`.
+
+    Args:
+        sql: Consulta SELECT
+        fmt: "csv", "csv.gz", "parquet", "arrow" o "excel"
+        path: Archivo de salida (por defecto data/salida_<fecha>.<ext>)
+        params: Parámetros de la consulta
+        batch_rows: Filas leídas y escritas por bloque
+        summary_by: Solo Excel: columnas con hoja de resumen (p.ej. ["sede"])
+
+    Returns:
+        {"path", "rows", "bytes", "seconds", "rows_per_s", "mb_per_s"}
+        (+ "sheets" en Excel)
+    """
+    _check(fmt)
+    out = Path(path) if path else export_path(extension(fmt))
+    t0 = time.perf_counter()
+    columns, batches = iter_query(sql, params, batch_rows)
+    try:
+        rows, extra = _write(out, fmt, columns, batches, summary_by)
+    finally:
+        batches.close()
+    return _stats(out, rows, time.perf_counter() - t0, extra)
+
+
+def export_frame(
+    df: "pd.DataFrame",
+    fmt: str = "csv",
+    path: Optional[str] = None,
+    batch_rows: int = EXPORT_BATCH_ROWS,
+    summary_by: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Como export_query(), pero a partir de un DataFrame ya cargado (p.ej. un
+    resultado de agent.memory); no toca la base de datos.
+
+    Returns:
+        Las mismas estadísticas que export_query()
+    """
+    _check(fmt)
+    out = Path(path) if path else export_path(extension(fmt))
+    t0 = time.perf_counter()
+    rows, extra = _write(out, fmt, [str(c) for c in df.columns], df_batches(df, batch_rows), summary_by)
+    return _stats(out, rows, time.perf_counter() - t0, extra)
+
+
+def format_stats(stats: Dict[str, Any]) -> str:
+    sheets = f" en {stats['sheets']} hojas" if stats.get("sheets", 1) > 1 else ""
+    return (f"📊 Filas exportadas: {stats['rows']:,}{sheets}\n"
+            f"💾 Tamaño: {stats['bytes'] / 1e6:.2f} MB\n"
+            f"⏱️ {stats['seconds']:.2f}s ({stats['rows_per_s']:,.0f} filas/s, {stats['mb_per_s']:.1f} MB/s)")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m agent.export",
+                                     description="Exporta una consulta en streaming (memoria constante)")
+    parser.add_argument("sql", help="consulta SELECT")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="csv")
+    parser.add_argument("-o", "--output", help="archivo de salida (por defecto data/salida_*)")
+    parser.add_argument("--batch-rows", type=int, default=EXPORT_BATCH_ROWS)
+    parser.add_argument("--resumen", action="append", metavar="COLUMNA",
+                        help="Excel: hoja de resumen por esta columna (repetible, p.ej. --resumen sede)")
+    args = parser.parse_args(argv)
+
+    init_db()
+    stats = export_query(args.sql, args.format, args.output, batch_rows=args.batch_rows, summary_by=args.resumen)
+    print(f"✅ {stats['path']}")
+    print(format_stats(stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# agent/loop.py
+"""
+Event loop de fondo para llamar al agente desde código síncrono (CLI,
+Streamlit, las versiones *_sync de las tools).
+
+asyncio.run() crea y destruye un loop por llamada: se pierden las sesiones
+MCP (un pool por loop), las tareas de fondo y todo lo que quedó ligado al
+loop anterior. Acá vive un único loop en un hilo daemon, creado al primer
+uso; los llamadores síncronos le envían corrutinas y reciben Futures, así
+que esos recursos siguen calientes entre preguntas y todas las sesiones de
+Streamlit comparten el mismo loop.
+
+    from agent.loop import run, iterate
+    respuesta = run(agent.ask("Ventas por sede"))
+    for evento in iterate(agent.stream("Ventas por sede")):
+        ...
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Coroutine, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Loop de fondo; se arranca al primer uso y vive lo que dura el proceso."""
+    global _loop, _thread
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def serve():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            _thread = threading.Thread(target=serve, name="agent-loop", daemon=True)
+            _thread.start()
+            ready.wait()
+            _loop = loop
+        return _loop
+
+
+def submit(coro: Coroutine[Any, Any, T]) -> "Future[T]":
+    """Programa `coro` en el loop de fondo y devuelve un Future (no bloquea)."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+    """
+    Ejecuta `coro` en el loop de fondo y espera el resultado; reemplaza a
+    asyncio.run() en código síncrono.
+
+    Args:
+        coro: Corrutina a ejecutar
+        timeout: Segundos máximos de espera (None = sin límite)
+
+    Returns:
+        Resultado de la corrutina (sus excepciones se propagan)
+    """
+    if threading.current_thread() is _thread:
+        coro.close()
+        raise RuntimeError("agent.loop.run() desde el propio loop de fondo: usar await")
+    future = submit(coro)
+    try:
+        return future.result(timeout)
+    except BaseException:
+        future.cancel()  # timeout o Ctrl+C: no dejar la tarea corriendo
+        raise
+
+
+async def _anext(agen: AsyncIterator[T]) -> Tuple[bool, Optional[T]]:
+    try:
+        return False, await agen.__anext__()
+    except StopAsyncIteration:
+        return True, None
+
+
+def iterate(agen: AsyncIterator[T], timeout: Optional[float] = None) -> Iterator[T]:
+    """
+    Recorre un generador async desde código síncrono; cada elemento se pide
+    al loop de fondo. Si se deja de iterar antes del final, el generador se
+    cierra en el loop.
+
+    Args:
+        agen: Generador async (p.ej. SalesAnalysisAgent.stream(...))
+        timeout: Segundos máximos de espera por elemento
+    """
+    done = False
+    try:
+        while True:
+            done, item = run(_anext(agen), timeout)
+            if done:
+                return
+            yield item
+    finally:
+        aclose = getattr(agen, "aclose", None)
+        if not done and aclose is not None:
+            run(aclose(), timeout)
+
+
+def shutdown(timeout: float = 5.0) -> None:
+    """Cancela las tareas pendientes y detiene el loop (se recrea si se vuelve a usar)."""
+    global _loop, _thread
+    with _lock:
+        loop, thread, _loop, _thread = _loop, _thread, None, None
+    if loop is None:
+        return
+
+    async def drain():
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await loop.shutdown_asyncgens()
+
+    try:
+        asyncio.run_coroutine_threadsafe(drain(), loop).result(timeout)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not thread.is_alive():
+            loop.close()
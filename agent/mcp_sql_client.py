@@ -1,26 +1,78 @@
 # agent/mcp_sql_client.py
 # -*- coding: utf-8 -*-
 """
-Cliente MCP para ejecutar SQL sobre SQLite usando @executeautomation/database-server (Node).
+Cliente MCP para ejecutar SQL sobre SQLite.
+
+Por defecto levanta el servidor del repo (mcp_sqlite_server.py, Python, sin
+red) según configs/mcp.config.json. Sin esa configuración usa
+@executeautomation/database-server (Node vía npx).
 - Tool de lectura:  read_query  (parámetro: query)
-- Otras tools útiles: list_tables, describe_table, export_query (no usadas aquí)
+- Servidor del repo: read_query paginado y en formato compacto (columnas una
+  sola vez + filas como listas) y read_query_batch para varias SELECT en una
+  sola ida y vuelta.
 Seguridad básica: solo permite SELECT.
+
+Las sesiones MCP viven en un pool (MCPSessionPool): cada sesión es un proceso
+del servidor ya inicializado que se reutiliza entre consultas. Varias llamadas
+read_query viajan a la vez por la misma sesión (MCP multiplexa por id de
+petición), con un máximo de MCP_MAX_INFLIGHT por sesión. Un chequeo periódico
+(ping) y los errores de transporte reinician la sesión caída; la llamada que
+falló se reintenta una vez en otra sesión.
+
+    async with MCPSessionPool() as pool:
+        rows, cols = await pool.run_sql("SELECT ...")
+
+run_sql()/list_tables() usan un pool compartido por event loop (get_pool()).
 """
 
 import asyncio
-from contextlib import AsyncExitStack
-from typing import List, Tuple, Sequence, Dict, Any
+import json
+import logging
+import os
+import sys
+import weakref
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
 
-from strands.tools.mcp import MCPClient, ToolFilters
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
-# Comando para levantar el servidor MCP de base de datos (Node)
+logger = logging.getLogger("agent.mcp")
+
+ROOT = Path(__file__).resolve().parents[1]
+MCP_CONFIG_PATH = Path(os.getenv("MCP_CONFIG", str(ROOT / "configs" / "mcp.config.json")))
+MCP_SERVER_NAME = os.getenv("MCP_SERVER", "sqlite")
+
+# Servidor de respaldo si no hay configuración: servidor de base de datos en Node
 MCP_COMMAND = "npx"
 MCP_ARGS = ["-y", "@executeautomation/database-server", "db/ventas.db"]
 
 READ_TOOL_NAME = "read_query"     # según el listado de tools
 READ_TOOL_PARAM = "query"         # parámetro que espera el server para el SQL
+BATCH_TOOL_NAME = "read_query_batch"
+
+POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "2"))
+MAX_INFLIGHT = int(os.getenv("MCP_MAX_INFLIGHT", "4"))            # llamadas simultáneas por sesión
+HEALTH_INTERVAL_S = float(os.getenv("MCP_HEALTH_INTERVAL_S", "30"))
+START_TIMEOUT_S = float(os.getenv("MCP_START_TIMEOUT_S", "60"))    # npx puede descargar el paquete
+CALL_TIMEOUT_S = float(os.getenv("MCP_CALL_TIMEOUT_S", "30"))
+PAGE_ROWS = int(os.getenv("MCP_PAGE_ROWS", "5000"))
+PING_TIMEOUT_S = 5.0
+
+def server_command() -> Tuple[str, List[str]]:
+    """
+    (command, args) del servidor MCP según configs/mcp.config.json; si no
+    existe, el servidor Node. "python" se reemplaza por el intérprete actual
+    para que el servidor use el mismo entorno virtual.
+    """
+    try:
+        entry = json.loads(MCP_CONFIG_PATH.read_text(encoding="utf-8"))[MCP_SERVER_NAME]
+    except (OSError, ValueError, KeyError):
+        return MCP_COMMAND, list(MCP_ARGS)
+    command = entry["command"]
+    if command in ("python", "python3"):
+        command = sys.executable
+    return command, list(entry.get("args", []))
 
 # --- Utilidades internas ------------------------------------------------------
 
@@ -50,37 +102,340 @@ def _normalize_result(result: Any) -> Tuple[List[Tuple], List[str]]:
         # Si rows vienen como dicts y no como tuplas:
         if rows and isinstance(rows[0], dict) and cols:
             rows = [tuple(r.get(c) for c in cols) for r in rows]
+        elif not rows and isinstance(result.get("data"), dict):
+            # Formato columnar: {"columns": [...], "data": {"col": [...]}}
+            rows = list(zip(*(result["data"][c] for c in cols))) if cols else []
+        else:
+            rows = [tuple(r) for r in rows]
         return rows, cols
 
     # Fallback
     return [], []
 
-async def _open_mcp_client(allow_patterns: Sequence[str] = (r".*query.*", r".*tables.*")) -> MCPClient:
+def _decode(result: Any) -> Any:
     """
-    Abre transporte stdio hacia el server MCP y devuelve un MCPClient listo.
+    Contenido útil de un CallToolResult: el structured content si viene,
+    si no el texto (JSON cuando se puede). Lanza RuntimeError si la tool falló.
     """
-    stack = AsyncExitStack()
-    await stack.enter_async_context(stack)  # para que el stack se cierre aunque retornemos el cliente
+    texts = [getattr(c, "text", "") for c in (getattr(result, "content", None) or [])]
+    text = "".join(t for t in texts if t)
+    if getattr(result, "is_error", None) or getattr(result, "isError", None):
+        raise RuntimeError(text or "la tool MCP devolvió un error")
+    structured = getattr(result, "structured_content", None)
+    if structured is None:
+        structured = getattr(result, "structuredContent", None)
+    if structured is not None:
+        # Las tools que devuelven listas o strings llegan envueltas como {"result": ...}
+        if isinstance(structured, dict) and set(structured) == {"result"}:
+            structured = structured["result"]
+        if not isinstance(structured, str):
+            return structured
+        text = structured
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
 
-    params = StdioServerParameters(command=MCP_COMMAND, args=MCP_ARGS)
-    read_stream, write_stream = await stack.enter_async_context(stdio_client(params))
 
-    client = MCPClient((read_stream, write_stream),
-                       tool_filters=ToolFilters(allow=list(allow_patterns)))
-    await client.initialize()
+class _SessionDead(Exception):
+    """El proceso del servidor o su transporte stdio ya no responde."""
 
-    # Guardar el stack en el cliente para que no se cierre al salir de la función
-    # y poder cerrar con close_mcp_client(client)
-    client._stack = stack  # atributo privado ad-hoc
-    return client
 
-async def _close_mcp_client(client: MCPClient) -> None:
-    try:
-        await client.close()
-    finally:
-        stack = getattr(client, "_stack", None)
-        if stack is not None:
-            await stack.aclose()
+class _Session:
+    """
+    Una sesión MCP sobre un proceso del servidor. El transporte stdio usa task
+    groups de anyio, que deben abrirse y cerrarse en la misma tarea: por eso la
+    sesión vive dentro de su propia tarea (_run) hasta que se pide cerrarla.
+    """
+
+    def __init__(self, params: StdioServerParameters, index: int, max_inflight: int):
+        self.params = params
+        self.index = index
+        self.slots = asyncio.Semaphore(max_inflight)
+        self.inflight = 0
+        self.tools: Set[str] = set()
+        self.session: Optional[ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Future] = None
+        self._stop: Optional[asyncio.Event] = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def start(self, timeout: float = START_TIMEOUT_S) -> None:
+        loop = asyncio.get_running_loop()
+        self._ready = loop.create_future()
+        self._stop = asyncio.Event()
+        self._task = loop.create_task(self._run(), name=f"mcp-session-{self.index}")
+        try:
+            await asyncio.wait_for(asyncio.shield(self._ready), timeout)
+        except BaseException:
+            await self.close()
+            raise
+
+    async def _run(self) -> None:
+        try:
+            async with stdio_client(self.params) as (read_stream, write_stream):
+                async with ClientSession(read_stream, write_stream) as session:
+                    await session.initialize()
+                    listing = await session.list_tools()
+                    self.tools = {t.name for t in listing.tools}
+                    self.session = session
+                    self._ready.set_result(None)
+                    await self._stop.wait()
+        except asyncio.CancelledError:
+            if not self._ready.done():
+                self._ready.cancel()
+            raise
+        except Exception as e:
+            if not self._ready.done():
+                self._ready.set_exception(e)
+            else:
+                logger.warning("sesión MCP %d terminó: %s", self.index, e)
+        finally:
+            self.session = None
+
+    async def call(self, name: str, arguments: Dict[str, Any], timeout: float = CALL_TIMEOUT_S) -> Any:
+        session = self.session
+        if session is None or not self.healthy:
+            raise _SessionDead(f"sesión {self.index} caída")
+        try:
+            result = await asyncio.wait_for(session.call_tool(name, arguments), timeout)
+        except Exception as e:
+            # Un error de la tool llega como is_error; una excepción puede ser el transporte.
+            if not await self.ping():
+                raise _SessionDead(str(e)) from e
+            raise
+        return _decode(result)
+
+    async def ping(self) -> bool:
+        session = self.session
+        if session is None or not self.healthy:
+            return False
+        try:
+            await asyncio.wait_for(session.send_ping(), PING_TIMEOUT_S)
+            return True
+        except Exception:
+            return False
+
+    async def close(self) -> None:
+        task, self._task = self._task, None
+        self.session = None
+        if task is None:
+            return
+        if self._stop is not None:
+            self._stop.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(task), 5.0)
+        except BaseException:
+            task.cancel()
+            try:
+                await task
+            except BaseException:
+                pass
+
+
+class MCPSessionPool:
+    """
+    Pool de sesiones MCP de larga vida con chequeo de salud, reinicio
+    automático y concurrencia acotada (size × max_inflight llamadas a la vez).
+    """
+
+    def __init__(
+        self,
+        command: Optional[str] = None,
+        args: Optional[Sequence[str]] = None,
+        size: int = POOL_SIZE,
+        max_inflight: int = MAX_INFLIGHT,
+        health_interval_s: float = HEALTH_INTERVAL_S,
+        env: Optional[Dict[str, str]] = None,
+    ):
+        if command is None:
+            command, default_args = server_command()
+            args = default_args if args is None else args
+        # Las rutas de la configuración son relativas a la raíz del repo
+        params = StdioServerParameters(command=command, args=list(args or ()), env=env, cwd=str(ROOT))
+        self.size = max(1, size)
+        self.health_interval_s = health_interval_s
+        self._sessions = [_Session(params, i, max(1, max_inflight)) for i in range(self.size)]
+        self._restart_locks = [asyncio.Lock() for _ in self._sessions]
+        self._slots = asyncio.Semaphore(self.size * max(1, max_inflight))
+        self._health_task: Optional[asyncio.Task] = None
+        self._started = False
+        self.restarts = 0
+
+    async def __aenter__(self) -> "MCPSessionPool":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        results = await asyncio.gather(*(s.start() for s in self._sessions), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if len(errors) == len(results):
+            self._started = False
+            raise RuntimeError(f"No se pudo iniciar el servidor MCP: {errors[0]}") from errors[0]
+        for e in errors:
+            logger.warning("sesión MCP no inició (se reintenta al usarla): %s", e)
+        if self.health_interval_s > 0:
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop(), name="mcp-health")
+
+    async def aclose(self) -> None:
+        self._started = False
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except BaseException:
+                pass
+            self._health_task = None
+        await asyncio.gather(*(s.close() for s in self._sessions))
+
+    @property
+    def tools(self) -> Set[str]:
+        for s in self._sessions:
+            if s.healthy:
+                return set(s.tools)
+        return set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": self.size,
+            "healthy": sum(s.healthy for s in self._sessions),
+            "inflight": [s.inflight for s in self._sessions],
+            "restarts": self.restarts,
+        }
+
+    async def _restart(self, s: _Session) -> None:
+        async with self._restart_locks[s.index]:
+            if s.healthy and await s.ping():
+                return  # otra llamada ya la reinició
+            logger.warning("reiniciando sesión MCP %d", s.index)
+            await s.close()
+            self.restarts += 1
+            await s.start()
+
+    async def _pick(self) -> _Session:
+        healthy = [s for s in self._sessions if s.healthy]
+        if healthy:
+            return min(healthy, key=lambda s: s.inflight)
+        s = min(self._sessions, key=lambda s: s.inflight)
+        await self._restart(s)
+        return s
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval_s)
+            for s in self._sessions:
+                if s.inflight == 0 and not await s.ping():
+                    try:
+                        await self._restart(s)
+                    except Exception as e:
+                        logger.warning("no se pudo reiniciar la sesión MCP %d: %s", s.index, e)
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None,
+                        timeout: float = CALL_TIMEOUT_S) -> Any:
+        """Llama una tool en la sesión menos cargada; si la sesión murió, reintenta una vez."""
+        if not self._started:
+            await self.start()
+        async with self._slots:
+            for attempt in (0, 1):
+                s = await self._pick()
+                async with s.slots:
+                    s.inflight += 1
+                    try:
+                        return await s.call(name, arguments or {}, timeout)
+                    except _SessionDead:
+                        if attempt:
+                            raise RuntimeError("El servidor MCP no responde") from None
+                        await self._restart(s)
+                    finally:
+                        s.inflight -= 1
+
+    @property
+    def paged(self) -> bool:
+        """El servidor entiende format/offset/limit y read_query_batch (servidor del repo)."""
+        return BATCH_TOOL_NAME in self.tools
+
+    async def run_sql(self, sql: str) -> Tuple[List[Tuple], List[str]]:
+        if not _is_select(sql):
+            raise ValueError("Solo se permiten consultas SELECT por seguridad.")
+        if not self._started:
+            await self.start()
+        if not self.paged:
+            result = await self.call_tool(READ_TOOL_NAME, {READ_TOOL_PARAM: sql})
+            return _normalize_result(result)
+
+        rows: List[Tuple] = []
+        offset: Optional[int] = 0
+        while offset is not None:
+            page = await self.call_tool(READ_TOOL_NAME, {READ_TOOL_PARAM: sql, "offset": offset, "limit": PAGE_ROWS})
+            page_rows, cols = _normalize_result(page)
+            rows.extend(page_rows)
+            offset = page.get("next_offset")
+        return rows, cols
+
+    async def run_sql_batch(self, sqls: Sequence[str]) -> List[Tuple[List[Tuple], List[str]]]:
+        """
+        Varias SELECT en una sola llamada (read_query_batch); con otros
+        servidores se lanzan en paralelo. Cada resultado es (rows, cols).
+        """
+        for sql in sqls:
+            if not _is_select(sql):
+                raise ValueError("Solo se permiten consultas SELECT por seguridad.")
+        if not self._started:
+            await self.start()
+        if not self.paged:
+            return list(await asyncio.gather(*(self.run_sql(s) for s in sqls)))
+
+        result = await self.call_tool(BATCH_TOOL_NAME, {"queries": list(sqls), "limit": PAGE_ROWS})
+        out = []
+        for sql, page in zip(sqls, result["results"]):
+            if "error" in page:
+                raise RuntimeError(f"{page['error']} (en: {sql})")
+            if page.get("next_offset") is not None:
+                out.append(await self.run_sql(sql))  # resultado más grande que una página
+            else:
+                out.append(_normalize_result(page))
+        return out
+
+    async def list_tables(self) -> List[str]:
+        if not self._started:
+            await self.start()
+        if "list_tables" not in self.tools:
+            return []
+        result = await self.call_tool("list_tables", {})
+        # El server suele devolver lista de nombres o lista de dicts con 'name'
+        if isinstance(result, list):
+            if result and isinstance(result[0], dict):
+                return [r.get("name") or r.get("table") for r in result]
+            return [str(r) for r in result]
+        return []
+
+
+# Un pool por event loop: las sesiones (tareas y streams) pertenecen a un loop.
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, MCPSessionPool]" = weakref.WeakKeyDictionary()
+
+async def get_pool() -> MCPSessionPool:
+    """Pool compartido del event loop actual; se inicia al primer uso."""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = _pools[loop] = MCPSessionPool()
+    await pool.start()
+    return pool
+
+async def close_pool() -> None:
+    """Cierra el pool compartido del event loop actual (se recrea si se vuelve a usar)."""
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.aclose()
 
 # --- API pública --------------------------------------------------------------
 
@@ -91,46 +446,38 @@ async def run_sql(sql: str) -> Tuple[List[Tuple], List[str]]:
     """
     if not _is_select(sql):
         raise ValueError("Solo se permiten consultas SELECT por seguridad.")
-
-    client = await _open_mcp_client()
-    try:
-        # Llamada a la tool real del server: read_query(query=...)
-        payload = {READ_TOOL_PARAM: sql}
-        result = await client.call_tool(READ_TOOL_NAME, payload)
-        rows, cols = _normalize_result(result)
-        return rows, cols
-    finally:
-        await _close_mcp_client(client)
+    pool = await get_pool()
+    return await pool.run_sql(sql)
 
 async def list_tables() -> List[str]:
     """
     Devuelve el listado de tablas disponibles usando la tool list_tables (si existe).
     """
-    client = await _open_mcp_client()
-    try:
-        if "list_tables" not in client.tools:
-            return []
-        result = await client.call_tool("list_tables", {})
-        # El server suele devolver lista de nombres o lista de dicts con 'name'
-        if isinstance(result, list):
-            if result and isinstance(result[0], dict):
-                return [r.get("name") or r.get("table") for r in result]
-            return [str(r) for r in result]
-        return []
-    finally:
-        await _close_mcp_client(client)
+    pool = await get_pool()
+    return await pool.list_tables()
+
+async def run_sql_batch(sqls: Sequence[str]) -> List[Tuple[List[Tuple], List[str]]]:
+    """
+    Ejecuta varias SELECT en una sola ida y vuelta al servidor; devuelve
+    [(rows, cols), ...] en el mismo orden.
+    """
+    pool = await get_pool()
+    return await pool.run_sql_batch(sqls)
 
 def run_sql_sync(sql: str) -> Tuple[List[Tuple], List[str]]:
     """
     Versión síncrona (útil para pruebas rápidas desde otros módulos).
+    Corre en el loop de fondo de agent.loop, así que el pool de sesiones
+    queda abierto y las llamadas siguientes lo reutilizan.
     """
-    return asyncio.run(run_sql(sql))
+    from agent.loop import run
+    return run(run_sql(sql))
 
 # --- Ejecución directa para prueba -------------------------------------------
 
-if __name__ == "__main__":
+if __name__ == "__main__":  # python -m agent.mcp_sql_client
     q = "SELECT producto, SUM(cantidad) AS total_vendido FROM ventas GROUP BY producto ORDER BY total_vendido DESC LIMIT 5;"
-    rows, cols = asyncio.run(run_sql(q))
+    rows, cols = run_sql_sync(q)
     print("Columns:", cols)
     for r in rows:
         print(r)
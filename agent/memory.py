@@ -1,4 +1,195 @@
+# agent/memory.py
+"""
+Memoria de trabajo de la conversación.
+
+Las tools guardan acá los resultados que ya materializaron (DataFrames) bajo
+un handle m_xxxxxxxx que informan en su respuesta. En un seguimiento ("ahora
+en torta", "exporta eso a Excel") el modelo pasa ese handle en lugar del SQL
+y generate_chart / export_to_file usan el DataFrame guardado sin volver a la
+base de datos. Los datos son los del momento de la consulta original.
+
+Cada SalesAnalysisAgent tiene su propia Memory (una por sesión) y la activa
+durante ask() con use(); fuera de un agente (tools *_sync) se usa MEMORY.
+
+Límites:
+- MEMORY_MAX_BYTES: bytes en RAM; al pasarse, los resultados menos usados
+  recientemente se vuelcan a disco (pickle en un directorio temporal).
+- MEMORY_DISK_MAX_BYTES / MEMORY_MAX_ITEMS: al pasarse, se olvidan los más
+  viejos.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import secrets
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, NamedTuple, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+MEMORY_MAX_BYTES = int(os.getenv("MEMORY_MAX_BYTES", str(32 * 1024 * 1024)))
+MEMORY_DISK_MAX_BYTES = int(os.getenv("MEMORY_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+MEMORY_MAX_ITEMS = int(os.getenv("MEMORY_MAX_ITEMS", "16"))
+
+_HANDLE_RE = re.compile(r"m_[0-9a-f]{8}")
+
+
+def is_handle(text: Any) -> bool:
+    """True si `text` es un handle de la memoria (m_xxxxxxxx) y no SQL."""
+    return isinstance(text, str) and _HANDLE_RE.fullmatch(text.strip()) is not None
+
+
+class Entry(NamedTuple):
+    handle: str
+    sql: str
+    version: str  # db.data_version() al consultar
+    rows: int
+    bytes: int
+    path: Optional[Path]  # None mientras está en RAM
+
+
 class Memory:
-    def __init__(self):
-        self.last_sql = None
-        self.last_result = None
+    """Resultados recientes de una conversación, acotados en RAM y en disco (LRU)."""
+
+    def __init__(self, max_bytes: int = MEMORY_MAX_BYTES, disk_max_bytes: int = MEMORY_DISK_MAX_BYTES,
+                 max_items: int = MEMORY_MAX_ITEMS):
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.max_items = max_items
+        self._entries: "OrderedDict[str, Entry]" = OrderedDict()
+        self._frames: Dict[str, pd.DataFrame] = {}  # solo las que están en RAM
+        self._dir: Optional[Path] = None
+        self._lock = threading.Lock()
+
+    # ---------------- API ----------------
+    def put(self, df: pd.DataFrame, sql: str, version: str) -> str:
+        """
+        Guarda el resultado de `sql` y devuelve su handle. Si el mismo SQL con
+        la misma versión de datos ya está guardado, reutiliza el handle.
+        """
+        from agent.cache import normalize_sql
+
+        sql = normalize_sql(sql)
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.sql == sql and entry.version == version:
+                    self._entries.move_to_end(entry.handle)
+                    return entry.handle
+            handle = f"m_{secrets.token_hex(4)}"
+            self._entries[handle] = Entry(handle, sql, version, len(df), size, None)
+            self._frames[handle] = df
+            if size > self.max_bytes:  # no cabe en RAM: directo a disco
+                self._spill(handle)
+            self._enforce()
+            return handle
+
+    def entry(self, handle: str) -> Optional[Entry]:
+        with self._lock:
+            return self._entries.get(handle.strip())
+
+    def get(self, handle: str) -> Optional[pd.DataFrame]:
+        """DataFrame guardado bajo `handle` (leído de disco si se volcó), o None si se olvidó."""
+        handle = handle.strip()
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                return None
+            self._entries.move_to_end(handle)
+            df = self._frames.get(handle)
+        if df is None:
+            import pandas as pd
+            try:
+                df = pd.read_pickle(entry.path)
+            except FileNotFoundError:  # se olvidó mientras se leía
+                return None
+        # Copia superficial: quien agregue columnas no altera la guardada
+        return df.copy(deep=False)
+
+    @property
+    def last_sql(self) -> Optional[str]:
+        with self._lock:
+            return next(reversed(self._entries.values())).sql if self._entries else None
+
+    @property
+    def last_result(self) -> Optional[pd.DataFrame]:
+        with self._lock:
+            handle = next(reversed(self._entries), None)
+        return None if handle is None else self.get(handle)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._frames.clear()
+            folder, self._dir = self._dir, None
+        if folder is not None:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "items": len(self._entries),
+                "ram_bytes": sum(e.bytes for e in self._entries.values() if e.path is None),
+                "disk_bytes": sum(e.bytes for e in self._entries.values() if e.path is not None),
+            }
+
+    # ---------------- Límites (con el lock tomado) ----------------
+    def _spill(self, handle: str) -> None:
+        if self._dir is None:
+            self._dir = Path(tempfile.mkdtemp(prefix="agent-memoria-"))
+            weakref.finalize(self, shutil.rmtree, str(self._dir), True)
+        path = self._dir / f"{handle}.pkl"
+        self._frames.pop(handle).to_pickle(path)
+        self._entries[handle] = self._entries[handle]._replace(path=path)
+
+    def _forget(self, handle: str) -> None:
+        entry = self._entries.pop(handle)
+        self._frames.pop(handle, None)
+        if entry.path is not None:
+            entry.path.unlink(missing_ok=True)
+
+    def _enforce(self) -> None:
+        while len(self._entries) > self.max_items:
+            self._forget(next(iter(self._entries)))
+        ram = sum(e.bytes for e in self._entries.values() if e.path is None)
+        for handle, entry in list(self._entries.items()):  # de menos a más reciente
+            if ram <= self.max_bytes:
+                break
+            if entry.path is None:
+                self._spill(handle)
+                ram -= entry.bytes
+        disk = sum(e.bytes for e in self._entries.values() if e.path is not None)
+        for handle, entry in list(self._entries.items()):
+            if disk <= self.disk_max_bytes:
+                break
+            if entry.path is not None:
+                self._forget(handle)
+                disk -= entry.bytes
+
+
+MEMORY = Memory()
+_CURRENT: ContextVar[Memory] = ContextVar("agent_memory", default=MEMORY)
+
+
+def current() -> Memory:
+    """Memoria de la conversación en curso (la del agente dentro de ask())."""
+    return _CURRENT.get()
+
+
+@contextmanager
+def use(memory: Memory) -> Iterator[Memory]:
+    """Activa `memory` para las tools llamadas dentro del bloque (y sus tareas hijas)."""
+    token = _CURRENT.set(memory)
+    try:
+        yield memory
+    finally:
+        _CURRENT.reset(token)
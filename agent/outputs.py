@@ -1,12 +1,28 @@
 # agent/outputs.py
+# matplotlib (vía agent.charts) y pandas se importan al primer uso: importar
+# este módulo no debe cargar el stack de gráficos (ver scripts/startup_budget.py).
+from __future__ import annotations
+
+import hashlib
 import os
 import time
-import pandas as pd
-import matplotlib.pyplot as plt
+import uuid
 from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 DATA_DIR = Path("data")
-DATA_DIR.mkdir(parents=True, exist_ok=True)
+
+# Filas por hoja en Excel (incluye el encabezado)
+EXCEL_MAX_ROWS = 1_048_576
+# Hojas de resumen de write_excel: columnas que no se suman
+_NOT_SUMMED = {"id", "precio"}
+
+def _data_dir() -> Path:
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    return DATA_DIR
 
 def render_table(df: pd.DataFrame, save_csv: bool = False) -> None:
     if df.empty:
@@ -14,65 +30,131 @@ def render_table(df: pd.DataFrame, save_csv: bool = False) -> None:
         return
     print(df.to_string(index=False))
     if save_csv:
-        path = DATA_DIR / "ultima_tabla.csv"
+        path = _data_dir() / "ultima_tabla.csv"
         df.to_csv(path, index=False)
         print(f"💾 Tabla guardada en: {path}")
 
 def _timestamp() -> str:
-    return time.strftime("%Y%m%d_%H%M%S")
+    # Sufijo aleatorio: varias preguntas pueden generar archivos en el mismo segundo
+    return f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+def export_path(ext: str) -> Path:
+    return _data_dir() / f"salida_{_timestamp()}.{ext}"
+
+def frame_digest(df: pd.DataFrame) -> str:
+    """Hash del contenido del DataFrame (columnas y valores): clave en agent.artifacts."""
+    import pandas as pd
+
+    h = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    h.update("\x1f".join(map(str, df.columns)).encode("utf-8"))
+    return h.hexdigest()
 
 def render_chart(df: pd.DataFrame, chart: str, x: str, y: str, title: str = "") -> str:
     if df.empty:
         print("⚠️  Sin datos para graficar.")
         return ""
 
-    outfile = DATA_DIR / f"grafico_{chart}_{_timestamp()}.png"
-
-    if chart == "pie":
-        # Para pie usamos la primera columna como labels y la segunda como values
-        labels = df[x].astype(str).tolist()
-        values = df[y].values.tolist()
-        plt.figure()
-        plt.pie(values, labels=labels, autopct="%1.1f%%")
-        plt.title(title or f"{y} por {x}")
-        plt.tight_layout()
-        plt.savefig(outfile, dpi=120)
-        plt.close()
-    elif chart == "line":
-        plt.figure()
-        plt.plot(df[x], df[y], marker="o")
-        plt.title(title or f"{y} vs {x}")
-        plt.xlabel(x)
-        plt.ylabel(y)
-        plt.xticks(rotation=45, ha="right")
-        plt.tight_layout()
-        plt.savefig(outfile, dpi=120)
-        plt.close()
-    else:  # bar (default)
-        plt.figure()
-        plt.bar(df[x].astype(str), df[y])
-        plt.title(title or f"{y} por {x}")
-        plt.xlabel(x)
-        plt.ylabel(y)
-        plt.xticks(rotation=45, ha="right")
-        plt.tight_layout()
-        plt.savefig(outfile, dpi=120)
-        plt.close()
-
-    print(f"📊 Gráfico guardado en: {outfile}")
-    return str(outfile)
+    # Figure + Agg en el pool de agent.charts (sin el estado global de pyplot);
+    # el mismo DataFrame con las mismas opciones reutiliza el archivo
+    from agent.artifacts import ARTIFACTS
+    from agent.charts import render, render_options
+
+    def build(path: Path) -> Dict[str, object]:
+        render(df, chart, x=x, y=y, title=title, out=path, fmt="png")
+        return {"rows": len(df)}
+
+    options = {"chart": chart, "x": x, "y": y, "title": title, "format": "png", **render_options()}
+    artifact = ARTIFACTS.get_or_create("chart", frame_digest(df), "", options, "png", build)
+    print(f"📊 Gráfico guardado en: {artifact.path}")
+    return artifact.path
+
+def _summary_sheets(wb, columns: List[str], groups: Dict[str, Dict], value_cols: List[int]) -> None:
+    for col, totals in groups.items():
+        ws = wb.create_sheet(f"Resumen por {col}"[:31])
+        ws.append([col, "filas"] + [columns[i] for i in value_cols])
+        for key in sorted(totals, key=lambda k: (k is None, str(k))):
+            ws.append([key] + totals[key])
+
+def write_excel(
+    path: Path,
+    columns: Sequence[str],
+    batches: Iterable[Sequence[tuple]],
+    summary_by: Optional[Sequence[str]] = None,
+    max_rows: int = EXCEL_MAX_ROWS,
+) -> Dict[str, object]:
+    """
+    Escribe filas en un .xlsx con el modo write-only de openpyxl: cada fila se
+    serializa al agregarse y la memoria no depende del total. Al llegar al
+    límite de filas de Excel se abre otra hoja ("Datos 2", ...).
+
+    Args:
+        path: Archivo de salida
+        columns: Encabezado
+        batches: Bloques de filas (p.ej. de db.iter_query)
+        summary_by: Columnas con hoja de resumen (filas y sumas de las columnas
+                    numéricas por valor), calculadas en la misma pasada
+        max_rows: Filas por hoja, encabezado incluido
+
+    Returns:
+        {"rows": filas escritas, "sheets": hojas de datos}
+    """
+    from openpyxl import Workbook
+
+    columns = list(columns)
+    group_idx = {c: columns.index(c) for c in summary_by or () if c in columns}
+    groups: Dict[str, Dict] = {c: {} for c in group_idx}
+    value_cols: Optional[List[int]] = None
+
+    wb = Workbook(write_only=True)
+    ws, sheets, in_sheet, rows = None, 0, max_rows, 0
+    for batch in batches:
+        if value_cols is None and batch and group_idx:
+            value_cols = [i for i, v in enumerate(batch[0])
+                          if isinstance(v, (int, float)) and columns[i] not in _NOT_SUMMED and i not in group_idx.values()]
+        for row in batch:
+            if in_sheet >= max_rows:
+                sheets += 1
+                ws = wb.create_sheet("Datos" if sheets == 1 else f"Datos {sheets}")
+                ws.append(columns)
+                in_sheet = 1
+            ws.append(row)
+            in_sheet += 1
+            for col, i in group_idx.items():
+                acc = groups[col].get(row[i])
+                if acc is None:
+                    acc = groups[col][row[i]] = [0] + [0] * len(value_cols)
+                acc[0] += 1
+                for j, k in enumerate(value_cols, 1):
+                    acc[j] += row[k] or 0
+        rows += len(batch)
+    if ws is None:  # sin filas: solo el encabezado
+        sheets = 1
+        wb.create_sheet("Datos").append(columns)
+    if groups:
+        _summary_sheets(wb, columns, groups, value_cols or [])
+    wb.save(path)
+    return {"rows": rows, "sheets": sheets}
+
+def df_batches(df: pd.DataFrame, size: int = 50_000):
+    """Filas del DataFrame por bloques, con NaN → celda vacía."""
+    for start in range(0, len(df), size):
+        chunk = df.iloc[start:start + size].astype(object)
+        yield list(chunk.where(chunk.notna(), None).itertuples(index=False, name=None))
 
 def save_file(df: pd.DataFrame, mode: str) -> str:
     if df.empty:
         print("⚠️  Nada que guardar.")
         return ""
-    if mode == "excel":
-        out = DATA_DIR / f"salida_{_timestamp()}.xlsx"
-        df.to_excel(out, index=False)
-        print(f"💾 Excel guardado en: {out}")
-        return str(out)
-    # CSV por defecto
-    out = DATA_DIR / f"salida_{_timestamp()}.csv"
-    df.to_csv(out, index=False)
-    print(f"💾 CSV guardado en: {out}")
-    return str(out)
+    from agent.artifacts import ARTIFACTS
+
+    def build(path: Path) -> Dict[str, object]:
+        if mode == "excel":
+            write_excel(path, [str(c) for c in df.columns], df_batches(df))
+        else:
+            df.to_csv(path, index=False)
+        return {"rows": len(df)}
+
+    ext = "xlsx" if mode == "excel" else "csv"  # CSV por defecto
+    artifact = ARTIFACTS.get_or_create("export", frame_digest(df), "", {"format": ext}, ext, build)
+    print(f"💾 {'Excel' if mode == 'excel' else 'CSV'} guardado en: {artifact.path}")
+    return artifact.path
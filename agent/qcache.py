@@ -0,0 +1,166 @@
+# agent/qcache.py
+"""
+Caché persistente pregunta → plan de herramientas.
+
+Las preguntas repetidas (p.ej. los botones de ejemplo de Streamlit) no
+necesitan volver a Bedrock: la primera vez se guarda el plan que produjo el
+modelo (las tools llamadas con sus argumentos: SQL, tipo de gráfico, formato de
+exportación) y en los aciertos se re-ejecutan esas tools localmente contra los
+datos actuales y se arma una respuesta con sus salidas.
+
+La clave es la pregunta normalizada (minúsculas, sin tildes ni puntuación, como
+sql_gen._norm) más las entidades extraídas: sede, N, rango de fechas, tipo de
+gráfico y formato. Así "ventas de hoy" cambia de clave cada día.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from agent.sql_gen import _norm, _extract_entities, _want_chart, _want_file
+from agent.memory import is_handle
+
+QCACHE_ENABLED = os.getenv("QUESTION_CACHE", "true").lower() != "false"
+QCACHE_PATH = Path(os.getenv("QUESTION_CACHE_DB", "data/question_cache.sqlite"))
+QCACHE_TTL_S = float(os.getenv("QUESTION_CACHE_TTL_S", "0"))  # 0 = sin expiración
+
+# Tools que se pueden re-ejecutar tal cual (fetch_rows depende de un handle vivo)
+REPLAYABLE = ("query_database", "generate_chart", "export_to_file", "get_database_schema")
+
+# Preguntas que dependen de la conversación anterior: no se cachean ni se responden de caché
+_FOLLOW_UP_RE = re.compile(
+    r"^(y|e|pero|ahora|tambien|igual|lo mismo|eso|esos|esas|esa|ese|el mismo|la misma|"
+    r"otra vez|de nuevo|mismo|misma)\b"
+    r"|\b(anterior|lo mismo|eso mismo|esos datos|esa consulta|ese grafico|esa tabla)\b"
+)
+_PUNCT_RE = re.compile(r"[^\w\s\-:/]")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Minúsculas, sin tildes, sin signos de puntuación y con espacios colapsados."""
+    return _SPACES_RE.sub(" ", _PUNCT_RE.sub(" ", _norm(question))).strip()
+
+
+def entities(norm: str) -> Dict[str, Any]:
+    ent = _extract_entities(norm)
+    return {
+        "sede": ent.city,
+        "n": 5 if ent.n is None else ent.n,
+        "desde": ent.dfrom,
+        "hasta": ent.dto,
+        "grafico": _want_chart(norm),
+        "archivo": _want_file(norm),
+    }
+
+
+def is_follow_up(norm: str) -> bool:
+    return bool(_FOLLOW_UP_RE.search(norm))
+
+
+def question_key(question: str) -> str:
+    norm = normalize_question(question)
+    payload = json.dumps([norm, entities(norm)], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def tool_calls(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Tools llamadas en los mensajes de un turno de Strands, en orden:
+    [{"tool", "input", "ok", "output"}]. ok=False si la tool falló o no tuvo resultado.
+    """
+    calls: Dict[str, Dict[str, Any]] = {}
+    for msg in messages:
+        for block in msg.get("content", []):
+            if "toolUse" in block:
+                use = block["toolUse"]
+                calls[use["toolUseId"]] = {"tool": use["name"], "input": use.get("input") or {}, "ok": False, "output": ""}
+            elif "toolResult" in block:
+                res = block["toolResult"]
+                call = calls.get(res["toolUseId"])
+                if call is None:
+                    continue
+                text = "".join(c.get("text", "") for c in res.get("content", []))
+                call["output"] = text
+                call["ok"] = res.get("status") == "success" and not text.lstrip().startswith("❌")
+    return list(calls.values())
+
+
+def plan_from_messages(messages: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Extrae de los mensajes de un turno de Strands las tools llamadas y sus
+    argumentos. Devuelve None si el turno no es re-ejecutable: alguna tool
+    falló, se usó una tool no reproducible o no se consultaron datos.
+    """
+    calls = tool_calls(messages)
+    if not calls or not all(c["ok"] for c in calls):
+        return None
+    plan = [{"tool": c["tool"], "input": c["input"]} for c in calls]
+    if any(step["tool"] not in REPLAYABLE for step in plan):
+        return None
+    if all(step["tool"] == "get_database_schema" for step in plan):
+        return None
+    # Un handle de agent.memory solo vale en la conversación que lo creó
+    if any(is_handle(step["input"].get("sql_query")) for step in plan):
+        return None
+    return plan
+
+
+class QuestionCache:
+    """Tabla SQLite clave → plan. Segura para varios hilos."""
+
+    def __init__(self, path: Path = QCACHE_PATH, ttl_s: float = QCACHE_TTL_S):
+        self.path = Path(path)
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS preguntas ("
+            "key TEXT PRIMARY KEY, question TEXT, norm TEXT, entities TEXT, plan TEXT, "
+            "answer TEXT, hits INTEGER DEFAULT 0, created_at REAL, last_hit_at REAL)"
+        )
+        return conn
+
+    def get(self, question: str) -> Optional[List[Dict[str, Any]]]:
+        """Plan guardado para la pregunta, o None."""
+        key = question_key(question)
+        with self._lock, closing(self._connect()) as conn:
+            row = conn.execute("SELECT plan, created_at FROM preguntas WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl_s and time.time() - row[1] > self.ttl_s:
+                conn.execute("DELETE FROM preguntas WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE preguntas SET hits = hits + 1, last_hit_at = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, question: str, plan: List[Dict[str, Any]], answer: str = "") -> None:
+        norm = normalize_question(question)
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO preguntas(key, question, norm, entities, plan, answer, hits, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0, ?)",
+                (question_key(question), question, norm, json.dumps(entities(norm), ensure_ascii=False),
+                 json.dumps(plan, ensure_ascii=False), answer, time.time()),
+            )
+
+    def invalidate(self, question: str) -> None:
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute("DELETE FROM preguntas WHERE key = ?", (question_key(question),))
+
+    def clear(self) -> None:
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute("DELETE FROM preguntas")
+
+
+QUESTION_CACHE = QuestionCache()
@@ -0,0 +1,156 @@
+# agent/results.py
+"""
+Resultados paginados del lado del servidor.
+
+query_database ya no materializa todo el resultado: abre un cursor en vivo,
+devuelve una vista previa y un handle. fetch_rows(handle, offset, limit) lee
+del cursor solo hasta donde se necesite; las filas ya leídas se vuelcan a una
+base temporal en disco para poder volver a páginas anteriores sin re-ejecutar.
+"""
+
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+from agent.db import DB_PATH, connect_ro, execute
+from agent.workload import RECORDER
+
+PREVIEW_ROWS = int(os.getenv("QUERY_PREVIEW_ROWS", "20"))
+FETCH_MAX_ROWS = int(os.getenv("QUERY_FETCH_MAX_ROWS", "200"))
+MAX_HANDLES = int(os.getenv("QUERY_MAX_HANDLES", "16"))
+HANDLE_TTL_S = float(os.getenv("QUERY_HANDLE_TTL_S", "900"))
+_READ_BATCH = 500
+
+
+class ResultHandle:
+    """Cursor abierto sobre un SELECT más el volcado de las filas ya leídas."""
+
+    def __init__(self, handle_id: str, sql: str, params: Sequence = ()):
+        self.id = handle_id
+        self.sql = sql
+        self.params = tuple(params)
+        self._conn = connect_ro(DB_PATH)
+        t0 = time.perf_counter()
+        self._cursor, self._executed = execute(self._conn, sql, self.params)
+        self._seconds = time.perf_counter() - t0
+        self._recorded = False
+        self.columns: List[str] = [d[0] for d in self._cursor.description or ()]
+        # "" = base temporal privada en disco; SQLite la borra al cerrarla
+        self._spill = sqlite3.connect("", check_same_thread=False)
+        cols = ", ".join(f"c{i}" for i in range(len(self.columns))) or "c0"
+        self._spill.execute(f"CREATE TABLE filas ({cols})")
+        self._insert = f"INSERT INTO filas VALUES ({', '.join('?' * max(1, len(self.columns)))})"
+        self.read = 0
+        self.exhausted = False
+        self.last_used = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def total(self) -> Optional[int]:
+        """Número total de filas, conocido solo cuando el cursor se agotó."""
+        return self.read if self.exhausted else None
+
+    def _read_until(self, need: int) -> None:
+        # Siempre de a _READ_BATCH filas: un offset lejano no trae todo el hueco de una vez
+        while self.read < need and not self.exhausted:
+            t0 = time.perf_counter()
+            batch = self._cursor.fetchmany(_READ_BATCH)
+            self._seconds += time.perf_counter() - t0
+            if batch:
+                self._spill.executemany(self._insert, batch)
+                self.read += len(batch)
+            if len(batch) < _READ_BATCH:
+                self.exhausted = True
+                self._cursor.close()  # libera el snapshot de lectura
+                self._record()
+
+    def _record(self) -> None:
+        """Registra la consulta en el workload (tiempo de SQLite, filas leídas)."""
+        if not self._recorded:
+            self._recorded = True
+            RECORDER.record(self.sql, self._executed, self.params, self._seconds, self.read)
+
+    def fetch(self, offset: int, limit: int) -> List[tuple]:
+        """Filas [offset, offset+limit) del resultado, a lo sumo FETCH_MAX_ROWS (ValueError si offset < 0)."""
+        return self._rows(offset, min(limit, FETCH_MAX_ROWS))
+
+    def head(self, n: int) -> List[tuple]:
+        """
+        Primeras `n` filas sin el tope de FETCH_MAX_ROWS: la vista previa lee
+        PREVIEW_ROWS + 1 para saber si hay más, y con el tope un resultado
+        recortado parecería completo.
+        """
+        return self._rows(0, n)
+
+    def _rows(self, offset: int, limit: int) -> List[tuple]:
+        if offset < 0:
+            raise ValueError(f"offset debe ser >= 0 (recibido {offset})")
+        limit = max(0, limit)
+        with self._lock:
+            self.last_used = time.monotonic()
+            self._read_until(offset + limit)
+            return self._spill.execute(
+                "SELECT * FROM filas WHERE rowid > ? AND rowid <= ? ORDER BY rowid",
+                (offset, offset + limit),
+            ).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            self._record()
+            self._cursor.close()
+            self._conn.close()
+            self._spill.close()
+
+
+class ResultStore:
+    """Handles abiertos, acotados en cantidad (LRU) y en tiempo de inactividad."""
+
+    def __init__(self, max_handles: int = MAX_HANDLES, ttl_s: float = HANDLE_TTL_S):
+        self.max_handles = max_handles
+        self.ttl_s = ttl_s
+        self._handles: "OrderedDict[str, ResultHandle]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def open(self, sql: str, params: Sequence = ()) -> ResultHandle:
+        handle = ResultHandle(f"r_{secrets.token_hex(4)}", sql, params)
+        with self._lock:
+            self._handles[handle.id] = handle
+            stale = self._expired()
+        for h in stale:
+            h.close()
+        return handle
+
+    def get(self, handle_id: str) -> ResultHandle:
+        with self._lock:
+            handle = self._handles.get(handle_id)
+            if handle is None:
+                raise KeyError(handle_id)
+            self._handles.move_to_end(handle_id)
+            return handle
+
+    def close(self, handle_id: str) -> None:
+        with self._lock:
+            handle = self._handles.pop(handle_id, None)
+        if handle is not None:
+            handle.close()
+
+    def _expired(self) -> List[ResultHandle]:
+        now = time.monotonic()
+        out = [self._handles.pop(k) for k, h in list(self._handles.items())
+               if now - h.last_used > self.ttl_s]
+        while len(self._handles) > self.max_handles:
+            out.append(self._handles.popitem(last=False)[1])
+        return out
+
+    def close_all(self) -> None:
+        with self._lock:
+            handles, self._handles = list(self._handles.values()), OrderedDict()
+        for h in handles:
+            h.close()
+
+
+RESULTS = ResultStore()
@@ -0,0 +1,363 @@
+# agent/rollups.py
+"""
+Tablas de resumen (rollups) sobre 'ventas' y reescritura de consultas.
+
+Casi todas las preguntas son SUM(cantidad*precio) o SUM(cantidad) agrupadas
+por sede, vendedor, producto y/o día o mes. Estas tablas guardan esos
+agregados ya calculados y se mantienen en la misma transacción de la ingesta:
+
+    ventas_dia       fecha × sede × vendedor × producto
+    ventas_mes       mes × sede × vendedor × producto
+    ventas_mes_sede  mes × sede
+
+rewrite() reconoce los SELECT agregados sobre 'ventas' que una de ellas puede
+responder y los traduce a la más pequeña que sirva. Ante cualquier construcción
+que no entiende (JOIN, subconsultas, columnas de medida fuera de un agregado
+conocido, etc.) devuelve None y la consulta va a la tabla de hechos.
+"""
+
+import os
+import re
+import sqlite3
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+REWRITE_ENABLED = os.getenv("ROLLUP_REWRITE", "true").lower() != "false"
+
+# Medidas guardadas en cada rollup y cómo se calculan desde 'ventas'
+MEASURES = (
+    ("unidades", "INTEGER", "SUM(cantidad)"),
+    ("monto", "REAL", "SUM(cantidad*precio)"),
+    ("total", "REAL", "SUM(total)"),
+    ("suma_precio", "REAL", "SUM(precio)"),
+    ("n", "INTEGER", "COUNT(*)"),
+)
+
+# Expresión de cada dimensión sobre 'ventas'
+DIM_EXPR = {
+    "fecha": "fecha",
+    "mes": "strftime('%Y-%m', fecha)",
+    "sede": "sede",
+    "vendedor": "vendedor",
+    "producto": "producto",
+}
+
+
+class Rollup(NamedTuple):
+    name: str
+    dims: Tuple[str, ...]   # columnas de la tabla (mes incluido si existe)
+    key: Tuple[str, ...]    # clave primaria
+    parent: Optional[str]   # rollup más fino desde el que se reconstruye
+
+
+# Ordenadas de la más pequeña a la más grande: rewrite() toma la primera que cubre
+ROLLUPS = (
+    Rollup("ventas_mes_sede", ("mes", "sede"), ("mes", "sede"), "ventas_mes"),
+    Rollup("ventas_mes", ("mes", "sede", "vendedor", "producto"),
+           ("mes", "sede", "vendedor", "producto"), "ventas_dia"),
+    Rollup("ventas_dia", ("fecha", "mes", "sede", "vendedor", "producto"),
+           ("fecha", "sede", "vendedor", "producto"), None),
+)
+ROLLUP_NAMES = tuple(r.name for r in ROLLUPS)
+
+
+# ---------------- Mantenimiento (se llama dentro de la transacción de ingesta) ----------------
+def _ddl(r: Rollup) -> str:
+    cols = [f"{d} TEXT NOT NULL" for d in r.dims]
+    cols += [f"{m} {t} NOT NULL" for m, t, _ in MEASURES]
+    return (f"CREATE TABLE {r.name} ({', '.join(cols)}, "
+            f"PRIMARY KEY ({', '.join(r.key)})) WITHOUT ROWID")
+
+
+def _insert_select(r: Rollup, from_parent: bool) -> str:
+    names = ", ".join(r.dims + tuple(m for m, _, _ in MEASURES))
+    if from_parent:
+        dims = ", ".join(r.dims)
+        measures = ", ".join(f"SUM({m})" for m, _, _ in MEASURES)
+        source, where = r.parent, ""
+    else:
+        dims = ", ".join(DIM_EXPR[d] for d in r.dims)
+        measures = ", ".join(expr for _, _, expr in MEASURES)
+        source, where = "ventas", "WHERE id > ?"
+    group = ", ".join(str(i + 1) for i in range(len(r.dims)))
+    return f"INSERT INTO {r.name} ({names}) SELECT {dims}, {measures} FROM {source} {where} GROUP BY {group}"
+
+
+def present(conn: sqlite3.Connection) -> bool:
+    """True si todas las tablas de resumen existen."""
+    marks = ", ".join("?" * len(ROLLUP_NAMES))
+    n = conn.execute(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name IN ({marks})", ROLLUP_NAMES
+    ).fetchone()[0]
+    return n == len(ROLLUP_NAMES)
+
+
+def rebuild(conn: sqlite3.Connection) -> None:
+    """
+    Recalcula todas las tablas de resumen. Solo ventas_dia lee la tabla de
+    hechos; las demás se agregan desde el nivel inmediatamente más fino.
+    """
+    for r in reversed(ROLLUPS):  # de la más fina a la más gruesa
+        conn.execute(f"DROP TABLE IF EXISTS {r.name}")
+        conn.execute(_ddl(r))
+        if r.parent is None:
+            conn.execute(_insert_select(r, from_parent=False), (-(2 ** 63),))
+        else:
+            conn.execute(_insert_select(r, from_parent=True))
+
+
+def apply_delta(conn: sqlite3.Connection, after_id: int) -> None:
+    """
+    Suma a las tablas de resumen las filas de 'ventas' con id > after_id
+    (las que acaba de insertar la carga incremental). Costo proporcional al delta.
+    """
+    updates = ", ".join(f"{m} = {m} + excluded.{m}" for m, _, _ in MEASURES)
+    for r in ROLLUPS:
+        conn.execute(
+            f"{_insert_select(r, from_parent=False)} "
+            f"ON CONFLICT ({', '.join(r.key)}) DO UPDATE SET {updates}",
+            (after_id,),
+        )
+
+
+# ---------------- Reescritura de consultas ----------------
+class Rewrite(NamedTuple):
+    table: str
+    sql: str
+
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<str>'(?:[^']|'')*')
+  | (?P<num>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+)
+  | (?P<id>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<param>\?\d*|:[A-Za-z_]\w*)
+  | (?P<op><=|>=|<>|!=|==|\|\||[-+*/%<>=(),;])
+""", re.VERBOSE)
+
+_MEASURE_COLS = {"id", "cantidad", "precio", "total"}
+_DIM_COLS = {"sede", "vendedor", "producto", "fecha"}
+_ROLLUP_ONLY = {"mes", "unidades", "monto", "suma_precio", "n"}
+_KEYWORDS = {
+    "select", "distinct", "from", "where", "group", "by", "order", "asc", "desc",
+    "limit", "offset", "and", "or", "not", "in", "between", "like", "glob", "escape",
+    "is", "null", "as", "having", "case", "when", "then", "else", "end", "collate",
+    "nocase", "true", "false",
+}
+_TYPES = {"real", "integer", "int", "text", "numeric"}
+_FUNCS = {
+    "round", "lower", "upper", "coalesce", "ifnull", "nullif", "abs", "cast", "date",
+    "strftime", "substr", "substring", "trim", "length", "min", "max", "printf",
+}
+_CLAUSE_END = {"from", "where", "group", "having", "order", "limit"}
+
+# Agregados que se traducen a las medidas del rollup (texto normalizado → reemplazo)
+_AGGREGATES = {
+    "sum(cantidad*precio)": "SUM(monto)",
+    "sum(precio*cantidad)": "SUM(monto)",
+    "sum(total)": "SUM(total)",
+    "sum(cantidad)": "SUM(unidades)",
+    "sum(precio)": "SUM(suma_precio)",
+    "count(*)": "COALESCE(SUM(n), 0)",
+    "avg(cantidad*precio)": "(SUM(monto) / SUM(n))",
+    "avg(precio*cantidad)": "(SUM(monto) / SUM(n))",
+    "avg(total)": "(SUM(total) / SUM(n))",
+    "avg(cantidad)": "(CAST(SUM(unidades) AS REAL) / SUM(n))",
+    "avg(precio)": "(SUM(suma_precio) / SUM(n))",
+}
+# Expresiones de fecha que se resuelven con columnas del rollup
+_DATE_EXPRS = {
+    "strftime('%Y-%m',fecha)": ("mes", "mes"),
+    "strftime('%Y-%m',date(fecha))": ("mes", "mes"),
+    "substr(fecha,1,7)": ("mes", "mes"),
+    "strftime('%Y',fecha)": ("substr(mes, 1, 4)", "mes"),
+    "strftime('%Y',date(fecha))": ("substr(mes, 1, 4)", "mes"),
+    "substr(fecha,1,4)": ("substr(mes, 1, 4)", "mes"),
+    "date(fecha)": ("fecha", "fecha"),
+}
+_PATTERNS = {**{k: (v, None) for k, v in _AGGREGATES.items()}, **_DATE_EXPRS}
+
+
+class _Bail(Exception):
+    """La consulta usa algo que los rollups no pueden responder con exactitud."""
+
+
+def _tokenize(sql: str) -> List[Tuple[str, str, int, int]]:
+    tokens, pos = [], 0
+    while pos < len(sql):
+        m = _TOKEN_RE.match(sql, pos)
+        if m is None:
+            raise _Bail(f"carácter no soportado {sql[pos]!r}")
+        if m.lastgroup != "ws":
+            tokens.append((m.lastgroup, m.group(), m.start(), m.end()))
+        pos = m.end()
+    return tokens
+
+
+def _match_call(tokens, i: int) -> Optional[Tuple[int, str]]:
+    """Si en tokens[i] empieza una llamada f(...), devuelve (índice final, texto compacto)."""
+    if i + 1 >= len(tokens) or tokens[i][0] != "id" or tokens[i + 1][1] != "(":
+        return None
+    depth, j = 0, i + 1
+    while j < len(tokens):
+        if tokens[j][1] == "(":
+            depth += 1
+        elif tokens[j][1] == ")":
+            depth -= 1
+            if depth == 0:
+                break
+        j += 1
+    else:
+        return None
+    text = "".join(t[1] if t[0] == "str" else t[1].lower() for t in tokens[i:j + 1])
+    return j, text
+
+
+def _select_items(tokens) -> List[Tuple[int, int]]:
+    """Rangos [inicio, fin) de tokens de cada columna del SELECT (nivel superior)."""
+    items, start, depth = [], 1, 0
+    if start < len(tokens) and tokens[start][1].lower() == "distinct":
+        start += 1
+    j = start
+    while j < len(tokens):
+        t = tokens[j][1].lower()
+        if t == "(":
+            depth += 1
+        elif t == ")":
+            depth -= 1
+        elif depth == 0 and t == ",":
+            items.append((start, j))
+            start = j + 1
+        elif depth == 0 and t == "from":
+            break
+        j += 1
+    items.append((start, j))
+    return items
+
+
+def _plan_rewrite(sql: str) -> Rewrite:
+    sql = sql.strip().rstrip(";").rstrip()
+    tokens = _tokenize(sql)
+    lowered = [t[1].lower() for t in tokens]
+    if not tokens or lowered[0] != "select" or lowered.count("select") != 1 or ";" in lowered:
+        raise _Bail("no es un SELECT simple")
+    if lowered.count("from") != 1:
+        raise _Bail("FROM ausente o repetido")
+    f = lowered.index("from")
+    if f + 1 >= len(tokens) or lowered[f + 1] != "ventas":
+        raise _Bail("no consulta 'ventas'")
+    if f + 2 < len(tokens) and lowered[f + 2] not in _CLAUSE_END:
+        raise _Bail("alias, JOIN u otra tabla")
+
+    # Alias definidos en el SELECT: nombre → rango de tokens de su expresión
+    aliases: Dict[str, Tuple[int, int]] = {}
+    items = _select_items(tokens)
+    for a, b in items:
+        if b - a >= 3 and lowered[b - 2] == "as" and tokens[b - 1][0] == "id":
+            aliases[lowered[b - 1]] = (a, b - 2)
+
+    replacements: Dict[int, Tuple[int, str]] = {}  # token inicial → (token final, texto)
+    needs: Set[str] = set()
+    has_aggregate = False
+    clause = "select"
+    i = 0
+    while i < len(tokens):
+        kind, text = tokens[i][0], lowered[i]
+        if kind == "id" and text in _CLAUSE_END | {"by"}:
+            if text != "by":
+                clause = text
+            i += 1
+            continue
+        if i == f + 1:  # el nombre de la tabla
+            i += 1
+            continue
+        call = _match_call(tokens, i)
+        if call is not None and call[1] in _PATTERNS:
+            end, key = call
+            new, dim = _PATTERNS[key]
+            if dim is None:
+                has_aggregate = True
+            else:
+                needs.add(dim)
+            replacements[i] = (end, new)
+            i = end + 1
+            continue
+        if call is not None and text in ("sum", "avg", "total", "group_concat"):
+            raise _Bail(f"agregado no soportado: {call[1]}")
+        if call is not None and text == "count":
+            # COUNT(DISTINCT dim) cuenta lo mismo sobre el rollup
+            end, key = call
+            m = re.fullmatch(r"count\(distinct(\w+)\)", key)
+            if not m or m.group(1) not in _DIM_COLS:
+                raise _Bail(f"agregado no soportado: {key}")
+            needs.add(m.group(1))
+            has_aggregate = True
+            i = end + 1
+            continue
+        if kind == "id":
+            prev = lowered[i - 1] if i else ""
+            nxt = lowered[i + 1] if i + 1 < len(tokens) else ""
+            if prev == "as" or text in _KEYWORDS or text in _TYPES:
+                pass                             # palabra clave, alias o tipo de CAST
+            elif nxt == "(":
+                if text in ("min", "max"):
+                    has_aggregate = True
+                elif text not in _FUNCS:
+                    raise _Bail(f"función o agregado no soportado: {text}")
+            elif clause == "order" and text in aliases and prev in ("by", ",") \
+                    and nxt in ("", ",", "asc", "desc", "limit", "collate"):
+                pass                             # ORDER BY resuelve primero los alias
+            elif text in _DIM_COLS:
+                needs.add(text)
+            elif text in _MEASURE_COLS:
+                raise _Bail(f"columna de medida fuera de un agregado: {text}")
+            elif text not in aliases:
+                raise _Bail(f"identificador desconocido: {text}")
+        elif kind == "op" and text == "*":
+            raise _Bail("'*' fuera de COUNT(*)")
+        i += 1
+
+    if not has_aggregate:
+        raise _Bail("sin agregados")
+    # Fuera de ORDER BY, una columna del rollup gana sobre un alias con el mismo
+    # nombre: solo es seguro si el alias es exactamente esa columna (mes AS mes)
+    for name, (a, b) in aliases.items():
+        if name in _ROLLUP_ONLY and replacements.get(a) != (b - 1, name):
+            raise _Bail(f"alias {name} choca con una columna del rollup")
+
+    rollup = next((r for r in ROLLUPS if needs <= set(r.dims)), None)
+    if rollup is None:
+        raise _Bail(f"ningún rollup cubre {sorted(needs)}")
+
+    # Ediciones sobre el texto original: lo no reemplazado se copia tal cual
+    edits = [(tokens[f + 1][2], tokens[f + 1][3], rollup.name)]
+    edits += [(tokens[a][2], tokens[end][3], new) for a, (end, new) in replacements.items()]
+    for a, b in items:
+        aliased = b - a >= 3 and lowered[b - 2] == "as"
+        if not aliased and any(a <= k < b for k in replacements):
+            # SQLite nombra la columna con el texto original de la expresión
+            original = sql[tokens[a][2]:tokens[b - 1][3]].replace('"', '""')
+            edits.append((tokens[b - 1][3], tokens[b - 1][3], f' AS "{original}"'))
+    out, pos = [], 0
+    for start, end, text in sorted(edits, key=lambda e: (e[0], e[1])):
+        out.append(sql[pos:start])
+        out.append(text)
+        pos = end
+    out.append(sql[pos:])
+    return Rewrite(rollup.name, "".join(out))
+
+
+def rewrite(sql: str) -> Optional[Rewrite]:
+    """
+    Traduce un SELECT agregado sobre 'ventas' al rollup más pequeño que lo
+    responde. Devuelve None si la consulta no es reconocible con certeza.
+
+    Example:
+        rewrite("SELECT sede, SUM(cantidad*precio) AS v FROM ventas GROUP BY sede")
+        → Rewrite('ventas_mes_sede', 'SELECT sede, SUM(monto) AS v FROM ventas_mes_sede GROUP BY sede')
+    """
+    if not REWRITE_ENABLED:
+        return None
+    try:
+        return _plan_rewrite(sql)
+    except _Bail:
+        return None
@@ -0,0 +1,258 @@
+# agent/router.py
+"""
+Router híbrido: reglas de sql_gen primero, Bedrock solo si hace falta.
+
+La mayoría de las preguntas son las formas que agent/sql_gen.py ya resuelve
+(top-N de productos o vendedores, totales por sede, tendencias por mes). Para
+cada pregunta se corre generate_sql_rule() y se calcula una confianza según
+qué tan específica fue la regla y cuántas palabras de la pregunta quedaron sin
+explicar. Con confianza ≥ ROUTER_MIN_CONFIDENCE se responde localmente con las
+mismas tools del agente; si no, la pregunta sigue al modelo.
+
+Cada decisión se registra en el logger "agent.router" junto con el reparto
+local/modelo y el tiempo ahorrado estimado.
+
+La salida de las tools trae indicaciones para el modelo (handles m_/r_ y cómo
+usarlos). for_user() las quita para mostrar una respuesta local al usuario; la
+versión completa queda en el historial para las preguntas de seguimiento.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from agent.sql_gen import CITY_MAP, FILE_WORDS, MONTHS, _extract_entities, generate_sql_rule
+from agent.qcache import normalize_question, is_follow_up
+
+logger = logging.getLogger("agent.router")
+
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() != "false"
+MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.75"))
+# Latencia supuesta de una vuelta al modelo mientras no se haya medido ninguna
+LLM_BASELINE_S = float(os.getenv("ROUTER_LLM_BASELINE_S", "4.0"))
+
+# Confianza base por regla: las genéricas casi nunca responden lo que se pidió
+RULE_BASE = {
+    "vacio": 0.0,
+    "fallback": 0.1,
+    "tabla": 0.6,
+    "exportar_default": 0.5,
+    "vendedor_lider": 0.8,
+}
+SPECIFIC_BASE = 0.95
+# Multiplicadores: por cada palabra sin explicar y por cada filtro LIKE adivinado
+UNKNOWN_WORD_FACTOR = 0.6
+LIKE_FILTER_FACTOR = 0.9
+
+# Palabras que piden razonamiento: siempre van al modelo
+_ESCALATE_RE = re.compile(
+    r"\b(por que|porque|explica|explicame|compara|comparar|comparacion|recomienda|recomendacion|"
+    r"analiza|predice|prediccion|proyecta|proyeccion|crecimiento|variacion|diferencia|"
+    r"versus|vs|mientras|sin embargo|aunque)\b"
+)
+
+_STOPWORDS = set("""
+a al con cual cuales cuanto cuanta cuantos cuantas de del el en es esta este fue fueron la las lo los
+me mi mis muestra muestrame muestreme dame dime dar hazme haz genera generar crea crear quiero necesito
+por favor para que se sus su un una unos unas y o cada todo todos toda todas ver mostrar como cuando
+son sea hay tiene tienen tuvo tuvieron hizo hicieron hubo del sobre segun
+""".split())
+
+_KNOWN = set("""
+top ranking mejores mejor peores peor bottom mas menos vendido vendida vendidos vendidas vendio vendieron
+vende venden producto productos vendedor vendedora vendedores sede sedes ciudad ciudades ventas venta
+total totales ingreso ingresos facturacion facturado cantidad cantidades unidades promedio ticket precio
+precios participacion porcentaje diario diarias mensual mensuales anual
+grafico grafica barras barra linea lineas torta pastel pie csv excel xlsx parquet arrow feather gzip
+comprimido comprimida guarda guardar guardame exporta exportar exportame descarga descargar archivo tabla
+lista listado detalle quien monto montos
+""".split()) | set(CITY_MAP)
+
+# Palabras de fecha: solo cuentan como explicadas si _extract_entities sacó un rango
+# que llegó al WHERE. Si no ("ultimos 30 dias", "en diciembre", "entre enero y
+# marzo"), la regla respondería sin el filtro y la pregunta va al modelo.
+_DATE_WORDS = frozenset("""
+hoy ayer ultimo ultima ultimos ultimas semana semanas entre dia dias mes meses ano anio anos
+""".split()) | frozenset(MONTHS)
+# ...salvo el período de una agrupación ("por mes"), que sí llega al GROUP BY
+_PERIOD_RE = re.compile(r"\bpor (dia|mes|ano|anio)\b")
+
+# Modos de salida que se resuelven con export_to_file
+FILE_MODES = tuple(mode for mode, _ in FILE_WORDS)
+_NUMBER_RE = re.compile(r"^(\d+|top\d+|\d{4}-\d{2}(-\d{2})?)$")
+
+
+class Decision(NamedTuple):
+    rule: str
+    sql: str
+    mode: str
+    params: Tuple[Any, ...]
+    confidence: float
+    unknown: Tuple[str, ...]
+
+    @property
+    def local(self) -> bool:
+        return self.confidence >= MIN_CONFIDENCE
+
+
+def score(question: str) -> Decision:
+    """Regla de sql_gen que responde la pregunta y confianza en [0, 1]."""
+    rule, sql, (mode, params) = generate_sql_rule(question)
+    norm = normalize_question(question)
+    if is_follow_up(norm) or _ESCALATE_RE.search(norm):
+        return Decision(rule, sql, mode, tuple(params), 0.0, ())
+
+    # Los nombres extraídos para filtros LIKE cuentan como explicados, con penalización.
+    # Si el "nombre" contiene vocabulario de la pregunta ("vendedor con más ventas"),
+    # la regla tomó texto como filtro y la consulta sería incorrecta.
+    ent = _extract_entities(norm)
+    names = set()
+    likes = 0
+    for extracted in (ent.product, ent.seller):
+        if extracted:
+            words = extracted.split()
+            if any(w in _KNOWN or w in _STOPWORDS for w in words):
+                return Decision(rule, sql, mode, tuple(params), 0.0, tuple(words))
+            names.update(words)
+            likes += 1
+
+    if ent.dfrom is not None and ent.dfrom in params:
+        names |= _DATE_WORDS
+    names.update(_PERIOD_RE.findall(norm))
+    unknown = tuple(
+        w for w in norm.split()
+        if w not in _STOPWORDS and w not in _KNOWN and w not in names and not _NUMBER_RE.match(w)
+    )
+    confidence = RULE_BASE.get(rule, SPECIFIC_BASE)
+    confidence *= UNKNOWN_WORD_FACTOR ** len(unknown) * LIKE_FILTER_FACTOR ** likes
+    return Decision(rule, sql, mode, tuple(params), round(confidence, 3), unknown)
+
+
+def inline_params(sql: str, params: Tuple[Any, ...]) -> str:
+    """
+    Sustituye los '?' (fuera de literales) por los valores como literales SQL.
+    Las tools reciben un único string SQL, sin parámetros aparte.
+    """
+    values = iter(params)
+
+    def literal(v: Any) -> str:
+        if v is None:
+            return "NULL"
+        if isinstance(v, (int, float)):
+            return repr(v)
+        return "'" + str(v).replace("'", "''") + "'"
+
+    out = []
+    for i, part in enumerate(re.split(r"('(?:[^']|'')*')", sql)):
+        out.append(part if i % 2 else re.sub(r"\?", lambda _: literal(next(values)), part))
+    return "".join(out)
+
+
+class RouterStats:
+    """Reparto local/modelo y tiempo ahorrado estimado."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.local = 0
+        self.escalated = 0
+        self.local_s = 0.0
+        self.llm_s = 0.0
+
+    def record_local(self, seconds: float) -> None:
+        with self._lock:
+            self.local += 1
+            self.local_s += seconds
+
+    def record_llm(self, seconds: float) -> None:
+        with self._lock:
+            self.escalated += 1
+            self.llm_s += seconds
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.local + self.escalated
+            avg_llm = self.llm_s / self.escalated if self.escalated else LLM_BASELINE_S
+            return {
+                "local": self.local,
+                "escalated": self.escalated,
+                "local_ratio": self.local / total if total else 0.0,
+                "avg_local_s": self.local_s / self.local if self.local else 0.0,
+                "avg_llm_s": avg_llm,
+                "saved_s": max(0.0, self.local * avg_llm - self.local_s),
+            }
+
+
+STATS = RouterStats()
+
+
+class Answer(NamedTuple):
+    """Respuesta dada sin el modelo."""
+    text: str     # para el usuario (for_user)
+    context: str  # para el historial: salida completa de las tools, con handles
+
+
+# Líneas de las tools de agent/tools.py que solo le sirven al modelo
+_MODEL_LINE_RE = re.compile(r"^(?:🧠 .*|\s*Usa fetch_rows\(.*)(?:\n|$)", re.MULTILINE)
+_HANDLE_RE = re.compile(r"\s*Handle del resultado: [mr]_[0-9a-f]{8}")
+_BLANKS_RE = re.compile(r"\n{3,}")
+
+
+def for_user(output: str) -> str:
+    """
+    Salida de una tool sin las indicaciones para el modelo: la línea "🧠 En
+    memoria como m_…", los handles y las instrucciones de fetch_rows. Queda la
+    tabla, la ruta del archivo y las estadísticas.
+    """
+    text = _HANDLE_RE.sub("", _MODEL_LINE_RE.sub("", str(output)))
+    return _BLANKS_RE.sub("\n\n", text).strip()
+
+
+def _log_split(rule: str, confidence: float, where: str, seconds: float) -> None:
+    s = STATS.snapshot()
+    logger.info(
+        "router %s rule=%s conf=%.2f %.0fms | local=%d modelo=%d (%.0f%% local) ahorro≈%.1fs",
+        where, rule, confidence, seconds * 1000, s["local"], s["escalated"],
+        100 * s["local_ratio"], s["saved_s"],
+    )
+
+
+async def answer_locally(
+    question: str, run_tool: Callable[[str, Dict[str, Any]], Awaitable[str]]
+) -> Optional[Answer]:
+    """
+    Responde con las tools del agente si la regla es confiable; None si la
+    pregunta debe ir al modelo (baja confianza o la tool falló).
+    """
+    if not ROUTER_ENABLED:
+        return None
+    t0 = time.perf_counter()
+    d = score(question)
+    if not d.local:
+        logger.info("router → modelo rule=%s conf=%.2f desconocidas=%s", d.rule, d.confidence, list(d.unknown))
+        return None
+
+    sql = inline_params(d.sql, d.params)
+    if d.mode in ("bar", "line", "pie"):
+        output = await run_tool("generate_chart", {"sql_query": sql, "chart_type": d.mode, "title": question})
+    elif d.mode in FILE_MODES:
+        output = await run_tool("export_to_file", {"sql_query": sql, "format": d.mode})
+    else:
+        output = await run_tool("query_database", {"sql_query": sql})
+    if str(output).lstrip().startswith("❌"):
+        logger.info("router → modelo rule=%s: la tool falló", d.rule)
+        return None
+
+    seconds = time.perf_counter() - t0
+    STATS.record_local(seconds)
+    _log_split(d.rule, d.confidence, "local", seconds)
+    header = f"⚡ Respuesta local (regla '{d.rule}', confianza {d.confidence:.2f}):\n\n"
+    return Answer(header + for_user(output), header + str(output))
+
+
+def record_llm(seconds: float) -> None:
+    """Registra una pregunta que fue al modelo y cuánto tardó."""
+    STATS.record_llm(seconds)
+    _log_split("-", 0.0, "modelo", seconds)
@@ -1,8 +1,24 @@
 # agent/sql_gen.py
+"""
+Generador NL → SQL basado en reglas (modo legacy y router híbrido).
+
+Las reglas son una tabla declarativa (RULES) que se compila una sola vez:
+todas las palabras clave de las condiciones se juntan en un único patrón
+(un trie expresado como regex) que recorre la pregunta una vez y devuelve
+qué literales aparecen. Un índice literal → reglas deja como candidatas solo
+las reglas que podrían disparar; se evalúan en orden y gana la primera. Las
+regex de cada regla solo se ejecutan si sus literales requeridos aparecen.
+Las entidades (ciudad, fechas, producto, vendedor, N) salen de un único
+recorrido por los tokens de la pregunta (_extract_entities).
+
+Agregar reglas no agrega pasadas sobre el texto: ver scripts/bench_sql_gen.py.
+"""
+
 import re
 import unicodedata
+from abc import ABC, abstractmethod
 from datetime import date, timedelta
-from typing import Optional, Tuple, List
+from typing import Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
 
 TABLE = "ventas"
 ALLOWED_COLS = {"id","vendedor","sede","producto","cantidad","precio","fecha","total"}
@@ -21,80 +37,157 @@ CITY_MAP = {
     "barranquilla": "Barranquilla",
 }
 
-def _pick_city(tn: str) -> Optional[str]:
-    for k, v in CITY_MAP.items():
-        if re.search(rf"\b{k}\b", tn):
-            return v
-    return None
+MONTHS = {"enero":"01","febrero":"02","marzo":"03","abril":"04","mayo":"05","junio":"06",
+          "julio":"07","agosto":"08","septiembre":"09","setiembre":"09","octubre":"10","noviembre":"11","diciembre":"12"}
+
+# Palabras → modo de salida, en orden de prioridad
+CHART_WORDS = (
+    ("pie",  ("pastel","torta","pie")),
+    ("line", ("linea","línea","line")),
+    ("bar",  ("barra","barras","bar","grafico","gráfico")),
+)
+FILE_WORDS = (
+    ("excel",   ("excel","xlsx")),
+    ("parquet", ("parquet",)),
+    ("arrow",   ("arrow","feather")),
+    ("csv.gz",  ("gzip","comprimido","comprimida")),
+    ("csv",   ("csv","guarda","guardar","exporta","exportar","descarga","descargar","archivo")),
+)
 
-def _extract_int(tn: str, default: int = 5) -> int:
-    m = re.search(r"\btop\s*(\d+)\b", tn) or re.search(r"\btop(\d+)\b", tn)
-    if m:
-        try: return int(m.group(1))
-        except ValueError: pass
-    m2 = re.search(r"\b(bottom|peores?|menos)\s*(\d+)\b", tn)
-    if m2:
-        try: return int(m2.group(2))
-        except ValueError: pass
-    return default
+# Entidades: un solo findall de tokens (palabras o signos sueltos) y un recorrido
+_TOKEN_RE     = re.compile(r"[\w\"'\-]+|[^\w\s]")
+_DATE_TOK_RE  = re.compile(r"\d{4}-\d{2}-\d{2}")
+_YM_TOK_RE    = re.compile(r"(\d{4})-(\d{2})")
+_YEAR_TOK_RE  = re.compile(r"\d{4}")
+_TOPN_TOK_RE  = re.compile(r"top(\d+)")
+_PRODUCT_NAME_RE = re.compile(r"[a-z0-9\"'\-]+")
+_SELLER_NAME_RE  = re.compile(r"[a-z]+")
+
+_OF_WORDS     = frozenset({"del", "de", "por"})   # "del producto X" gana a "producto X"
+_CUT_WORDS    = frozenset({"en", "de", "por", "para"})  # cortan el nombre de producto/vendedor
+_BOTTOM_WORDS = frozenset({"bottom", "peor", "peores", "menos"})
 
 # palabras que NO son nombre de producto tras "producto"
 _STOP_AFTER_PRODUCT = {"mas","más","mejor","mejores","vendido","vendida","vendidos","vendidas","top","ranking","menos","peor","peores"}
 
-def _extract_product(tn: str) -> Optional[str]:
-    m = re.search(r"(?:\bdel\b|\bde\b|\bpor\b)\s+producto\s+([a-z0-9\"'\-\s]+)", tn)
-    if not m: m = re.search(r"\bproducto\s+([a-z0-9\"'\-\s]+)", tn)
-    if not m: return None
-    cand = m.group(1).strip().strip('"\' ')
-    if not cand: return None
-    first = cand.split()[0]
-    if first in _STOP_AFTER_PRODUCT: return None
-    cand = re.split(r"\s+(en|de|por|para|en\s+la|en\s+el)\b", cand)[0].strip()
-    return cand or None
-
-def _extract_seller(tn: str) -> Optional[str]:
-    m = re.search(r"(?:\bdel\b|\bde\b|\bpor\b)\s+vendedor[a]?\s+([a-záéíóúñ\s]+)", tn)
-    if not m: m = re.search(r"\bvendedor[a]?\s+([a-záéíóúñ\s]+)", tn)
-    if not m: return None
-    cand = m.group(1).strip()
-    cand = re.split(r"\s+(en|de|por|para)\b", cand)[0].strip()
-    return cand or None
-
-def _extract_dates(tn: str) -> Tuple[Optional[str], Optional[str]]:
-    m = re.search(r"entre\s*(\d{4}-\d{2}-\d{2})\s*y\s*(\d{4}-\d{2}-\d{2})", tn)
-    if m: return (m.group(1), m.group(2))
+class Entities(NamedTuple):
+    city: Optional[str]
+    dfrom: Optional[str]
+    dto: Optional[str]
+    product: Optional[str]
+    seller: Optional[str]
+    n: Optional[int]  # "top 5", "peores 3"; None si no se pidió
+
+def _name_after(tokens: List[str], i: int, name_re: "re.Pattern[str]") -> Optional[str]:
+    """Nombre que sigue a tokens[i] ("producto"/"vendedor") hasta una palabra de corte o un carácter fuera de `name_re`."""
+    out = []
+    for t in tokens[i + 1:]:
+        if t in _CUT_WORDS:
+            break
+        m = name_re.match(t)
+        if m is None:
+            break
+        out.append(m.group())
+        if m.end() < len(t):
+            break
+    return " ".join(out).strip("\"' ") or None
+
+def _extract_entities(tn: str) -> Entities:
+    """
+    Ciudad, rango de fechas, producto, vendedor y N de la pregunta normalizada
+    en una sola pasada por los tokens.
+    """
+    tokens = _TOKEN_RE.findall(tn)
+    words = [t.strip("\"'") for t in tokens]
+    size = len(words)
+    cities: Set[str] = set()
+    product_at = any_product_at = seller_at = any_seller_at = None
+    between = year = year_month = month_year = None
+    hoy = ayer = last_month = last_week = False
+    top = bottom = None
+
+    for i, w in enumerate(words):
+        prev = words[i - 1] if i else ""
+        nxt = words[i + 1] if i + 1 < size else ""
+        if w in CITY_MAP:
+            cities.add(w)
+        elif w == "producto":
+            if any_product_at is None: any_product_at = i
+            if product_at is None and prev in _OF_WORDS: product_at = i
+        elif w in ("vendedor", "vendedora"):
+            if any_seller_at is None: any_seller_at = i
+            if seller_at is None and prev in _OF_WORDS: seller_at = i
+        elif w == "entre":
+            if (between is None and i + 3 < size and words[i + 2] == "y"
+                    and _DATE_TOK_RE.fullmatch(nxt) and _DATE_TOK_RE.fullmatch(words[i + 3])):
+                between = (nxt, words[i + 3])
+        elif w == "hoy":
+            hoy = True
+        elif w == "ayer":
+            ayer = True
+        elif w == "ultimo" and nxt == "mes":
+            last_month = True
+        elif (w == "ultima" and nxt == "semana") or (w == "ultimos" and nxt == "7" and i + 2 < size and words[i + 2] == "dias"):
+            last_week = True
+        elif w in ("en", "ano", "anio"):
+            if year is None and _YEAR_TOK_RE.fullmatch(nxt):
+                year = nxt
+            m = _YM_TOK_RE.fullmatch(nxt) if w == "en" else None
+            if m and year_month is None:
+                year_month = m.groups()
+            elif (w == "en" and nxt in MONTHS and month_year is None and i + 2 < size
+                    and _YEAR_TOK_RE.fullmatch(words[i + 2])):
+                month_year = (words[i + 2], MONTHS[nxt])
+        elif w == "top":
+            if top is None and nxt.isdigit(): top = int(nxt)
+        elif w in _BOTTOM_WORDS:
+            if bottom is None and nxt.isdigit(): bottom = int(nxt)
+        elif top is None and w.startswith("top"):
+            m = _TOPN_TOK_RE.fullmatch(w)
+            if m: top = int(m.group(1))
+
+    city = next((v for k, v in CITY_MAP.items() if k in cities), None)
+
     today = date.today()
-    if "hoy" in tn:  d=today.isoformat(); return (d,d)
-    if "ayer" in tn: d=(today - timedelta(days=1)).isoformat(); return (d,d)
-    if "ultimo mes" in tn or "último mes" in tn:
-        last = (today.replace(day=1) - timedelta(days=1))
-        return (last.replace(day=1).isoformat(), last.isoformat())
-    if any(k in tn for k in ["ultima semana","última semana","ultimos 7 dias","últimos 7 días"]):
-        return ((today - timedelta(days=7)).isoformat(), today.isoformat())
-    m = re.search(r"(?:en|año)\s*(\d{4})", tn)
-    if m:
-        y=int(m.group(1)); return (f"{y}-01-01", f"{y}-12-31")
-    MONTHS = {"enero":"01","febrero":"02","marzo":"03","abril":"04","mayo":"05","junio":"06",
-              "julio":"07","agosto":"08","septiembre":"09","setiembre":"09","octubre":"10","noviembre":"11","diciembre":"12"}
-    m = re.search(r"en\s*(\d{4})-(\d{2})", tn)
-    if m:
-        y,mm=m.group(1),m.group(2); return (f"{y}-{mm}-01", f"{y}-{mm}-31")
-    for esp,mm in MONTHS.items():
-        m = re.search(rf"en\s*{esp}\s*(\d{{4}})", tn)
-        if m:
-            y=m.group(1); return (f"{y}-{mm}-01", f"{y}-{mm}-31")
-    return (None, None)
+    if between:
+        dfrom, dto = between
+    elif hoy:
+        dfrom = dto = today.isoformat()
+    elif ayer:
+        dfrom = dto = (today - timedelta(days=1)).isoformat()
+    elif last_month:
+        last = today.replace(day=1) - timedelta(days=1)
+        dfrom, dto = last.replace(day=1).isoformat(), last.isoformat()
+    elif last_week:
+        dfrom, dto = (today - timedelta(days=7)).isoformat(), today.isoformat()
+    elif year:
+        dfrom, dto = f"{year}-01-01", f"{year}-12-31"
+    elif year_month or month_year:
+        y, mm = year_month or month_year
+        dfrom, dto = f"{y}-{mm}-01", f"{y}-{mm}-31"
+    else:
+        dfrom = dto = None
 
-def _want_chart(tn: str) -> Optional[str]:
-    if any(k in tn for k in ["pastel","torta","pie"]): return "pie"
-    if any(k in tn for k in ["linea","línea","line"]): return "line"
-    if any(k in tn for k in ["barra","barras","bar","grafico","gráfico"]): return "bar"
+    product = None
+    at = product_at if product_at is not None else any_product_at
+    if at is not None and (at + 1 >= size or words[at + 1] not in _STOP_AFTER_PRODUCT):
+        product = _name_after(tokens, at, _PRODUCT_NAME_RE)
+    at = seller_at if seller_at is not None else any_seller_at
+    seller = None if at is None else _name_after(tokens, at, _SELLER_NAME_RE)
+
+    return Entities(city, dfrom, dto, product, seller, top if top is not None else bottom)
+
+def _pick_word(words, present: Callable[[str], bool]) -> Optional[str]:
+    for mode, keys in words:
+        if any(present(k) for k in keys):
+            return mode
     return None
 
+def _want_chart(tn: str) -> Optional[str]:
+    return _pick_word(CHART_WORDS, tn.__contains__)
+
 def _want_file(tn: str) -> Optional[str]:
-    if "excel" in tn or "xlsx" in tn: return "excel"
-    if any(k in tn for k in ["csv","guarda","guardar","exporta","exportar","descarga","descargar","archivo"]): return "csv"
-    return None
+    return _pick_word(FILE_WORDS, tn.__contains__)
 
 def _build_where(city: Optional[str], dfrom: Optional[str], dto: Optional[str],
                  prod: Optional[str], sell: Optional[str]) -> Tuple[str, List]:
@@ -110,219 +203,360 @@ def _build_where(city: Optional[str], dfrom: Optional[str], dto: Optional[str],
 def _like(tn: str, *needles: str) -> bool:
     return all(n in tn for n in needles)
 
-# ---------------- Generador NL → SQL ----------------
-def generate_sql(user_text: str):
+# ---------------- Condiciones declarativas ----------------
+# Se evalúan contra (tn, present): present es el conjunto de literales de la
+# tabla que aparecen en la pregunta, calculado en una sola pasada.
+Pred = Callable[[str, FrozenSet[str]], bool]
+
+class Cond(ABC):
+    @abstractmethod
+    def literals(self) -> Set[str]:
+        """Literales que usa la condición (entran al escaneo único)."""
+
+    @abstractmethod
+    def needs(self) -> Optional[FrozenSet[str]]:
+        """Literales de los que al menos uno debe aparecer para que sea cierta (None = sin requisito)."""
+
+    @abstractmethod
+    def compile(self) -> Pred:
+        """Predicado (tn, present) -> bool."""
+
+class Has(Cond):
+    """Aparece alguno de los literales (subcadena)."""
+    def __init__(self, *lits: str):
+        self.lits = frozenset(lits)
+    def literals(self): return set(self.lits)
+    def needs(self): return self.lits
+    def compile(self):
+        lits = self.lits
+        return lambda tn, present: not lits.isdisjoint(present)
+
+class Re(Cond):
+    """Regex precompilada; solo se ejecuta si aparecen todos los literales de `requires`."""
+    def __init__(self, pattern: str, *requires: str):
+        self.rx = re.compile(pattern)
+        self.requires = frozenset(requires)
+    def literals(self): return set(self.requires)
+    def needs(self): return self.requires or None
+    def compile(self):
+        rx, req = self.rx, self.requires
+        return lambda tn, present: req <= present and rx.search(tn) is not None
+
+class All(Cond):
+    def __init__(self, *conds: Cond):
+        self.conds = conds
+    def literals(self): return set().union(*(c.literals() for c in self.conds))
+    def needs(self):
+        known = [n for n in (c.needs() for c in self.conds) if n]
+        return min(known, key=len) if known else None
+    def compile(self):
+        preds = [c.compile() for c in self.conds]
+        return lambda tn, present: all(p(tn, present) for p in preds)
+
+class Any(Cond):
+    def __init__(self, *conds: Cond):
+        self.conds = conds
+    def literals(self): return set().union(*(c.literals() for c in self.conds))
+    def needs(self):
+        out = set()
+        for c in self.conds:
+            n = c.needs()
+            if not n:
+                return None
+            out |= n
+        return frozenset(out)
+    def compile(self):
+        preds = [c.compile() for c in self.conds]
+        return lambda tn, present: any(p(tn, present) for p in preds)
+
+class Not(Cond):
+    def __init__(self, cond: Cond):
+        self.cond = cond
+    def literals(self): return self.cond.literals()
+    def needs(self): return None
+    def compile(self):
+        pred = self.cond.compile()
+        return lambda tn, present: not pred(tn, present)
+
+class Always(Cond):
+    def literals(self): return set()
+    def needs(self): return None
+    def compile(self): return lambda tn, present: True
+
+def HasAll(*lits: str) -> Cond:
+    """Aparecen todos los literales."""
+    return All(*(Has(l) for l in lits))
+
+class Rule(NamedTuple):
     """
-    Devuelve: (sql, (mode, params))
-      sql:   str con '?' (SQLite)
-      mode:  'table'|'bar'|'line'|'pie'|'csv'|'excel'|'text'
-      params: tuple
+    id:    nombre de la regla (lo usa el router)
+    when:  condición de disparo
+    sql:   plantilla con {T}, {where}, {n} y {order}
+    mode:  'text' | 'table' | 'auto' (gráfico, archivo o tabla) | 'chart_line' (gráfico o línea) | 'file'
+    desc:  condición para ORDER DESC (si no, ASC); None si la plantilla no usa {order}
     """
-    tl = user_text.strip()
-    if not tl:
-        return (f"SELECT * FROM {TABLE} LIMIT 20;", ("table", ()))
-    tn = _norm(tl)
-
-    city      = _pick_city(tn)
-    n         = _extract_int(tn, default=5)
-    dfrom,dto = _extract_dates(tn)
-    prod_like = _extract_product(tn)
-    sell_like = _extract_seller(tn)
-    chart     = _want_chart(tn)
-    file_mode = _want_file(tn)
-    where_sql, params = _build_where(city, dfrom, dto, prod_like, sell_like)
+    id: str
+    when: Cond
+    sql: str
+    mode: str
+    desc: Optional[Cond] = None
 
+# ---------------- Tabla de reglas ----------------
+_IS_TOP    = Any(Re(r"\btop(\d+)?\b", "top"), Has("top ", "mejores", "ranking", "más vendidos", "mas vendidos"))
+_IS_BOTTOM = Has("peores", "menos vendidos", "bottom")
+_TOP_DESC  = All(_IS_TOP, Not(_IS_BOTTOM))
+_FILE      = Has(*(k for _, keys in FILE_WORDS for k in keys))
+
+_PCT = (
+    "SELECT {g}, "
+    "SUM(cantidad*precio) AS total_ventas, "
+    "ROUND(100.0*SUM(cantidad*precio) / "
+    "(SELECT SUM(cantidad*precio) FROM {T} {where}), 2) AS pct "
+    "FROM {T} {where} GROUP BY {g} ORDER BY total_ventas DESC;"
+)
+
+RULES: Tuple[Rule, ...] = (
     # --- Producto más / menos vendido (singular) ---
-    if re.search(r"\bproducto\b.*m[aá]s\s+vendid", tn) or re.search(r"m[aá]s\s+vendid[oa]\s+.*\bproducto\b", tn):
-        sql = (
-            f"SELECT producto, SUM(cantidad) AS total_cantidad "
-            f"FROM {TABLE} {where_sql} GROUP BY producto "
-            f"ORDER BY total_cantidad DESC LIMIT 1;"
-        ); return (sql, ("text", tuple(params)))
-    if re.search(r"\bproducto\b.*menos\s+vendid", tn) or re.search(r"menos\s+vendid[oa]\s+.*\bproducto\b", tn) or "peor producto" in tn:
-        sql = (
-            f"SELECT producto, SUM(cantidad) AS total_cantidad "
-            f"FROM {TABLE} {where_sql} GROUP BY producto "
-            f"ORDER BY total_cantidad ASC LIMIT 1;"
-        ); return (sql, ("text", tuple(params)))
+    Rule("producto_mas_vendido",
+         Any(Re(r"\bproducto\b.*m[aá]s\s+vendid", "producto", "vendid"),
+             Re(r"m[aá]s\s+vendid[oa]\s+.*\bproducto\b", "producto", "vendid")),
+         "SELECT producto, SUM(cantidad) AS total_cantidad FROM {T} {where} GROUP BY producto "
+         "ORDER BY total_cantidad DESC LIMIT 1;", "text"),
+    Rule("producto_menos_vendido",
+         Any(Re(r"\bproducto\b.*menos\s+vendid", "producto", "menos", "vendid"),
+             Re(r"menos\s+vendid[oa]\s+.*\bproducto\b", "producto", "menos", "vendid"),
+             Has("peor producto")),
+         "SELECT producto, SUM(cantidad) AS total_cantidad FROM {T} {where} GROUP BY producto "
+         "ORDER BY total_cantidad ASC LIMIT 1;", "text"),
 
     # --- Vendedor con más / menos ventas (singular) ---
-    if re.search(r"vendedor.*m[aá]s.*ventas", tn) or _like(tn,"quien","vendedor") or _like(tn,"quién","vendedor"):
-        sql = (
-            f"SELECT vendedor, SUM(cantidad*precio) AS total_ventas "
-            f"FROM {TABLE} {where_sql} GROUP BY vendedor "
-            f"ORDER BY total_ventas DESC LIMIT 1;"
-        ); return (sql, ("text", tuple(params)))
-    if re.search(r"vendedor.*menos.*ventas", tn) or "peor vendedor" in tn:
-        sql = (
-            f"SELECT vendedor, SUM(cantidad*precio) AS total_ventas "
-            f"FROM {TABLE} {where_sql} GROUP BY vendedor "
-            f"ORDER BY total_ventas ASC LIMIT 1;"
-        ); return (sql, ("text", tuple(params)))
+    Rule("vendedor_lider",
+         Any(Re(r"vendedor.*m[aá]s.*ventas", "vendedor", "ventas"), HasAll("quien", "vendedor"), HasAll("quién", "vendedor")),
+         "SELECT vendedor, SUM(cantidad*precio) AS total_ventas FROM {T} {where} GROUP BY vendedor "
+         "ORDER BY total_ventas DESC LIMIT 1;", "text"),
+    Rule("vendedor_peor",
+         Any(Re(r"vendedor.*menos.*ventas", "vendedor", "menos", "ventas"), Has("peor vendedor")),
+         "SELECT vendedor, SUM(cantidad*precio) AS total_ventas FROM {T} {where} GROUP BY vendedor "
+         "ORDER BY total_ventas ASC LIMIT 1;", "text"),
 
     # --- "top 5 ventas de medellin" (sin decir producto/vendedor) -> productos por monto ---
-    if ("ventas" in tn or "venta" in tn) and (re.search(r"\btop(\d+)?\b", tn) or "top " in tn or "ranking" in tn):
-        sql = (
-            f"SELECT producto, SUM(cantidad*precio) AS total_ventas "
-            f"FROM {TABLE} {where_sql} "
-            f"GROUP BY producto ORDER BY total_ventas DESC LIMIT {n};"
-        ); return (sql, (chart or file_mode or "table", tuple(params)))
-
-    # --- TOP/BOTTOM N por productos (monto o cantidad) ---
-    is_top    = bool(re.search(r"\btop(\d+)?\b", tn) or "top " in tn or "mejores" in tn or "ranking" in tn or "más vendidos" in tn or "mas vendidos" in tn)
-    is_bottom = "peores" in tn or "menos vendidos" in tn or "bottom" in tn
-    if ("producto" in tn or "productos" in tn) and (is_top or is_bottom):
-        order  = "DESC" if is_top and not is_bottom else "ASC"
-        by_qty = ("cantidad" in tn) or ("unidades" in tn) or ("vendid" in tn)
-        if by_qty:
-            sql = (
-                f"SELECT producto, SUM(cantidad) AS total_cantidad "
-                f"FROM {TABLE} {where_sql} GROUP BY producto "
-                f"ORDER BY total_cantidad {order} LIMIT {n};"
-            )
-        else:
-            sql = (
-                f"SELECT producto, SUM(cantidad*precio) AS total_ventas "
-                f"FROM {TABLE} {where_sql} GROUP BY producto "
-                f"ORDER BY total_ventas {order} LIMIT {n};"
-            )
-        return (sql, (chart or file_mode or "table", tuple(params)))
-
-    # --- TOP/BOTTOM N por vendedores (monto o cantidad) ---
-    if ("vendedor" in tn or "vendedores" in tn) and (is_top or is_bottom):
-        order  = "DESC" if is_top and not is_bottom else "ASC"
-        by_qty = ("cantidad" in tn) or ("unidades" in tn)
-        if by_qty:
-            sql = (
-                f"SELECT vendedor, SUM(cantidad) AS total_cantidad "
-                f"FROM {TABLE} {where_sql} GROUP BY vendedor "
-                f"ORDER BY total_cantidad {order} LIMIT {n};"
-            )
-        else:
-            sql = (
-                f"SELECT vendedor, SUM(cantidad*precio) AS total_ventas "
-                f"FROM {TABLE} {where_sql} GROUP BY vendedor "
-                f"ORDER BY total_ventas {order} LIMIT {n};"
-            )
-        return (sql, (chart or file_mode or "table", tuple(params)))
+    Rule("top_ventas_productos",
+         All(Has("ventas", "venta"), Any(Re(r"\btop(\d+)?\b", "top"), Has("top ", "ranking"))),
+         "SELECT producto, SUM(cantidad*precio) AS total_ventas FROM {T} {where} "
+         "GROUP BY producto ORDER BY total_ventas DESC LIMIT {n};", "auto"),
+
+    # --- TOP/BOTTOM N por productos / vendedores (cantidad o monto) ---
+    Rule("top_productos",
+         All(Has("producto", "productos"), Any(_IS_TOP, _IS_BOTTOM), Has("cantidad", "unidades", "vendid")),
+         "SELECT producto, SUM(cantidad) AS total_cantidad FROM {T} {where} GROUP BY producto "
+         "ORDER BY total_cantidad {order} LIMIT {n};", "auto", _TOP_DESC),
+    Rule("top_productos",
+         All(Has("producto", "productos"), Any(_IS_TOP, _IS_BOTTOM)),
+         "SELECT producto, SUM(cantidad*precio) AS total_ventas FROM {T} {where} GROUP BY producto "
+         "ORDER BY total_ventas {order} LIMIT {n};", "auto", _TOP_DESC),
+    Rule("top_vendedores",
+         All(Has("vendedor", "vendedores"), Any(_IS_TOP, _IS_BOTTOM), Has("cantidad", "unidades")),
+         "SELECT vendedor, SUM(cantidad) AS total_cantidad FROM {T} {where} GROUP BY vendedor "
+         "ORDER BY total_cantidad {order} LIMIT {n};", "auto", _TOP_DESC),
+    Rule("top_vendedores",
+         All(Has("vendedor", "vendedores"), Any(_IS_TOP, _IS_BOTTOM)),
+         "SELECT vendedor, SUM(cantidad*precio) AS total_ventas FROM {T} {where} GROUP BY vendedor "
+         "ORDER BY total_ventas {order} LIMIT {n};", "auto", _TOP_DESC),
 
     # --- Ranking por sede ---
-    if "por sede" in tn and ("ranking" in tn or "top" in tn or "mejores" in tn or "peores" in tn):
-        order = "ASC" if "peores" in tn or "bottom" in tn else "DESC"
-        sql = (
-            f"SELECT sede, SUM(cantidad*precio) AS total_ventas "
-            f"FROM {TABLE} {where_sql} GROUP BY sede "
-            f"ORDER BY total_ventas {order} LIMIT {n};"
-        ); return (sql, (chart or file_mode or "table", tuple(params)))
-
-    # --- Totales / promedios / precio promedio (global o por producto) ---
-    if "ticket promedio" in tn or "promedio por venta" in tn or _like(tn,"promedio","venta"):
-        sql = f"SELECT AVG(cantidad*precio) AS ticket_promedio FROM {TABLE} {where_sql};"
-        return (sql, ("text", tuple(params)))
-    if "promedio de precio" in tn or _like(tn,"precio","promedio"):
-        # si piden de un producto concreto (prod_like), el WHERE ya lo filtra
-        sql = f"SELECT AVG(precio) AS precio_promedio FROM {TABLE} {where_sql};"
-        return (sql, ("text", tuple(params)))
-
-    # --- Total de ventas (global o agrupado) ---
-    if "total de ventas" in tn or "ingreso" in tn or "facturacion" in tn or "facturación" in tn or "ventas totales" in tn:
-        if "por vendedor" in tn or "por vendedores" in tn:
-            sql = (
-                f"SELECT vendedor, SUM(cantidad*precio) AS total_ventas "
-                f"FROM {TABLE} {where_sql} GROUP BY vendedor ORDER BY total_ventas DESC;"
-            ); return (sql, (chart or file_mode or "table", tuple(params)))
-        if "por sede" in tn or "por sedes" in tn:
-            sql = (
-                f"SELECT sede, SUM(cantidad*precio) AS total_ventas "
-                f"FROM {TABLE} {where_sql} GROUP BY sede ORDER BY total_ventas DESC;"
-            ); return (sql, (chart or file_mode or "table", tuple(params)))
-        if "por producto" in tn or "por productos" in tn:
-            sql = (
-                f"SELECT producto, SUM(cantidad*precio) AS total_ventas "
-                f"FROM {TABLE} {where_sql} GROUP BY producto ORDER BY total_ventas DESC;"
-            ); return (sql, (chart or file_mode or "table", tuple(params)))
-        sql = f"SELECT SUM(cantidad*precio) AS total_ventas FROM {TABLE} {where_sql};"
-        return (sql, ("text", tuple(params)))
+    Rule("ranking_sedes",
+         All(Has("por sede"), Has("ranking", "top", "mejores", "peores")),
+         "SELECT sede, SUM(cantidad*precio) AS total_ventas FROM {T} {where} GROUP BY sede "
+         "ORDER BY total_ventas {order} LIMIT {n};", "auto", Not(Has("peores", "bottom"))),
+
+    # --- Ticket promedio / precio promedio ---
+    Rule("ticket_promedio",
+         Any(Has("ticket promedio", "promedio por venta"), HasAll("promedio", "venta")),
+         "SELECT AVG(cantidad*precio) AS ticket_promedio FROM {T} {where};", "text"),
+    # si piden de un producto concreto, el WHERE ya lo filtra
+    Rule("precio_promedio",
+         Any(Has("promedio de precio"), HasAll("precio", "promedio")),
+         "SELECT AVG(precio) AS precio_promedio FROM {T} {where};", "text"),
+
+    # --- Total de ventas (agrupado o global) ---
+    *(Rule(rid, All(Has("total de ventas", "ingreso", "facturacion", "facturación", "ventas totales"), group),
+           sql, mode)
+      for rid, group, sql, mode in (
+          ("total_por_vendedor", Has("por vendedor", "por vendedores"),
+           "SELECT vendedor, SUM(cantidad*precio) AS total_ventas FROM {T} {where} GROUP BY vendedor ORDER BY total_ventas DESC;", "auto"),
+          ("total_por_sede", Has("por sede", "por sedes"),
+           "SELECT sede, SUM(cantidad*precio) AS total_ventas FROM {T} {where} GROUP BY sede ORDER BY total_ventas DESC;", "auto"),
+          ("total_por_producto", Has("por producto", "por productos"),
+           "SELECT producto, SUM(cantidad*precio) AS total_ventas FROM {T} {where} GROUP BY producto ORDER BY total_ventas DESC;", "auto"),
+          ("total_ventas", Always(),
+           "SELECT SUM(cantidad*precio) AS total_ventas FROM {T} {where};", "text"),
+      )),
 
     # --- Cantidad/Unidades por agrupación ---
-    if "cantidad" in tn or "unidades" in tn:
-        if "por vendedor" in tn:
-            sql = (
-                f"SELECT vendedor, SUM(cantidad) AS total_cantidad "
-                f"FROM {TABLE} {where_sql} GROUP BY vendedor ORDER BY total_cantidad DESC;"
-            ); return (sql, (chart or file_mode or "table", tuple(params)))
-        if "por sede" in tn:
-            sql = (
-                f"SELECT sede, SUM(cantidad) AS total_cantidad "
-                f"FROM {TABLE} {where_sql} GROUP BY sede ORDER BY total_cantidad DESC;"
-            ); return (sql, (chart or file_mode or "table", tuple(params)))
-        if "por producto" in tn or "por productos" in tn:
-            sql = (
-                f"SELECT producto, SUM(cantidad) AS total_cantidad "
-                f"FROM {TABLE} {where_sql} GROUP BY producto ORDER BY total_cantidad DESC;"
-            ); return (sql, (chart or file_mode or "table", tuple(params)))
-
-    # --- Participación (%) por grupo (producto/vendedor/sede) ---
-    if "participacion" in tn or "participación" in tn or "porcentaje" in tn:
-        # Detectar grupo
-        if "por vendedor" in tn:
-            sql = (
-                f"SELECT vendedor, "
-                f"SUM(cantidad*precio) AS total_ventas, "
-                f"ROUND(100.0*SUM(cantidad*precio) / "
-                f"(SELECT SUM(cantidad*precio) FROM {TABLE} {where_sql}), 2) AS pct "
-                f"FROM {TABLE} {where_sql} GROUP BY vendedor ORDER BY total_ventas DESC;"
-            ); return (sql, ("table", tuple(params)))
-        if "por sede" in tn:
-            sql = (
-                f"SELECT sede, "
-                f"SUM(cantidad*precio) AS total_ventas, "
-                f"ROUND(100.0*SUM(cantidad*precio) / "
-                f"(SELECT SUM(cantidad*precio) FROM {TABLE} {where_sql}), 2) AS pct "
-                f"FROM {TABLE} {where_sql} GROUP BY sede ORDER BY total_ventas DESC;"
-            ); return (sql, ("table", tuple(params)))
-        # por producto (default)
-        sql = (
-            f"SELECT producto, "
-            f"SUM(cantidad*precio) AS total_ventas, "
-            f"ROUND(100.0*SUM(cantidad*precio) / "
-            f"(SELECT SUM(cantidad*precio) FROM {TABLE} {where_sql}), 2) AS pct "
-            f"FROM {TABLE} {where_sql} GROUP BY producto ORDER BY total_ventas DESC;"
-        ); return (sql, ("table", tuple(params)))
-
-    # --- Tendencias por tiempo (opcionalmente por producto/vendedor) ---
-    if "por dia" in tn or "por día" in tn:
-        sql = (
-            f"SELECT date(fecha) AS dia, SUM(cantidad*precio) AS total_ventas "
-            f"FROM {TABLE} {where_sql} GROUP BY dia ORDER BY dia;"
-        ); return (sql, (chart or "line", tuple(params)))
-    if "por mes" in tn:
-        sql = (
-            f"SELECT strftime('%Y-%m', date(fecha)) AS mes, SUM(cantidad*precio) AS total_ventas "
-            f"FROM {TABLE} {where_sql} GROUP BY mes ORDER BY mes;"
-        ); return (sql, (chart or "line", tuple(params)))
-    if "por año" in tn or "por anio" in tn:
-        sql = (
-            f"SELECT strftime('%Y', date(fecha)) AS anio, SUM(cantidad*precio) AS total_ventas "
-            f"FROM {TABLE} {where_sql} GROUP BY anio ORDER BY anio;"
-        ); return (sql, (chart or "line", tuple(params)))
-
-    # --- Exportaciones explícitas ---
-    if file_mode:
-        # por defecto exportamos ventas por vendedor (filtrado si aplicó)
-        sql = (
-            f"SELECT vendedor, SUM(cantidad*precio) AS total_ventas "
-            f"FROM {TABLE} {where_sql} GROUP BY vendedor ORDER BY total_ventas DESC;"
-        ); return (sql, (file_mode, tuple(params)))
+    *(Rule(rid, All(Has("cantidad", "unidades"), group), sql, "auto")
+      for rid, group, sql in (
+          ("cantidad_por_vendedor", Has("por vendedor"),
+           "SELECT vendedor, SUM(cantidad) AS total_cantidad FROM {T} {where} GROUP BY vendedor ORDER BY total_cantidad DESC;"),
+          ("cantidad_por_sede", Has("por sede"),
+           "SELECT sede, SUM(cantidad) AS total_cantidad FROM {T} {where} GROUP BY sede ORDER BY total_cantidad DESC;"),
+          ("cantidad_por_producto", Has("por producto", "por productos"),
+           "SELECT producto, SUM(cantidad) AS total_cantidad FROM {T} {where} GROUP BY producto ORDER BY total_cantidad DESC;"),
+      )),
+
+    # --- Participación (%) por grupo (producto por defecto) ---
+    *(Rule(rid, All(Has("participacion", "participación", "porcentaje"), group), _PCT.replace("{g}", g), "table")
+      for rid, group, g in (
+          ("participacion_vendedor", Has("por vendedor"), "vendedor"),
+          ("participacion_sede", Has("por sede"), "sede"),
+          ("participacion_producto", Always(), "producto"),
+      )),
+
+    # --- Tendencias por tiempo ---
+    Rule("tendencia_dia", Has("por dia", "por día"),
+         "SELECT date(fecha) AS dia, SUM(cantidad*precio) AS total_ventas FROM {T} {where} GROUP BY dia ORDER BY dia;",
+         "chart_line"),
+    Rule("tendencia_mes", Has("por mes"),
+         "SELECT strftime('%Y-%m', date(fecha)) AS mes, SUM(cantidad*precio) AS total_ventas FROM {T} {where} "
+         "GROUP BY mes ORDER BY mes;", "chart_line"),
+    Rule("tendencia_anio", Has("por año", "por anio"),
+         "SELECT strftime('%Y', date(fecha)) AS anio, SUM(cantidad*precio) AS total_ventas FROM {T} {where} "
+         "GROUP BY anio ORDER BY anio;", "chart_line"),
+
+    # --- Exportaciones explícitas: por defecto ventas por vendedor ---
+    Rule("exportar_default", _FILE,
+         "SELECT vendedor, SUM(cantidad*precio) AS total_ventas FROM {T} {where} GROUP BY vendedor "
+         "ORDER BY total_ventas DESC;", "file"),
 
     # --- Mostrar tabla / lista ---
-    if any(k in tn for k in ["tabla","muestr","lista","ver ventas","detalle"]):
-        sql = f"SELECT * FROM {TABLE} {where_sql} ORDER BY date(fecha) DESC, id DESC LIMIT 200;"
-        return (sql, ("table", tuple(params)))
+    Rule("tabla", Has("tabla", "muestr", "lista", "ver ventas", "detalle"),
+         "SELECT * FROM {T} {where} ORDER BY date(fecha) DESC, id DESC LIMIT 200;", "table"),
 
     # --- Fallback genérico ---
-    sql = f"SELECT * FROM {TABLE} {where_sql} LIMIT 50;"
-    return (sql, ("table", tuple(params)))
+    Rule("fallback", Always(), "SELECT * FROM {T} {where} LIMIT 50;", "table"),
+)
+
+# ---------------- Compilación ----------------
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Regex equivalente a un trie de `words`; en cada posición captura el literal más largo."""
+    trie: Dict[str, dict] = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        end = "" in node
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if end:
+            body = (body if len(alts) == 1 and len(alts[0]) == 1 else "(?:" + body + ")") + "?"
+        return body
+
+    return build(trie)
+
+class RuleEngine:
+    """Tabla de reglas compilada: un escaneo de literales + índice literal → reglas."""
+
+    def __init__(self, rules: Sequence[Rule], table: str = TABLE):
+        self.rules = tuple(rules)
+        self._preds = [r.when.compile() for r in self.rules]
+        self._desc = [r.desc.compile() if r.desc else None for r in self.rules]
+        self._sql = [r.sql.replace("{T}", table) for r in self.rules]
+
+        chart_file = {k for words in (CHART_WORDS, FILE_WORDS) for _, keys in words for k in keys}
+        literals = set(chart_file)
+        for r in self.rules:
+            literals |= r.when.literals()
+            if r.desc:
+                literals |= r.desc.literals()
+        literals.discard("")
+        # En una posición solo se captura el literal más largo; los que son prefijo suyo también aparecen
+        self._prefixes = {w: frozenset(p for p in literals if w.startswith(p)) for w in literals}
+        self._scan = re.compile("(?=(" + _trie_pattern(literals) + "))")
+
+        # Reglas sin requisito de literales son candidatas siempre
+        self._always: List[int] = []
+        self._index: Dict[str, List[int]] = {}
+        for i, r in enumerate(self.rules):
+            needs = r.when.needs()
+            if needs is None:
+                self._always.append(i)
+            else:
+                for lit in needs:
+                    self._index.setdefault(lit, []).append(i)
+
+    def scan(self, tn: str) -> FrozenSet[str]:
+        """Literales de la tabla presentes en `tn` (como subcadena)."""
+        present: Set[str] = set()
+        for m in self._scan.finditer(tn):
+            w = m.group(1)
+            if w and w not in present:
+                present |= self._prefixes[w]
+        return frozenset(present)
+
+    def match(self, tn: str, present: Optional[FrozenSet[str]] = None) -> Tuple[int, FrozenSet[str]]:
+        """Índice de la primera regla que dispara y los literales presentes."""
+        present = self.scan(tn) if present is None else present
+        candidates = set(self._always)
+        for lit in present:
+            candidates.update(self._index.get(lit, ()))
+        for i in sorted(candidates):
+            if self._preds[i](tn, present):
+                return i, present
+        raise LookupError("ninguna regla aplica (falta una regla 'fallback')")
+
+    def generate(self, user_text: str):
+        tl = user_text.strip()
+        if not tl:
+            return ("vacio", f"SELECT * FROM {TABLE} LIMIT 20;", ("table", ()))
+        tn = _norm(tl)
+        i, present = self.match(tn)
+        rule = self.rules[i]
+
+        # Entidades en una pasada por los tokens; gráfico/archivo desde el escaneo de literales
+        ent = _extract_entities(tn)
+        where_sql, params = _build_where(ent.city, ent.dfrom, ent.dto, ent.product, ent.seller)
+        chart = _pick_word(CHART_WORDS, present.__contains__)
+        file_mode = _pick_word(FILE_WORDS, present.__contains__)
+        if rule.mode == "auto":
+            mode = chart or file_mode or "table"
+        elif rule.mode == "chart_line":
+            mode = chart or "line"
+        elif rule.mode == "file":
+            mode = file_mode
+        else:
+            mode = rule.mode
+
+        desc = self._desc[i]
+        sql = self._sql[i].format(
+            where=where_sql,
+            n=5 if ent.n is None else ent.n,
+            order="" if desc is None else ("DESC" if desc(tn, present) else "ASC"),
+        )
+        return (rule.id, sql, (mode, tuple(params)))
+
+ENGINE = RuleEngine(RULES)
+
+# ---------------- Generador NL → SQL ----------------
+def generate_sql(user_text: str):
+    """
+    Devuelve: (sql, (mode, params))
+      sql:   str con '?' (SQLite)
+      mode:  'table'|'bar'|'line'|'pie'|'csv'|'csv.gz'|'parquet'|'arrow'|'excel'|'text'
+      params: tuple
+    """
+    return generate_sql_rule(user_text)[1:]
+
+def generate_sql_rule(user_text: str):
+    """
+    Igual que generate_sql pero indica qué regla respondió:
+    (rule_id, sql, (mode, params)). 'tabla', 'fallback' y 'vacio' son las
+    reglas genéricas; el resto corresponde a una forma de pregunta concreta.
+    """
+    return ENGINE.generate(user_text)
 
 # --- Compatibilidad / seguridad ---
 def is_sql_safe(sql: str) -> bool:
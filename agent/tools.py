@@ -4,14 +4,21 @@ Herramientas (tools) para el agente inteligente.
 Cada tool puede ser llamada por el LLM cuando lo considere apropiado.
 """
 
-import asyncio
+import functools
 import pandas as pd
-from typing import Optional, Literal
+from typing import List, Optional, Literal
 from pathlib import Path
 from strands import tool
 
-from agent.db import init_db
-from agent.outputs import render_chart, save_file
+from agent.db import init_db, query, data_version
+from agent.cache import RESULT_CACHE, normalize_sql
+from agent.results import RESULTS, PREVIEW_ROWS, FETCH_MAX_ROWS
+from agent.artifacts import ARTIFACTS
+from agent.charts import render_async, render_options
+from agent.export import export_frame, export_query, extension, format_stats
+from agent.executor import run_io, run_cpu
+from agent.loop import run
+from agent.memory import Memory, current, is_handle
 
 
 @tool
@@ -25,14 +32,17 @@ async def query_database(sql_query: str) -> str:
                   producto, cantidad, precio, fecha, total.
     
     Returns:
-        Resultados de la consulta en formato de texto tabular.
+        Resultados de la consulta en formato de texto tabular. Si el resultado
+        es grande, devuelve solo una vista previa (primeras filas) y un handle
+        (r_xxxxxxxx) para pedir el resto con fetch_rows. Si es completo, queda
+        en memoria bajo un handle m_xxxxxxxx para graficarlo o exportarlo luego.
         
     Example:
         sql_query = "SELECT producto, SUM(cantidad) AS total FROM ventas GROUP BY producto LIMIT 5"
     """
     try:
-        # Asegurar que la BD esté inicializada
-        init_db()
+        # Asegurar que la BD esté inicializada (fuera del event loop)
+        await run_io(init_db)
         
         # Validación básica de seguridad
         sql_lower = sql_query.lower().strip()
@@ -43,42 +53,169 @@ async def query_database(sql_query: str) -> str:
         if not sql_lower.startswith("select"):
             return f"❌ Error: Solo se permiten consultas SELECT."
         
-        # Ejecutar consulta directamente con SQLite (más estable que MCP)
-        import sqlite3
-        from pathlib import Path
-        
-        db_path = Path("data/ventas.sqlite")
-        with sqlite3.connect(db_path) as conn:
-            df = pd.read_sql_query(sql_query, conn)
+        # Caché compartida o, si no está, cursor con solo la vista previa (más estable que MCP)
+        handle, df, saved = await run_io(_open_preview, sql_query, current())
         
         if df.empty:
             return "⚠️ La consulta no devolvió resultados."
         
-        # Retornar tabla formateada
-        result = f"✅ Consulta ejecutada exitosamente. Resultados:\n\n"
-        result += df.to_string(index=False)
-        result += f"\n\n📊 Total de filas: {len(df)}"
+        if handle is None and len(df) <= PREVIEW_ROWS:
+            # Resultado completo y pequeño: retornar tabla formateada
+            result = f"✅ Consulta ejecutada exitosamente. Resultados:\n\n"
+            result += df.to_string(index=False)
+            result += f"\n\n📊 Total de filas: {len(df)}"
+            result += f"\n🧠 En memoria como {saved}: pásalo como sql_query a generate_chart o export_to_file para no repetir la consulta."
+            return result
         
+        # Resultado grande: paginar el cursor (r_…) o, si vino completo de la caché, la memoria (m_…)
+        ref = handle.id if handle is not None else saved
+        result = f"✅ Consulta ejecutada exitosamente. Vista previa (primeras {PREVIEW_ROWS} filas):\n\n"
+        result += df.head(PREVIEW_ROWS).to_string(index=False)
+        if handle is None:
+            result += f"\n\n📊 Total de filas: {len(df)}. Handle del resultado: {ref}"
+        else:
+            result += f"\n\n📊 Hay más filas. Handle del resultado: {ref}"
+        result += f"\n   Usa fetch_rows(handle=\"{ref}\", offset={PREVIEW_ROWS}, limit=50) para ver más."
         return result
         
     except Exception as e:
         return f"❌ Error al ejecutar la consulta: {str(e)}"
 
 
+def _open_preview(sql_query: str, memory: Memory):
+    """
+    Busca el resultado en la caché compartida (RESULT_CACHE) y, si está, lo
+    devuelve completo sin abrir un cursor: (None, df, handle de memoria).
+    Si no, abre un cursor en vivo y lee PREVIEW_ROWS + 1 filas. Si cabe en la
+    vista previa, cierra el cursor, deja el DataFrame en la caché y en
+    `memory`, y devuelve (None, df, handle de memoria); si no, devuelve
+    (handle del cursor, vista previa, None).
+    """
+    version = data_version()
+    key = RESULT_CACHE.key(sql_query, (), version)
+    cached = RESULT_CACHE.get(key)
+    if cached is not None:
+        saved = memory.put(cached, sql_query, version) if not cached.empty else None
+        return None, cached.copy(deep=False), saved
+    
+    handle = RESULTS.open(sql_query)
+    rows = handle.head(PREVIEW_ROWS + 1)
+    df = pd.DataFrame.from_records(rows, columns=handle.columns, coerce_float=True)
+    if len(rows) <= PREVIEW_ROWS:
+        RESULTS.close(handle.id)
+        RESULT_CACHE.put(key, df)
+        saved = memory.put(df, sql_query, version) if not df.empty else None
+        return None, df.copy(deep=False), saved
+    return handle, df.iloc[:PREVIEW_ROWS], None
+
+
+async def _load(sql_query: str):
+    """
+    DataFrame de `sql_query`, que puede ser SQL o un handle de la memoria de
+    la conversación (m_xxxxxxxx; entonces no se consulta la BD).
+    
+    Returns:
+        (df, sql normalizado, versión de los datos, handle de memoria);
+        df es None si el handle no existe o se olvidó
+    """
+    memory = current()
+    if is_handle(sql_query):
+        entry = memory.entry(sql_query)
+        df = None if entry is None else await run_io(memory.get, entry.handle)
+        if df is None:
+            return None, "", "", sql_query.strip()
+        return df, entry.sql, entry.version, entry.handle
+    
+    # Asegurar que la BD esté inicializada (fuera del event loop)
+    await run_io(init_db)
+    # Ejecutar consulta con la conexión de solo lectura del pool
+    df = await run_io(query, sql_query)
+    version = await run_io(data_version)
+    saved = await run_io(memory.put, df, sql_query, version) if not df.empty else None
+    return df, normalize_sql(sql_query), version, saved
+
+
+def _forgotten(handle: str) -> str:
+    return f"❌ Error: El handle '{handle}' no existe o se olvidó. Vuelve a ejecutar la consulta con SQL."
+
+
+@tool
+async def fetch_rows(handle: str, offset: int = 0, limit: int = 50) -> str:
+    """
+    Lee una página de un resultado grande devuelto por query_database.
+    
+    Args:
+        handle: Handle del resultado (ej: "r_1a2b3c4d" o "m_1a2b3c4d") que devolvió query_database
+        offset: Índice de la primera fila a leer (0 = primera fila)
+        limit: Cantidad de filas a leer (máximo 200)
+    
+    Returns:
+        Filas solicitadas en formato de texto tabular e indicación de si hay más.
+    """
+    try:
+        if offset < 0 or limit < 1:
+            return f"❌ Error: offset debe ser >= 0 y limit >= 1 (recibido offset={offset}, limit={limit})."
+        if is_handle(handle):
+            return await _fetch_memory(handle.strip(), offset, limit)
+        try:
+            h = RESULTS.get(handle)
+        except KeyError:
+            return f"❌ Error: El handle '{handle}' no existe o expiró. Vuelve a ejecutar la consulta."
+        
+        rows = await run_io(h.fetch, offset, limit)
+        if not rows:
+            return f"⚠️ No hay filas desde offset={offset}. Total de filas: {h.total}"
+        
+        df = pd.DataFrame.from_records(rows, columns=h.columns, coerce_float=True)
+        return _page(df, handle, offset, limit, h.total)
+        
+    except Exception as e:
+        return f"❌ Error al leer filas: {str(e)}"
+
+
+async def _fetch_memory(handle: str, offset: int, limit: int) -> str:
+    """Página de un resultado completo guardado en la memoria (m_xxxxxxxx)."""
+    df = await run_io(current().get, handle)
+    if df is None:
+        return _forgotten(handle)
+    limit = min(limit, FETCH_MAX_ROWS)
+    page = df.iloc[offset:offset + limit]
+    if page.empty:
+        return f"⚠️ No hay filas desde offset={offset}. Total de filas: {len(df)}"
+    return _page(page, handle, offset, limit, len(df))
+
+
+def _page(df: pd.DataFrame, handle: str, offset: int, limit: int, total: Optional[int]) -> str:
+    end = offset + len(df)
+    result = f"✅ Filas {offset}–{end - 1} del resultado {handle}:\n\n"
+    result += df.to_string(index=False)
+    if total is not None and end >= total:
+        result += f"\n\n📊 Fin del resultado. Total de filas: {total}"
+    else:
+        result += f"\n\n📊 Hay más filas. Siguiente: fetch_rows(handle=\"{handle}\", offset={end}, limit={min(limit, FETCH_MAX_ROWS)})"
+    return result
+
+
 @tool
 async def generate_chart(
     sql_query: str,
     chart_type: Literal["bar", "line", "pie"],
-    title: Optional[str] = None
+    title: Optional[str] = None,
+    output_format: Literal["png", "svg", "webp"] = "png"
 ) -> str:
     """
     Genera un gráfico a partir de una consulta SQL y lo guarda como imagen.
+    Las series largas se reducen solas (líneas) y las categorías de menor valor
+    se agrupan en "Otros" (barras/torta), así que no hace falta limitar filas.
     
     Args:
         sql_query: Consulta SQL que devuelve datos para graficar. 
                   Debe retornar al menos 2 columnas: eje X y eje Y.
+                  También acepta el handle m_xxxxxxxx de un resultado anterior
+                  (p.ej. "ahora en torta"): usa esos datos sin volver a consultar.
         chart_type: Tipo de gráfico - "bar" (barras), "line" (línea), o "pie" (torta/pastel)
         title: Título opcional para el gráfico
+        output_format: "png" (por defecto), "svg" (vectorial) o "webp" (más liviano)
     
     Returns:
         Ruta del archivo de imagen generado o mensaje de error.
@@ -89,52 +226,60 @@ async def generate_chart(
         title = "Top 5 Productos Más Vendidos"
     """
     try:
-        # Asegurar que la BD esté inicializada
-        init_db()
-        
-        # Ejecutar consulta directamente con SQLite
-        import sqlite3
-        from pathlib import Path
-        
-        db_path = Path("data/ventas.sqlite")
-        with sqlite3.connect(db_path) as conn:
-            df = pd.read_sql_query(sql_query, conn)
+        df, source, version, saved = await _load(sql_query)
+        if df is None:
+            return _forgotten(saved)
         
         if df.empty or len(df.columns) < 2:
             return "⚠️ La consulta debe devolver al menos 2 columnas con datos para generar un gráfico."
         
-        # Generar gráfico
+        # Generar gráfico (o reutilizarlo: misma consulta, datos y opciones)
         x_col, y_col = df.columns[0], df.columns[1]
-        chart_path = render_chart(
-            df, 
-            chart=chart_type, 
-            x=x_col, 
-            y=y_col, 
-            title=title or f"{y_col} por {x_col}"
-        )
+        chart_title = title or f"{y_col} por {x_col}"
+        
+        async def build(path):
+            await render_async(df, chart_type, x=x_col, y=y_col, title=chart_title, out=path, fmt=output_format)
+            return {"rows": len(df)}
         
-        # También mostrar datos
-        data_preview = df.to_string(index=False)
+        options = {"chart": chart_type, "title": chart_title, "format": output_format, **render_options()}
+        artifact = await ARTIFACTS.get_or_create_async("chart", source, version, options, output_format, build)
         
-        return f"✅ Gráfico generado exitosamente.\n\n📊 Archivo: {chart_path}\n\n📋 Datos:\n{data_preview}"
+        # También mostrar datos (solo las primeras filas si son muchas)
+        data_preview = df.head(PREVIEW_ROWS).to_string(index=False)
+        if len(df) > PREVIEW_ROWS:
+            data_preview += f"\n... ({len(df)} filas en total)"
+        
+        reused = " (reutilizado)" if artifact.hit else ""
+        return (f"✅ Gráfico generado exitosamente{reused}.\n\n📊 Archivo: {artifact.path}\n"
+                f"🧠 Datos en memoria como {saved}\n\n📋 Datos:\n{data_preview}")
         
     except Exception as e:
         return f"❌ Error al generar el gráfico: {str(e)}"
 
 
+class _NoRows(Exception):
+    """La exportación quedó vacía: se descarta en lugar de guardarla como artefacto."""
+
+
 @tool
 async def export_to_file(
     sql_query: str,
-    format: Literal["csv", "excel"] = "csv",
-    filename: Optional[str] = None
+    format: Literal["csv", "csv.gz", "parquet", "arrow", "excel"] = "csv",
+    filename: Optional[str] = None,
+    summary_by: Optional[List[str]] = None
 ) -> str:
     """
-    Exporta los resultados de una consulta SQL a un archivo CSV o Excel.
+    Exporta los resultados de una consulta SQL a un archivo CSV, CSV comprimido,
+    Parquet, Arrow o Excel. Se escribe en streaming, así que sirve para
+    resultados de millones de filas (Excel se reparte en varias hojas).
     
     Args:
-        sql_query: Consulta SQL para obtener los datos a exportar
-        format: Formato del archivo - "csv" o "excel"
+        sql_query: Consulta SQL para obtener los datos a exportar, o el handle
+                  m_xxxxxxxx de un resultado anterior ("exporta eso"): se
+                  escribe desde memoria sin volver a consultar
+        format: Formato del archivo - "csv", "csv.gz" (gzip), "parquet", "arrow" o "excel"
         filename: Nombre opcional del archivo (sin extensión)
+        summary_by: Solo Excel - columnas con hoja de totales, p.ej. ["sede"] o ["sede", "vendedor"]
     
     Returns:
         Ruta del archivo generado o mensaje de error.
@@ -144,25 +289,36 @@ async def export_to_file(
         format = "csv"
     """
     try:
-        # Asegurar que la BD esté inicializada
-        init_db()
+        if is_handle(sql_query):
+            # Resultado ya en memoria: se escribe el DataFrame, sin la BD
+            df, source, version, saved = await _load(sql_query)
+            if df is None:
+                return _forgotten(saved)
+            write = functools.partial(export_frame, df)
+        else:
+            # Asegurar que la BD esté inicializada (fuera del event loop)
+            await run_io(init_db)
+            # Cursor → archivo por bloques, sin DataFrame
+            source, version = normalize_sql(sql_query), await run_io(data_version)
+            write = functools.partial(export_query, sql_query)
         
-        # Ejecutar consulta directamente con SQLite
-        import sqlite3
-        from pathlib import Path
+        # Serializar filas es CPU (csv/openpyxl en Python): corre en el pool de procesos
+        async def build(path):
+            stats = await run_cpu(write, format, str(path), summary_by=summary_by)
+            if stats["rows"] == 0:
+                raise _NoRows  # no se publica ni se anota en last_artifacts
+            stats.pop("path")
+            return stats
         
-        db_path = Path("data/ventas.sqlite")
-        with sqlite3.connect(db_path) as conn:
-            df = pd.read_sql_query(sql_query, conn)
-        
-        if df.empty:
-            return "⚠️ La consulta no devolvió datos para exportar."
-        
-        # Guardar archivo
-        file_path = save_file(df, mode=format)
-        
-        return f"✅ Archivo exportado exitosamente.\n\n📎 Ruta: {file_path}\n📊 Filas exportadas: {len(df)}"
+        options = {"format": format, "summary_by": summary_by or []}
+        artifact = await ARTIFACTS.get_or_create_async("export", source, version, options, extension(format), build)
+        if artifact.hit:
+            return (f"✅ Archivo exportado exitosamente (reutilizado: misma consulta, datos y formato).\n\n"
+                    f"📎 Ruta: {artifact.path}\n📊 Filas exportadas: {artifact.meta['rows']:,}")
+        return f"✅ Archivo exportado exitosamente.\n\n📎 Ruta: {artifact.path}\n{format_stats(artifact.meta)}"
         
+    except _NoRows:
+        return "⚠️ La consulta no devolvió datos para exportar."
     except Exception as e:
         return f"❌ Error al exportar archivo: {str(e)}"
 
@@ -221,15 +377,22 @@ Columnas:
     return schema
 
 
-# Versiones síncronas para compatibilidad (wrappean las async)
+# Versiones síncronas para compatibilidad (wrappean las async; corren en el
+# loop de fondo de agent.loop, no en uno nuevo por llamada)
 def query_database_sync(sql_query: str) -> str:
     """Versión síncrona de query_database"""
-    return asyncio.run(query_database(sql_query))
+    return run(query_database(sql_query))
+
+def fetch_rows_sync(handle: str, offset: int = 0, limit: int = 50) -> str:
+    """Versión síncrona de fetch_rows"""
+    return run(fetch_rows(handle, offset, limit))
 
-def generate_chart_sync(sql_query: str, chart_type: Literal["bar", "line", "pie"], title: Optional[str] = None) -> str:
+def generate_chart_sync(sql_query: str, chart_type: Literal["bar", "line", "pie"], title: Optional[str] = None,
+                        output_format: Literal["png", "svg", "webp"] = "png") -> str:
     """Versión síncrona de generate_chart"""
-    return asyncio.run(generate_chart(sql_query, chart_type, title))
+    return run(generate_chart(sql_query, chart_type, title, output_format))
 
-def export_to_file_sync(sql_query: str, format: Literal["csv", "excel"] = "csv", filename: Optional[str] = None) -> str:
+def export_to_file_sync(sql_query: str, format: Literal["csv", "csv.gz", "parquet", "arrow", "excel"] = "csv",
+                        filename: Optional[str] = None, summary_by: Optional[List[str]] = None) -> str:
     """Versión síncrona de export_to_file"""
-    return asyncio.run(export_to_file(sql_query, format, filename))
+    return run(export_to_file(sql_query, format, filename, summary_by))
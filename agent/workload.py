@@ -0,0 +1,414 @@
+# agent/workload.py
+"""
+Registro de la carga de consultas, log de consultas lentas y asesor de índices.
+
+Cada SELECT que ejecuta el agente (agent.db.query y los handles de resultados)
+queda en data/workload.sqlite con su latencia, filas devueltas, la tabla a la
+que se envió (ventas o un rollup) y la salida de EXPLAIN QUERY PLAN. Las que
+superan SLOW_QUERY_MS se agregan además a data/slow_queries.log (JSON por línea).
+
+record() no toca disco: encola la consulta y vuelve. Un hilo de fondo saca la
+cola por tandas, corre EXPLAIN QUERY PLAN con su propia conexión de solo
+lectura (los planes se memorizan en un LRU de WORKLOAD_PLAN_CACHE entradas) e
+inserta la tanda en una transacción. Si la cola se llena (WORKLOAD_QUEUE_MAX)
+las consultas nuevas se descartan y se cuentan en `dropped`. flush() espera a
+que se escriba lo encolado; al salir del proceso se vacía sola.
+
+Uso:
+    python -m agent.workload slow [--limit 20]
+    python -m agent.workload advise [--min-count 2] [--apply]
+"""
+
+import argparse
+import atexit
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from agent.cache import normalize_sql
+
+WORKLOAD_ENABLED = os.getenv("WORKLOAD_LOG", "true").lower() != "false"
+WORKLOAD_PATH = Path(os.getenv("WORKLOAD_DB", "data/workload.sqlite"))
+SLOW_LOG_PATH = Path(os.getenv("SLOW_QUERY_LOG", "data/slow_queries.log"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+WORKLOAD_QUEUE_MAX = int(os.getenv("WORKLOAD_QUEUE_MAX", "10000"))
+WORKLOAD_PLAN_CACHE = int(os.getenv("WORKLOAD_PLAN_CACHE", "256"))
+_WRITE_BATCH = 500
+
+# Columnas máximas de un índice propuesto (incluyendo las de cobertura)
+MAX_INDEX_COLS = 6
+# Tablas con menos filas se recorren más rápido de lo que cuesta mantener un índice
+MIN_TABLE_ROWS = 10_000
+
+
+_COLUMNS = ("ts", "sql", "executed", "tabla", "params", "ms", "rows", "plan", "full_scan")
+
+
+class WorkloadRecorder:
+    """Guarda cada consulta ejecutada, fuera del camino de la consulta. Nunca la hace fallar."""
+
+    def __init__(self, path: Path = WORKLOAD_PATH, slow_log: Path = SLOW_LOG_PATH,
+                 slow_ms: float = SLOW_QUERY_MS, queue_max: int = WORKLOAD_QUEUE_MAX,
+                 plan_cache: int = WORKLOAD_PLAN_CACHE):
+        self.path = Path(path)
+        self.slow_log = Path(slow_log)
+        self.slow_ms = slow_ms
+        self.plan_cache = plan_cache
+        self.dropped = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._plans: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=queue_max)
+        self._writer: Optional[threading.Thread] = None
+        self._at_exit = False
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS statements ("
+                "id INTEGER PRIMARY KEY, ts TEXT, sql TEXT, executed TEXT, tabla TEXT, "
+                "params TEXT, ms REAL, rows INTEGER, plan TEXT, full_scan INTEGER)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_statements_executed ON statements(executed)")
+            self._conn = conn
+        return self._conn
+
+    def plan(self, conn: sqlite3.Connection, sql: str, params: Sequence = ()) -> str:
+        """EXPLAIN QUERY PLAN de `sql`, memorizado (LRU) por texto y versión del esquema."""
+        key = (sql, conn.execute("PRAGMA schema_version").fetchone()[0])
+        plan = self._plans.get(key)
+        if plan is None:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", tuple(params)).fetchall()
+            plan = "\n".join(r[-1] for r in rows)
+            self._plans[key] = plan
+            while len(self._plans) > self.plan_cache:
+                self._plans.popitem(last=False)
+        else:
+            self._plans.move_to_end(key)
+        return plan
+
+    def record(self, sql: str, executed: str, params: Sequence,
+               seconds: float, rows: Optional[int]) -> None:
+        """
+        Encola la consulta para registrarla en segundo plano.
+
+        Args:
+            sql: SQL pedido
+            executed: SQL efectivamente ejecutado (p.ej. reescrito a un rollup)
+            params: Parámetros
+            seconds: Tiempo en SQLite
+            rows: Filas devueltas
+        """
+        if not WORKLOAD_ENABLED:
+            return
+        if self._writer is None:
+            self._start()
+        item = (time.strftime("%Y-%m-%dT%H:%M:%S"), sql, executed, tuple(params), seconds, rows)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que se escriba todo lo encolado; False si venció `timeout`."""
+        if self._writer is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                left = None if deadline is None else deadline - time.monotonic()
+                if left is not None and left <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(left)
+        return True
+
+    def close(self) -> None:
+        """Escribe lo pendiente, detiene el hilo de fondo y cierra el archivo."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # ---------------- Hilo de fondo ----------------
+    def _start(self) -> None:
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="workload-writer", daemon=True)
+                self._writer.start()
+                if not self._at_exit:
+                    self._at_exit = True
+                    atexit.register(self.close)
+
+    def _run(self) -> None:
+        while True:
+            items = [self._queue.get()]
+            while items[-1] is not None and len(items) < _WRITE_BATCH:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = items[-1] is None
+            try:
+                self._write([i for i in items if i is not None])
+            except Exception:
+                pass  # el registro es diagnóstico: una falla aquí no debe afectar a nadie
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, items: List[tuple]) -> None:
+        if not items:
+            return
+        from agent.db import DB_PATH, connect_ro
+
+        entries = []
+        with closing(connect_ro(DB_PATH)) as conn:
+            for ts, sql, executed, params, seconds, rows in items:
+                try:
+                    plan = self.plan(conn, executed, params)
+                except sqlite3.Error:
+                    plan = ""  # p.ej. la tabla de un rollup ya no existe
+                entries.append({
+                    "ts": ts,
+                    "sql": normalize_sql(sql),
+                    "executed": normalize_sql(executed),
+                    "tabla": _scanned_table(executed),
+                    "params": json.dumps(list(params), ensure_ascii=False, default=str),
+                    "ms": round(seconds * 1000, 3),
+                    "rows": rows,
+                    "plan": plan,
+                    "full_scan": int(is_full_scan(plan)),
+                })
+        db = self._db()
+        db.execute("BEGIN")
+        try:
+            db.executemany(
+                f"INSERT INTO statements ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                [tuple(e[c] for c in _COLUMNS) for e in entries],
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        slow = [e for e in entries if e["ms"] >= self.slow_ms]
+        if slow:
+            with open(self.slow_log, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(e, ensure_ascii=False) + "\n" for e in slow)
+
+
+RECORDER = WorkloadRecorder()
+
+
+def is_full_scan(plan: str) -> bool:
+    """True si el plan recorre una tabla completa o agrupa con un B-tree temporal."""
+    return any(
+        (line.startswith("SCAN ") and " USING " not in line) or "TEMP B-TREE FOR GROUP BY" in line
+        for line in (l.strip() for l in plan.splitlines())
+    )
+
+
+def _scanned_table(sql: str) -> str:
+    m = re.search(r"\bfrom\s+([A-Za-z_]\w*)", sql, re.IGNORECASE)
+    return m.group(1) if m else ""
+
+
+# ---------------- Asesor de índices ----------------
+_STRINGS_RE = re.compile(r"'(?:[^']|'')*'")
+_SEGMENT_RE = r"\b{kw}\b(.*?)(?=\bgroup\s+by\b|\bhaving\b|\border\s+by\b|\blimit\b|$)"
+
+
+def _segment(sql: str, kw: str) -> str:
+    m = re.search(_SEGMENT_RE.format(kw=kw), sql, re.DOTALL)
+    return m.group(1) if m else ""
+
+
+def _columns_in(text: str, columns: Sequence[str]) -> List[str]:
+    """Columnas de la tabla mencionadas en `text`, en orden de aparición."""
+    seen: List[str] = []
+    for ident in re.findall(r"[a-z_]\w*", text):
+        if ident in columns and ident not in seen:
+            seen.append(ident)
+    return seen
+
+
+def propose_index(sql: str, columns: Sequence[str]) -> Optional[Tuple[str, ...]]:
+    """
+    Índice compuesto para un SELECT sobre una sola tabla:
+    columnas con igualdad en WHERE → una con rango (o las del GROUP BY) →
+    resto de columnas referenciadas si cabe un índice de cobertura.
+    """
+    s = _STRINGS_RE.sub("?", sql.lower())
+    where = _segment(s, "where")
+    eq = [c for c in columns
+          if re.search(rf"(?<![\w(]){c}\s*(=|==|\bin\b|\bis\b)", where)]
+    rng = [c for c in columns
+           if c not in eq and re.search(rf"(?<![\w(]){c}\s*(<|>|\bbetween\b)", where)]
+    m = re.search(r"\bgroup\s+by\b(.*?)(?=\bhaving\b|\border\s+by\b|\blimit\b|$)", s, re.DOTALL)
+    group = [c for c in _columns_in(m.group(1) if m else "", columns) if c not in eq]
+
+    key = eq + (rng[:1] if rng else group)
+    if not key:
+        return None
+    rest = [c for c in _columns_in(s, columns) if c not in key]
+    if len(key) + len(rest) <= MAX_INDEX_COLS:
+        key += rest
+    return tuple(key[:MAX_INDEX_COLS])
+
+
+def _existing_indexes(conn: sqlite3.Connection, table: str) -> List[Tuple[str, ...]]:
+    out = []
+    for row in conn.execute(f"PRAGMA index_list({table})").fetchall():
+        cols = conn.execute(f"PRAGMA index_info({row[1]})").fetchall()
+        out.append(tuple(c[2] for c in cols))
+    # Clave primaria de tablas WITHOUT ROWID (los rollups) o INTEGER PRIMARY KEY
+    pk = [r[1] for r in sorted(conn.execute(f"PRAGMA table_info({table})").fetchall(), key=lambda r: r[5]) if r[5]]
+    if pk:
+        out.append(tuple(pk))
+    return out
+
+
+def advise(min_count: int = 1, workload: Path = WORKLOAD_PATH) -> List[Dict[str, object]]:
+    """
+    Lee el workload registrado y propone índices para las consultas que
+    recorren tablas completas, ordenados por tiempo total acumulado.
+    """
+    from agent.db import DB_PATH, connect_ro
+
+    RECORDER.flush()  # incluir lo encolado en este proceso
+    if not Path(workload).exists():
+        return []
+    with closing(sqlite3.connect(workload)) as wconn:
+        stmts = wconn.execute(
+            "SELECT executed, tabla, COUNT(*), SUM(ms) FROM statements "
+            "WHERE full_scan = 1 GROUP BY executed, tabla"
+        ).fetchall()
+
+    proposals: Dict[Tuple[str, Tuple[str, ...]], Dict[str, object]] = {}
+    with closing(connect_ro(DB_PATH)) as conn:
+        columns: Dict[str, List[str]] = {}
+        for sql, table, count, total_ms in stmts:
+            if not table:
+                continue
+            if table not in columns:
+                try:
+                    n = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                except sqlite3.OperationalError:  # tabla que ya no existe
+                    n = 0
+                columns[table] = [r[1] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()] \
+                    if n >= MIN_TABLE_ROWS else []
+            if not columns[table]:
+                continue
+            cols = propose_index(sql, columns[table])
+            if cols is None:
+                continue
+            existing = _existing_indexes(conn, table)
+            if any(ix[:len(cols)] == cols for ix in existing):
+                continue
+            p = proposals.setdefault((table, cols), {
+                "table": table, "columns": cols, "count": 0, "total_ms": 0.0, "example": sql,
+                "name": f"idx_{table}_{'_'.join(cols)}"[:60],
+            })
+            p["count"] += count
+            p["total_ms"] += total_ms
+
+    out = [p for p in proposals.values() if p["count"] >= min_count]
+    return sorted(out, key=lambda p: p["total_ms"], reverse=True)
+
+
+def apply(proposals: List[Dict[str, object]]) -> List[str]:
+    """
+    Crea los índices propuestos en data/ventas.sqlite y los registra en
+    'advised_indexes' para que la ingesta los vuelva a crear tras una recarga.
+    """
+    from agent.db import DB_PATH, ADVISED_TABLE, create_advised_indexes
+
+    created = []
+    with closing(sqlite3.connect(DB_PATH, isolation_level=None)) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {ADVISED_TABLE} ("
+                "name TEXT PRIMARY KEY, tabla TEXT NOT NULL, columns TEXT NOT NULL, created_at TEXT)"
+            )
+            for p in proposals:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {ADVISED_TABLE}(name, tabla, columns, created_at) VALUES (?, ?, ?, ?)",
+                    (p["name"], p["table"], ",".join(p["columns"]), time.strftime("%Y-%m-%dT%H:%M:%S")),
+                )
+                created.append(p["name"])
+            create_advised_indexes(conn)
+            conn.execute("ANALYZE")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return created
+
+
+def slowest(limit: int = 20, workload: Path = WORKLOAD_PATH) -> List[tuple]:
+    """Consultas con mayor tiempo acumulado: (sql, veces, ms total, ms máx, filas, recorre tabla)."""
+    RECORDER.flush()
+    if not Path(workload).exists():
+        return []
+    with closing(sqlite3.connect(workload)) as conn:
+        return conn.execute(
+            "SELECT sql, COUNT(*), SUM(ms), MAX(ms), MAX(rows), MAX(full_scan) FROM statements "
+            "GROUP BY sql ORDER BY SUM(ms) DESC LIMIT ?", (limit,)
+        ).fetchall()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m agent.workload",
+                                     description="Workload de consultas y asesor de índices")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_slow = sub.add_parser("slow", help="Consultas con mayor tiempo acumulado")
+    p_slow.add_argument("--limit", type=int, default=20)
+    p_adv = sub.add_parser("advise", help="Proponer índices compuestos o de cobertura")
+    p_adv.add_argument("--min-count", type=int, default=1, help="Ejecuciones mínimas para proponer")
+    p_adv.add_argument("--apply", action="store_true", help="Crear los índices propuestos")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "slow":
+        rows = slowest(args.limit)
+        if not rows:
+            print(f"⚠️ No hay consultas registradas en {WORKLOAD_PATH}")
+            return
+        for sql, count, total_ms, max_ms, nrows, scan in rows:
+            flag = "🐢 SCAN" if scan else "✅"
+            print(f"{flag} {count}x  total={total_ms:.1f}ms  máx={max_ms:.1f}ms  filas={nrows}\n   {sql}")
+        return
+
+    proposals = advise(min_count=args.min_count)
+    if not proposals:
+        print("✅ Sin propuestas: ninguna consulta registrada recorre tablas completas sin índice útil.")
+        return
+    for p in proposals:
+        print(f"💡 CREATE INDEX {p['name']} ON {p['table']}({', '.join(p['columns'])});")
+        print(f"   {p['count']} ejecuciones, {p['total_ms']:.1f}ms acumulados. Ej: {p['example']}")
+    if args.apply:
+        created = apply(proposals)
+        print(f"✅ Índices creados: {', '.join(created)}")
+    else:
+        print("ℹ️  Usa --apply para crearlos.")
+
+
+if __name__ == "__main__":
+    main()
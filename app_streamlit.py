@@ -1,17 +1,23 @@
 # app_streamlit.py
 """
 Interfaz web con Streamlit para el Agente de Análisis de Ventas.
+
+Streamlit re-ejecuta el script en cada interacción. Lo que no cambia entre
+reruns se cachea para todo el proceso (st.cache_resource / st.cache_data): la
+preparación de la BD, el cliente de Bedrock (compartido por las sesiones; cada
+una tiene su propio agente e historial), el total de ventas por versión de
+datos y los bytes de los gráficos. El chat es un fragmento: enviar una
+pregunta re-ejecuta solo esa parte, no el sidebar ni el historial.
 """
 
 import streamlit as st
-import asyncio
 from pathlib import Path
 import os
-from datetime import datetime
 from PIL import Image
 
-from agent.bedrock_agent import create_agent
-from agent.db import init_db
+from agent.bedrock_agent import create_agent, create_model
+from agent.db import init_db, get_conn, data_version
+from agent.loop import iterate
 
 # Configuración de la página
 st.set_page_config(
@@ -49,6 +55,27 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# ---------------- Recursos cacheados por proceso ----------------
+@st.cache_resource(show_spinner=False)
+def preparar_bd() -> str:
+    return init_db()
+
+@st.cache_data(show_spinner=False)
+def total_ventas(version: str) -> int:
+    # La versión de los datos es la clave: una ingesta invalida el valor
+    return get_conn().execute("SELECT COUNT(*) FROM ventas").fetchone()[0]
+
+@st.cache_resource(show_spinner=False)
+def modelo_bedrock():
+    return create_model()
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def leer_imagen(path: str):
+    # Las rutas de agent.artifacts son por contenido: el archivo no cambia
+    if path.endswith(".svg"):
+        return Path(path).read_text(encoding="utf-8")
+    return Path(path).read_bytes()
+
 # Título principal
 st.title("🤖 Agente Inteligente de Análisis de Ventas")
 st.markdown("**Powered by Amazon Bedrock + Strands**")
@@ -62,8 +89,9 @@ with st.sidebar:
     st.subheader("Estado del Sistema")
     
     try:
-        init_db()
-        st.success("✅ Base de datos conectada")
+        preparar_bd()
+        total_filas = total_ventas(data_version())
+        st.success(f"✅ Base de datos conectada ({total_filas:,} ventas)")
     except Exception as e:
         st.error(f"❌ Error en BD: {str(e)}")
     
@@ -117,14 +145,13 @@ if "agent" not in st.session_state:
             # create_agent() ya maneja el modelo por defecto desde:
             # 1. Variable de entorno AWS_BEDROCK_MODEL_ID
             # 2. O usa "amazon.nova-lite-v1:0" por defecto
-            st.session_state.agent = create_agent()
+            st.session_state.agent = create_agent(model=modelo_bedrock())
             st.success("✅ Agente listo", icon="🤖")
         except Exception as e:
             st.error(f"❌ Error al inicializar agente: {str(e)}")
             st.stop()
 
-# Mostrar el historial de mensajes
-for message in st.session_state.messages:
+def mostrar_mensaje(message: dict) -> None:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
         
@@ -134,110 +161,129 @@ for message in st.session_state.messages:
             for idx, img_path in enumerate(message["images"]):
                 with cols[idx]:
                     if Path(img_path).exists():
-                        st.image(img_path, use_container_width=True)
-
-# Input del usuario
-pregunta = st.chat_input("Escribe tu pregunta sobre análisis de ventas...")
+                        st.image(leer_imagen(img_path), use_container_width=True)
 
-# Si hay una pregunta seleccionada del sidebar, usarla
-if "pregunta_seleccionada" in st.session_state:
-    pregunta = st.session_state.pregunta_seleccionada
-    del st.session_state.pregunta_seleccionada
+# Mostrar el historial de mensajes (los que llegaron después los pinta el chat)
+for message in st.session_state.messages:
+    mostrar_mensaje(message)
+st.session_state.pintados = len(st.session_state.messages)
 
-# Procesar la pregunta
-if pregunta:
-    # Agregar mensaje del usuario al historial
-    st.session_state.messages.append({"role": "user", "content": pregunta})
-    
-    # Mostrar mensaje del usuario
-    with st.chat_message("user"):
-        st.markdown(pregunta)
+@st.fragment
+def chat():
+    # Mensajes de preguntas anteriores respondidas dentro del fragmento
+    for message in st.session_state.messages[st.session_state.pintados:]:
+        mostrar_mensaje(message)
     
-    # Mostrar respuesta del asistente
-    with st.chat_message("assistant"):
-        message_placeholder = st.empty()
+    # Input del usuario
+    pregunta = st.chat_input("Escribe tu pregunta sobre análisis de ventas...")
+
+    # Si hay una pregunta seleccionada del sidebar, usarla
+    if "pregunta_seleccionada" in st.session_state:
+        pregunta = st.session_state.pregunta_seleccionada
+        del st.session_state.pregunta_seleccionada
+
+    # Procesar la pregunta
+    if pregunta:
+        # Agregar mensaje del usuario al historial
+        st.session_state.messages.append({"role": "user", "content": pregunta})
+        
+        # Mostrar mensaje del usuario
+        with st.chat_message("user"):
+            st.markdown(pregunta)
         
-        with st.spinner("🤔 Pensando..."):
+        # Mostrar respuesta del asistente
+        with st.chat_message("assistant"):
+            estado = st.status("🤔 Pensando...", expanded=False)
+            message_placeholder = st.empty()
+            
+            # Eventos de agent.stream(): el texto se muestra a medida que llega y
+            # cada tool aparece en el estado al empezar y al terminar. El agente
+            # corre en el loop de fondo de agent.loop (compartido por todas las
+            # sesiones); los elementos se actualizan desde el hilo del script
+            def get_response():
+                texto = ""
+                for evento in iterate(st.session_state.agent.stream(pregunta)):
+                    if evento["type"] == "text":
+                        texto += evento["data"]
+                        message_placeholder.markdown(texto + "▌")
+                    elif evento["type"] == "tool_start":
+                        estado.update(label=f"🔧 Ejecutando {evento['tool']}...")
+                    elif evento["type"] == "tool_end":
+                        icono = "✅" if evento["ok"] else "❌"
+                        estado.write(f"{icono} {evento['tool']} ({evento['seconds']:.1f}s)")
+                    elif evento["type"] == "done":
+                        return evento["answer"]
+            
             try:
-                # Ejecutar el agente de forma asíncrona
-                async def get_response():
-                    return await st.session_state.agent.ask(pregunta)
+                respuesta = get_response()
+                estado.update(label="✅ Listo", state="complete")
                 
-                respuesta = asyncio.run(get_response())
-                
-                # Mostrar la respuesta
+                # Mostrar la respuesta completa
                 message_placeholder.markdown(respuesta)
                 
-                # Buscar imágenes generadas recientemente
-                imagenes = []
-                data_dir = Path("data")
-                if data_dir.exists():
-                    # Buscar gráficos generados en los últimos 10 segundos
-                    now = datetime.now().timestamp()
-                    for img_file in data_dir.glob("grafico_*.png"):
-                        if now - img_file.stat().st_mtime < 10:  # Últimos 10 segundos
-                            imagenes.append(str(img_file))
+                # Gráficos y archivos de esta respuesta (manifiesto del agente,
+                # no un escaneo de data/: cada sesión ve solo los suyos)
+                artefactos = st.session_state.agent.last_artifacts
+                turno = len(st.session_state.messages)
+                graficos = [a for a in artefactos if a.kind == "chart"]
+                archivos = [a for a in artefactos if a.kind == "export"]
                 
                 # Mostrar imágenes si hay
-                if imagenes:
+                if graficos:
                     st.divider()
                     st.subheader("📊 Gráficos Generados")
-                    cols = st.columns(len(imagenes))
-                    for idx, img_path in enumerate(imagenes):
+                    cols = st.columns(len(graficos))
+                    for idx, artefacto in enumerate(graficos):
                         with cols[idx]:
-                            st.image(img_path, use_container_width=True)
+                            st.image(artefacto.path, use_container_width=True)
                             # Botón de descarga
-                            with open(img_path, "rb") as f:
+                            with open(artefacto.path, "rb") as f:
                                 st.download_button(
                                     label="⬇️ Descargar",
                                     data=f,
-                                    file_name=Path(img_path).name,
-                                    mime="image/png",
-                                    key=f"download_{Path(img_path).name}"
+                                    file_name=artefacto.name,
+                                    mime=artefacto.mime,
+                                    key=f"download_{turno}_{artefacto.id}"
                                 )
                 
-                # Buscar archivos CSV/Excel generados recientemente
-                archivos = []
-                for ext in ["csv", "xlsx"]:
-                    for archivo in data_dir.glob(f"salida_*.{ext}"):
-                        if now - archivo.stat().st_mtime < 10:  # Últimos 10 segundos
-                            archivos.append(str(archivo))
-                
                 # Mostrar archivos si hay
                 if archivos:
                     st.divider()
                     st.subheader("📎 Archivos Generados")
-                    for archivo in archivos:
-                        with open(archivo, "rb") as f:
+                    for artefacto in archivos:
+                        with open(artefacto.path, "rb") as f:
                             st.download_button(
-                                label=f"⬇️ Descargar {Path(archivo).name}",
+                                label=f"⬇️ Descargar {artefacto.name}",
                                 data=f,
-                                file_name=Path(archivo).name,
-                                mime="text/csv" if archivo.endswith(".csv") else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                                key=f"download_{Path(archivo).name}"
+                                file_name=artefacto.name,
+                                mime=artefacto.mime,
+                                key=f"download_{turno}_{artefacto.id}"
                             )
                 
                 # Agregar respuesta al historial
                 st.session_state.messages.append({
                     "role": "assistant",
                     "content": respuesta,
-                    "images": imagenes
+                    "images": [a.path for a in graficos]
                 })
-                
+            
             except Exception as e:
                 error_msg = f"❌ Error: {str(e)}"
+                estado.update(label="❌ Error", state="error")
                 message_placeholder.error(error_msg)
                 st.session_state.messages.append({
                     "role": "assistant",
                     "content": error_msg
                 })
+    
+    # Footer
+    st.divider()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.markdown("**📊 Total de mensajes:** " + str(len(st.session_state.messages)))
+    with col2:
+        st.markdown("**🤖 Modelo:** Amazon Nova-lite")
+    with col3:
+        st.markdown("**🔗 Framework:** Strands + Bedrock")
 
-# Footer
-st.divider()
-col1, col2, col3 = st.columns(3)
-with col1:
-    st.markdown("**📊 Total de mensajes:** " + str(len(st.session_state.messages)))
-with col2:
-    st.markdown("**🤖 Modelo:** Amazon Nova-lite")
-with col3:
-    st.markdown("**🔗 Framework:** Strands + Bedrock")
+chat()
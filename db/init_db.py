@@ -1,15 +1,16 @@
-import sqlite3, pandas as pd
+import sys
 from pathlib import Path
 
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))  # permite ejecutar como `python db/init_db.py`
+
+from agent.db import bulk_load, init_db  # noqa: E402
+
 DB = Path(__file__).with_name("ventas.db")
-CSV = Path(__file__).parents[1] / "data" / "ventas_demo.csv"
-DDL = (Path(__file__).with_name("schema.sql")).read_text()
-
-con = sqlite3.connect(DB)
-cur = con.cursor()
-cur.executescript(DDL)
-df = pd.read_csv(CSV)
-cur.execute("DELETE FROM ventas;")
-df.to_sql("ventas", con, if_exists="append", index=False)
-con.commit(); con.close()
-print(f"OK: {len(df)} filas → {DB}")
+CSV = ROOT / "data" / "ventas_demo.csv"
+
+# db/ventas.db (servidor MCP) y data/ventas.sqlite (agente) usan el mismo cargador
+stats = bulk_load(CSV, DB)
+print(f"OK: {stats['rows']} filas → {DB} ({stats['rows_per_s']:,.0f} filas/s)")
+
+print(f"OK: {init_db(force=True)}")
@@ -5,5 +5,6 @@ CREATE TABLE IF NOT EXISTS ventas (
   producto TEXT NOT NULL,
   cantidad INTEGER NOT NULL,
   precio REAL NOT NULL,
-  fecha TEXT NOT NULL
+  fecha TEXT NOT NULL,
+  total REAL NOT NULL
 );
@@ -0,0 +1,238 @@
+# mcp_sqlite_server.py
+"""
+Servidor MCP (stdio) de solo lectura sobre un archivo SQLite. No necesita red
+ni Node: es el servidor que usan configs/mcp.config.json y
+scripts/run_mcp_sqlite.sh.
+
+    python -m mcp_sqlite_server --db db/ventas.db
+
+Tools:
+- read_query(query, format, offset, limit): una consulta SELECT, paginada.
+- read_query_batch(queries, format, limit): varias SELECT en una sola ida y vuelta.
+- list_tables(), describe_table(table).
+
+Las respuestas no repiten los nombres de columna por fila:
+- format="compact"  (por defecto): {"columns": [...], "rows": [[...], ...]}
+- format="columnar":                {"columns": [...], "data": {"col": [...], ...}}
+- format="records": lista de dicts, como @executeautomation/database-server.
+Cada página trae "offset", "next_offset" (None si no hay más) y "row_count".
+
+Paginación: cuando una página no agota el resultado, el cursor queda abierto
+en el servidor bajo (consulta, next_offset). Si la siguiente llamada pide
+justo esa página, sigue leyendo desde ahí, así que cada página cuesta O(limit)
+en lugar de volver a correr la consulta y saltar `offset` filas. Un offset
+arbitrario (o un cursor vencido) reabre la consulta. Como mucho quedan
+MCP_MAX_CURSORS cursores abiertos, cada uno por MCP_CURSOR_TTL segundos
+(mantienen una transacción de lectura, así que las páginas son coherentes).
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+try:  # mcp >= 2
+    from mcp.server.mcpserver import MCPServer as _Server
+    from mcp.server.mcpserver.exceptions import ToolError
+except ImportError:  # mcp 1.x
+    from mcp.server.fastmcp import FastMCP as _Server
+    from mcp.server.fastmcp.exceptions import ToolError
+
+PAGE_ROWS = int(os.getenv("MCP_PAGE_ROWS", "5000"))
+MAX_PAGE_ROWS = int(os.getenv("MCP_MAX_PAGE_ROWS", "50000"))
+MAX_BATCH = int(os.getenv("MCP_MAX_BATCH", "32"))
+MAX_CURSORS = int(os.getenv("MCP_MAX_CURSORS", "16"))
+CURSOR_TTL = float(os.getenv("MCP_CURSOR_TTL", "300"))
+FORMATS = ("compact", "columnar", "records")
+
+_SELECT_RE = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+
+DB_PATH = Path(os.getenv("MCP_SQLITE_DB", "db/ventas.db"))
+_local = threading.local()
+
+server = _Server("sqlite")
+
+
+def _connect() -> sqlite3.Connection:
+    """Conexión de solo lectura por hilo (las tools corren en hilos del pool)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != DB_PATH:
+        conn = sqlite3.connect(f"file:{DB_PATH.resolve()}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+        _local.conn, _local.path = conn, DB_PATH
+    return conn
+
+
+def _value(v: Any) -> Any:
+    return v.hex() if isinstance(v, (bytes, bytearray, memoryview)) else v
+
+
+class _Cursor(NamedTuple):
+    conn: sqlite3.Connection
+    cur: sqlite3.Cursor
+    cols: List[str]
+    head: List[tuple]  # fila ya leída para saber si había otra página
+    expires: float
+
+
+_cursors: "OrderedDict[Tuple[str, int], _Cursor]" = OrderedDict()
+_cursors_lock = threading.Lock()
+
+
+def _close(c: _Cursor) -> None:
+    c.cur.close()
+    c.conn.close()
+
+
+def _take(key: Tuple[str, int]) -> Optional[_Cursor]:
+    """Saca el cursor estacionado en `key` (y cierra los vencidos)."""
+    now = time.monotonic()
+    with _cursors_lock:
+        expired = [k for k, c in _cursors.items() if c.expires <= now]
+        stale = [_cursors.pop(k) for k in expired]
+        found = _cursors.pop(key, None)
+    for c in stale:
+        _close(c)
+    return found
+
+
+def _park(key: Tuple[str, int], c: _Cursor) -> None:
+    """Deja `c` abierto para la página que empieza en key[1] (LRU de MAX_CURSORS)."""
+    evicted = []
+    with _cursors_lock:
+        old = _cursors.pop(key, None)
+        if old is not None:
+            evicted.append(old)
+        _cursors[key] = c
+        while len(_cursors) > MAX_CURSORS:
+            evicted.append(_cursors.popitem(last=False)[1])
+    for old in evicted:
+        _close(old)
+
+
+def _open(sql: str, offset: int) -> _Cursor:
+    """Corre `sql` en una conexión propia (el cursor puede estacionarse) y salta `offset` filas."""
+    conn = sqlite3.connect(f"file:{DB_PATH.resolve()}?mode=ro", uri=True, check_same_thread=False)
+    try:
+        conn.execute("PRAGMA query_only = ON")
+        cur = conn.execute(sql)
+        deque(islice(cur, offset), maxlen=0)
+    except BaseException:
+        conn.close()
+        raise
+    return _Cursor(conn, cur, [d[0] for d in cur.description or ()], [], 0.0)
+
+
+def _page(query: str, fmt: str, offset: int, limit: int) -> Any:
+    if not _SELECT_RE.match(query):
+        raise ValueError("Solo se permiten consultas SELECT.")
+    if fmt not in FORMATS:
+        raise ValueError(f"format debe ser uno de {FORMATS}")
+    offset = max(0, int(offset))
+    limit = max(1, min(int(limit), MAX_PAGE_ROWS))
+
+    sql = query.strip().rstrip(";")
+    cursor = _take((sql, offset)) or _open(sql, offset)
+    cols = cursor.cols
+    try:
+        # Se lee una fila de más para saber si hay otra página
+        rows = cursor.head + cursor.cur.fetchmany(limit + 1 - len(cursor.head))
+    except BaseException:
+        _close(cursor)
+        raise
+    more = len(rows) > limit
+    if more:
+        _park((sql, offset + limit), cursor._replace(head=rows[limit:], expires=time.monotonic() + CURSOR_TTL))
+    else:
+        _close(cursor)
+    rows = [tuple(_value(v) for v in r) for r in rows[:limit]]
+
+    if fmt == "records":
+        return [dict(zip(cols, r)) for r in rows]
+    out: Dict[str, Any] = {"columns": cols}
+    if fmt == "columnar":
+        out["data"] = {c: [r[i] for r in rows] for i, c in enumerate(cols)}
+    else:
+        out["rows"] = [list(r) for r in rows]
+    out.update(offset=offset, next_offset=offset + limit if more else None, row_count=len(rows))
+    return out
+
+
+@server.tool()
+async def read_query(query: str, format: str = "compact", offset: int = 0, limit: int = PAGE_ROWS) -> Any:
+    """Ejecuta una consulta SELECT y devuelve una página de resultados (ver format/offset/limit)."""
+    try:
+        return await asyncio.to_thread(_page, query, format, offset, limit)
+    except (sqlite3.Error, ValueError) as e:
+        raise ToolError(str(e)) from e
+
+
+@server.tool()
+async def read_query_batch(queries: List[str], format: str = "compact", limit: int = PAGE_ROWS) -> Dict[str, Any]:
+    """
+    Ejecuta varias consultas SELECT en una sola llamada. Devuelve
+    {"results": [...]} en el mismo orden; una consulta que falla trae
+    {"error": "..."} en su posición sin afectar a las demás.
+    """
+    if len(queries) > MAX_BATCH:
+        raise ToolError(f"Máximo {MAX_BATCH} consultas por lote.")
+
+    def run_all() -> List[Any]:
+        results = []
+        for q in queries:
+            try:
+                results.append(_page(q, format, 0, limit))
+            except (sqlite3.Error, ValueError) as e:
+                results.append({"error": str(e)})
+        return results
+
+    return {"results": await asyncio.to_thread(run_all)}
+
+
+@server.tool()
+async def list_tables() -> List[Dict[str, str]]:
+    """Tablas de la base de datos."""
+    def run() -> List[Dict[str, str]]:
+        cur = _connect().execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )
+        return [{"name": r[0]} for r in cur]
+    return await asyncio.to_thread(run)
+
+
+@server.tool()
+async def describe_table(table: str) -> List[Dict[str, Any]]:
+    """Columnas de una tabla: nombre, tipo, not null, default y si es parte de la PK."""
+    def run() -> List[Dict[str, Any]]:
+        conn = _connect()
+        names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if table not in names:
+            raise ToolError(f"La tabla '{table}' no existe.")
+        cur = conn.execute(f'PRAGMA table_info("{table}")')
+        return [
+            {"name": r[1], "type": r[2], "notnull": bool(r[3]), "default": r[4], "pk": bool(r[5])}
+            for r in cur
+        ]
+    return await asyncio.to_thread(run)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    global DB_PATH
+    ap = argparse.ArgumentParser(description="Servidor MCP de solo lectura sobre SQLite")
+    ap.add_argument("--db", default=str(DB_PATH), help="archivo SQLite (por defecto %(default)s)")
+    args = ap.parse_args(argv)
+    DB_PATH = Path(args.db)
+    if not DB_PATH.exists():
+        ap.error(f"no existe {DB_PATH} (créala con: python db/init_db.py)")
+    server.run()
+
+
+if __name__ == "__main__":
+    main()
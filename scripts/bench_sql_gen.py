@@ -0,0 +1,124 @@
+# scripts/bench_sql_gen.py
+"""
+Micro-benchmark del motor de reglas de agent/sql_gen.py.
+
+Mide el costo por pregunta con la tabla actual y con 10x reglas (reglas
+sintéticas con vocabulario propio insertadas antes del fallback), comparando:
+  - motor compilado: un escaneo de literales + índice literal → reglas
+  - cadena lineal: cada regla evalúa sus subcadenas y regex en orden
+y el costo de punta a punta de generate_sql_rule (normalización, elección de
+regla, extracción de entidades en una pasada y armado del SQL) con cada tabla.
+
+Uso:
+    python scripts/bench_sql_gen.py [--factor 10] [--repeat 5]
+"""
+
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import agent.sql_gen as sql_gen  # noqa: E402
+from agent.sql_gen import (  # noqa: E402
+    RULES, All, Any, Always, Has, Not, Re, Rule, RuleEngine, _extract_entities, _norm,
+    generate_sql_rule,
+)
+
+QUESTIONS = [
+    "¿Cuáles son los 5 productos más vendidos en Medellín?",
+    "¿Quién fue el vendedor con más ventas en Bogotá?",
+    "Muéstrame un gráfico de barras con las ventas por sede",
+    "Guarda las ventas por vendedor en un archivo CSV",
+    "¿Cuál es el ticket promedio?",
+    "Muéstrame un gráfico de líneas con las ventas por mes",
+    "participación por sede en enero 2024",
+    "top 3 vendedores por unidades en Cali",
+    "ventas entre 2024-01-01 y 2024-03-31 del producto café",
+    "hola, qué puedes hacer?",
+]
+
+_METRICS = ["margen", "devoluciones", "descuento", "inventario", "clientes", "visitas", "pedidos", "cartera", "stock"]
+
+
+def synthetic_rules(count: int):
+    """Reglas con la misma forma que las reales pero vocabulario propio."""
+    out = []
+    for i in range(count):
+        word = f"{_METRICS[i % len(_METRICS)]}{i}"
+        out.append(Rule(
+            f"sintetica_{i}",
+            All(Has(word), Any(Re(rf"\b{word}\b.*\bpor\s+(sede|mes)\b", word), Has(f"{word} total"))),
+            "SELECT sede, COUNT(*) AS n FROM {T} {where} GROUP BY sede;",
+            "auto",
+        ))
+    return out
+
+
+def naive_eval(cond, tn: str) -> bool:
+    """Evaluación directa del árbol de condiciones, como la cadena if/elif original."""
+    if isinstance(cond, Has):
+        return any(lit in tn for lit in cond.lits)
+    if isinstance(cond, Re):
+        return re.search(cond.rx.pattern, tn) is not None
+    if isinstance(cond, All):
+        return all(naive_eval(c, tn) for c in cond.conds)
+    if isinstance(cond, Any):
+        return any(naive_eval(c, tn) for c in cond.conds)
+    if isinstance(cond, Not):
+        return not naive_eval(cond.cond, tn)
+    if isinstance(cond, Always):
+        return True
+    raise TypeError(cond)
+
+
+def naive_match(rules, tn: str) -> int:
+    for i, r in enumerate(rules):
+        if naive_eval(r.when, tn):
+            return i
+    raise LookupError
+
+
+def per_question_us(fn, questions, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(200):
+            for q in questions:
+                fn(q)
+        best = min(best, time.perf_counter() - t0)
+    return best / (200 * len(questions)) * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark del motor de reglas NL → SQL")
+    ap.add_argument("--factor", type=int, default=10, help="multiplicador de la cantidad de reglas")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    questions = [_norm(q.strip()) for q in QUESTIONS]
+    real = list(RULES)
+    big = real[:-1] + synthetic_rules(len(real) * (args.factor - 1)) + real[-1:]
+
+    print(f"{'reglas':>7} | {'compilado µs':>12} | {'lineal µs':>9} | {'generate_sql_rule µs':>20}")
+    for rules in (real, big):
+        engine = RuleEngine(rules)
+        for q in questions:
+            assert engine.match(q)[0] == naive_match(rules, q), q
+        compiled = per_question_us(engine.match, questions, args.repeat)
+        naive = per_question_us(lambda q: naive_match(rules, q), questions, args.repeat)
+        # De punta a punta con esta tabla: generate_sql_rule() usa sql_gen.ENGINE
+        default, sql_gen.ENGINE = sql_gen.ENGINE, engine
+        try:
+            full = per_question_us(generate_sql_rule, QUESTIONS, args.repeat)
+        finally:
+            sql_gen.ENGINE = default
+        print(f"{len(rules):>7} | {compiled:>12.1f} | {naive:>9.1f} | {full:>20.1f}")
+
+    entities = per_question_us(_extract_entities, questions, args.repeat)
+    print(f"\nextracción de entidades (una pasada por los tokens): {entities:.1f} µs/pregunta")
+
+if __name__ == "__main__":
+    main()
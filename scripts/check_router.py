@@ -0,0 +1,57 @@
+# scripts/check_router.py
+"""
+Chequeos de regresión del router híbrido (agent/router.py).
+
+Cada caso indica si la pregunta debe responderse localmente y, si es así, qué
+parámetros deben llegar a la consulta. Sirven para detectar reglas que
+responden con confianza alta descartando parte de la pregunta (p.ej. un
+filtro de fechas que generate_sql no entiende).
+
+Uso:
+    python scripts/check_router.py
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from agent.router import score  # noqa: E402
+
+# (pregunta, ¿local?, params esperados o None si no importan)
+CASES = [
+    # Fechas que _extract_entities no entiende: el filtro se perdería → modelo
+    ("ventas totales por sede de los ultimos 30 dias", False, None),
+    ("ventas totales por sede en diciembre", False, None),
+    ("top 3 vendedores entre enero y marzo", False, None),
+    ("ventas de este mes", False, None),
+    ("top 5 productos de la semana pasada", False, None),
+    # Fechas que sí llegan al WHERE
+    ("ventas totales por sede en diciembre 2024", True, ("2024-12-01", "2024-12-31")),
+    ("ventas totales por sede en 2024", True, ("2024-01-01", "2024-12-31")),
+    ("ventas totales por sede entre 2024-01-01 y 2024-03-31", True, ("2024-01-01", "2024-03-31")),
+    # Período de agrupación, sin filtro
+    ("Ventas por mes en gráfico de líneas", True, ()),
+    ("Ventas por día", True, ()),
+    # Sin fechas
+    ("ventas totales por sede", True, ()),
+    ("¿Cuáles son los 5 productos más vendidos en Medellín?", True, ("Medellín",)),
+]
+
+
+def main() -> int:
+    failures = 0
+    for question, local, params in CASES:
+        d = score(question)
+        ok = d.local == local and (params is None or d.params == params)
+        if not ok:
+            failures += 1
+        mark = "✅" if ok else "❌"
+        print(f"{mark} {question!r}: local={d.local} ({d.confidence}) regla={d.rule} "
+              f"params={d.params} sin_explicar={d.unknown}")
+    print(f"\n{len(CASES) - failures}/{len(CASES)} casos correctos")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
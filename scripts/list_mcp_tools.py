@@ -1,11 +1,13 @@
 # scripts/list_mcp_tools.py
 import asyncio
+import sys
 from contextlib import AsyncExitStack
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
-MCP_COMMAND = "npx"
-MCP_ARGS = ["-y", "@executeautomation/database-server", "db/ventas.db"]  # <-- importante
+# Servidor del repo (mcp_sqlite_server.py); ejecutar desde la raíz del proyecto
+MCP_COMMAND = sys.executable
+MCP_ARGS = ["-m", "mcp_sqlite_server", "--db", "db/ventas.db"]
 
 async def main():
     async with AsyncExitStack() as stack:
@@ -1,4 +1,6 @@
 #!/usr/bin/env bash
+# Servidor MCP de solo lectura sobre db/ventas.db (mcp_sqlite_server.py, sin red)
 set -euo pipefail
-source ../.venv/bin/activate
-python -m mcp_sqlite_server --db ../db/ventas.db
+cd "$(dirname "$0")/.."
+if [ -f .venv/bin/activate ]; then source .venv/bin/activate; fi
+exec python -m mcp_sqlite_server --db db/ventas.db "$@"
@@ -0,0 +1,109 @@
+# scripts/startup_budget.py
+"""
+Presupuesto de arranque del CLI.
+
+Mide con `python -X importtime` lo que cuesta importar los módulos de entrada
+y el tiempo hasta el primer prompt de `python -m agent.app`, y falla (exit 1)
+si se pasa del presupuesto o si alguno carga un stack pesado que debe ser
+perezoso (Strands/boto3, pandas, matplotlib).
+
+Uso (desde la raíz del proyecto):
+    python scripts/startup_budget.py
+    python scripts/startup_budget.py --budget-ms 250 --top 15
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Módulo de entrada → presupuesto de importación (ms)
+BUDGETS_MS = {
+    "agent.app": 150,
+    "agent.bedrock_agent": 150,
+    "agent.outputs": 50,
+}
+# Tiempo hasta el prompt de `python -m agent.app` (incluye arrancar el intérprete)
+PROMPT_BUDGET_MS = 600
+
+# No deben cargarse al importar los módulos de entrada
+LAZY_STACKS = ("strands", "boto3", "botocore", "pandas", "matplotlib", "openpyxl")
+
+_LINE_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def importtime(module: str):
+    """[(self_us, cumulative_us, depth, nombre)] de `python -X importtime -c 'import module'`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"❌ No se pudo importar {module}:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            rows.append((int(m.group(1)), int(m.group(2)), len(m.group(3)), m.group(4)))
+    # Lo que importa el arranque del intérprete (site) no cuenta
+    site = max((i for i, r in enumerate(rows) if r[3] == "site"), default=-1)
+    return rows[site + 1:]
+
+
+def time_to_prompt() -> float:
+    """Segundos desde lanzar `python -m agent.app` hasta que muestra el prompt."""
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "agent.app"], cwd=ROOT,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        env={**os.environ, "LEGACY_MODE": "false"},
+    )
+    buf = b""
+    while b"Ingresa tu consulta" not in buf:
+        chunk = proc.stdout.read1(4096)
+        if not chunk:
+            break
+        buf += chunk
+    elapsed = time.perf_counter() - t0
+    proc.stdin.close()  # EOF → el CLI sale
+    proc.wait(timeout=30)
+    return elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Presupuesto de tiempo de arranque")
+    ap.add_argument("--budget-ms", type=float, help="presupuesto para todos los módulos (reemplaza BUDGETS_MS)")
+    ap.add_argument("--prompt-budget-ms", type=float, default=PROMPT_BUDGET_MS)
+    ap.add_argument("--top", type=int, default=10, help="módulos más costosos a listar")
+    args = ap.parse_args()
+
+    failed = False
+    for module, budget in BUDGETS_MS.items():
+        budget = args.budget_ms or budget
+        rows = importtime(module)
+        # El propio módulo puede ya no ser el último si algo se importa después
+        total_ms = next((cum for _, cum, _, name in rows if name == module), 0) / 1000
+        heavy = sorted({name.split(".")[0] for *_, name in rows} & set(LAZY_STACKS))
+        ok = total_ms <= budget and not heavy
+        failed |= not ok
+        print(f"{'✅' if ok else '❌'} import {module}: {total_ms:.0f} ms (presupuesto {budget:.0f} ms)")
+        if heavy:
+            print(f"   ⚠️ carga stacks que deben ser perezosos: {', '.join(heavy)}")
+        for self_us, cum_us, _, name in sorted(rows, reverse=True)[:args.top]:
+            print(f"   {self_us / 1000:7.1f} ms propio  {cum_us / 1000:7.1f} ms acumulado  {name}")
+
+    prompt_ms = time_to_prompt() * 1000
+    ok = prompt_ms <= args.prompt_budget_ms
+    failed |= not ok
+    print(f"{'✅' if ok else '❌'} prompt de agent.app en {prompt_ms:.0f} ms (presupuesto {args.prompt_budget_ms:.0f} ms)")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -149,29 +149,26 @@ def check_database():
         return False
 
 def check_mcp_server():
-    """Verifica que npx esté disponible para el servidor MCP"""
-    print("\n🔍 Verificando servidor MCP (Node.js)...")
+    """Verifica que el servidor MCP del repo (mcp_sqlite_server.py) se pueda importar"""
+    print("\n🔍 Verificando servidor MCP (mcp_sqlite_server)...")
     
     import subprocess
     try:
         result = subprocess.run(
-            ['npx', '--version'],
+            [sys.executable, '-m', 'mcp_sqlite_server', '--help'],
             capture_output=True,
             text=True,
-            timeout=5
+            timeout=30
         )
         if result.returncode == 0:
-            print(f"   ✅ npx disponible (v{result.stdout.strip()})")
+            print("   ✅ mcp_sqlite_server disponible (no requiere Node.js)")
             return True
         else:
-            print("   ❌ npx no funciona correctamente")
+            print("   ❌ mcp_sqlite_server no arranca:")
+            print(f"      {result.stderr.strip().splitlines()[-1] if result.stderr.strip() else ''}")
             return False
-    except FileNotFoundError:
-        print("   ❌ npx no está instalado")
-        print("      Instala Node.js: sudo apt install nodejs npm")
-        return False
     except Exception as e:
-        print(f"   ⚠️  Error al verificar npx: {str(e)}")
+        print(f"   ⚠️  Error al verificar el servidor MCP: {str(e)}")
         return False
 
 def run_quick_test():